@@ -1,6 +1,33 @@
 from django.contrib import admin
-from .models import ScanLog, PingLog, DeviceStatus
+from .models import ScanLog, PingLog, DeviceStatus, PingSegment, DeviceStatusTransition, ScanAgent, ScanSession, FleetCommand, LatencyRollup, FleetSummaryCount
+from .snapshot import publish_status_change
+from .events import publish_device_changes
+
+
+class DeviceStatusAdmin(admin.ModelAdmin):
+    """Publish admin edits of devices, so status polls revalidate and push streams get them."""
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        publish_status_change()
+        publish_device_changes([obj.mac_address])
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        publish_status_change()
+
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        publish_status_change()
+
 
 admin.site.register(ScanLog)
 admin.site.register(PingLog)
-admin.site.register(DeviceStatus)
\ No newline at end of file
+admin.site.register(DeviceStatus, DeviceStatusAdmin)
+admin.site.register(PingSegment)
+admin.site.register(DeviceStatusTransition)
+admin.site.register(ScanAgent)
+admin.site.register(ScanSession)
+admin.site.register(FleetCommand)
+admin.site.register(LatencyRollup)
+admin.site.register(FleetSummaryCount)
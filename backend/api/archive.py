@@ -0,0 +1,153 @@
+# backend/api/archive.py
+from bisect import bisect_left, bisect_right
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Min, Q
+from django.utils import timezone
+
+from .models import ScanLog, PingLog, PingSegment
+from .pagination import InvalidQueryParam, decode_cursor, encode_cursor
+
+ARCHIVE_HOURS = 24
+ARCHIVE_SEGMENT_LENGTH = 20
+# Keep every DELETE ... WHERE id IN (...) under SQLite's 999 bound parameter limit
+ARCHIVE_DELETE_BATCH = 900
+
+
+def distinct_in_order(values):
+    """Return the distinct values of an iterable in order of first appearance."""
+    return list(dict.fromkeys(values))
+
+
+def build_segment(mac_address, rows, scan_ids):
+    """Summarize consecutive (id, scan_id, timestamp, ip, location, version) ping rows."""
+    first_scan, last_scan = rows[0][1], rows[-1][1]
+    return PingSegment(
+        mac_address=mac_address,
+        first_seen=rows[0][2],
+        last_seen=rows[-1][2],
+        ping_count=len(rows),
+        scan_count=bisect_right(scan_ids, last_scan) - bisect_left(scan_ids, first_scan),
+        ip_addresses=distinct_in_order(row[3] for row in rows),
+        locations=distinct_in_order(row[4] for row in rows),
+        versions=distinct_in_order(row[5] for row in rows),
+    )
+
+
+def archive_pings(hours=ARCHIVE_HOURS, segment_length=ARCHIVE_SEGMENT_LENGTH, now=None):
+    """
+    Compact PingLog rows older than `hours` into per-device PingSegments.
+
+    Each device's old pings are cut into segments of `segment_length` samples (the last
+    one may be shorter). Every batch of segments is written together with the deletion
+    of its raw rows, so an interrupted run never counts a ping twice. The ScanLog rows are
+    kept, so the scan list stays complete, without their pings. Delta scans log no pings
+    but segments of their own, which are left as they are. Returns (pings archived,
+    segments created).
+    """
+    cutoff = (now or timezone.now()) - timedelta(hours=hours)
+    old_pings = PingLog.objects.filter(timestamp__lt=cutoff)
+    # Scans since the oldest raw ping are needed to count the scans inside each segment;
+    # delta scans are counted by their own segments
+    oldest = old_pings.aggregate(oldest=Min('timestamp'))['oldest']
+    scans = ScanLog.objects.filter(timestamp__gte=oldest, timestamp__lt=cutoff) if oldest else ScanLog.objects.none()
+    scans = scans.exclude(kind=ScanLog.DELTA)
+    scan_ids = list(scans.order_by('id').values_list('id', flat=True))
+    batch_rows = max(1, ARCHIVE_DELETE_BATCH // segment_length) * segment_length
+
+    archived = segments_created = 0
+    for mac_address in old_pings.values_list('mac_address', flat=True).distinct().order_by():
+        while True:
+            rows = list(
+                old_pings.filter(mac_address=mac_address)
+                .order_by('timestamp', 'id')
+                .values_list('id', 'scan_id', 'timestamp', 'ip_address', 'location', 'version')[:batch_rows]
+            )
+            if not rows:
+                break
+            segments = [
+                build_segment(mac_address, rows[i:i + segment_length], scan_ids)
+                for i in range(0, len(rows), segment_length)
+            ]
+            with transaction.atomic():
+                PingSegment.objects.bulk_create(segments)
+                PingLog.objects.filter(pk__in=[row[0] for row in rows]).delete()
+            archived += len(rows)
+            segments_created += len(segments)
+
+    return archived, segments_created
+
+
+def ping_entry(ping):
+    """Present a raw PingLog row in the same shape as an archived segment."""
+    return {
+        'source': 'ping',
+        'id': ping.id,
+        'first_seen': ping.timestamp,
+        'last_seen': ping.timestamp,
+        'ping_count': 1,
+        'scan_count': 1,
+        'ip_addresses': [ping.ip_address],
+        'locations': [ping.location],
+        'versions': [ping.version],
+        'open': False,
+    }
+
+
+def segment_entry(segment):
+    return {
+        'source': 'segment',
+        'id': segment.id,
+        'first_seen': segment.first_seen,
+        'last_seen': segment.last_seen,
+        'ping_count': segment.ping_count,
+        'scan_count': segment.scan_count,
+        'ip_addresses': segment.ip_addresses,
+        'locations': segment.locations,
+        'versions': segment.versions,
+        'open': segment.session_id is not None,
+    }
+
+
+def device_history(mac_address, since=None, until=None, cursor=None, limit=100):
+    """
+    Return one page of a device's history across raw pings and archived segments.
+
+    Entries are ordered newest first by (last_seen, source, id), with raw pings ahead
+    of segments that end at the same instant. An `open` segment is one a delta session
+    still extends: the device has been up since its first_seen. Returns (entries,
+    next_cursor).
+    """
+    pings = PingLog.objects.filter(mac_address=mac_address)
+    segments = PingSegment.objects.filter(mac_address=mac_address)
+    if since:
+        pings = pings.filter(timestamp__gte=since)
+        segments = segments.filter(last_seen__gte=since)
+    if until:
+        pings = pings.filter(timestamp__lt=until)
+        segments = segments.filter(last_seen__lt=until)
+
+    if cursor:
+        values = decode_cursor(cursor)
+        if len(values) != 3 or values[1] not in ('ping', 'segment'):
+            raise InvalidQueryParam("Invalid cursor")
+        last_seen, source, pk = values
+        if source == 'ping':
+            pings = pings.filter(Q(timestamp__lt=last_seen) | Q(timestamp=last_seen, id__lt=pk))
+            segments = segments.filter(last_seen__lte=last_seen)
+        else:
+            pings = pings.filter(timestamp__lt=last_seen)
+            segments = segments.filter(Q(last_seen__lt=last_seen) | Q(last_seen=last_seen, id__lt=pk))
+
+    entries = [ping_entry(ping) for ping in pings.order_by('-timestamp', '-id')[:limit + 1]]
+    entries += [segment_entry(segment) for segment in segments.order_by('-last_seen', '-id')[:limit + 1]]
+    # Pings sort ahead of segments ending at the same instant
+    entries.sort(key=lambda entry: (entry['last_seen'], entry['source'] == 'ping', entry['id']), reverse=True)
+
+    next_cursor = None
+    if len(entries) > limit:
+        entries = entries[:limit]
+        last = entries[-1]
+        next_cursor = encode_cursor([last['last_seen'], last['source'], last['id']])
+    return entries, next_cursor
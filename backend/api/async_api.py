@@ -0,0 +1,95 @@
+# backend/api/async_api.py
+import inspect
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+# Renderers that only encode the data. The browsable API also reads request.user, whose
+# session lookup is a blocking query, so it always renders in a thread
+INLINE_FORMATS = {'json', 'columnar', 'msgpack'}
+
+
+def renders_inline(data):
+    """Whether a body is small enough to encode on the event loop: none, or an object of scalars."""
+    return data is None or (isinstance(data, dict) and not any(isinstance(v, (dict, list)) for v in data.values()))
+
+
+class AsyncAPIView(APIView):
+    """
+    APIView whose handlers are coroutines, so under ASGI they run on the event loop instead
+    of each request holding a thread. Handlers keep database work off the loop, through
+    the async ORM or sync_to_async().
+
+    Requests are parsed, negotiated and checked like any APIView, except that the user is
+    resolved lazily: loading the session is a blocking query, and these views are public.
+    Responses are rendered here, in a thread unless renders_inline() with one of the
+    INLINE_FORMATS, and returned as a plain HttpResponse, since Django would otherwise render a Response with another
+    thread hop.
+    """
+
+    def perform_authentication(self, request):
+        pass
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            self.initial(request, *args, **kwargs)
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+            response = handler(request, *args, **kwargs)
+            # APIView's own handlers, for OPTIONS and unknown methods, are sync
+            if inspect.isawaitable(response):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return await self.render_response(self.response)
+
+    async def render_response(self, response):
+        if not isinstance(response, Response):
+            return response
+        renderer = getattr(response, 'accepted_renderer', None)
+        if renderer is not None and renderer.format in INLINE_FORMATS and renders_inline(response.data):
+            response.render()
+        else:
+            await sync_to_async(response.render)()
+        rendered = HttpResponse(response.content, status=response.status_code, headers=dict(response.items()))
+        rendered.cookies = response.cookies
+        # Kept for code reading response.data, such as the tests
+        rendered.data = response.data
+        return rendered
+
+
+def async_api_view(http_method_names):
+    """
+    @api_view for `async def` views. Stacks with DRF's @renderer_classes and
+    @parser_classes decorators like @api_view does.
+    """
+
+    def decorator(func):
+        view_class = type(func.__name__, (AsyncAPIView,), {
+            '__doc__': func.__doc__,
+            '__module__': func.__module__,
+            'http_method_names': [method.lower() for method in {*http_method_names, 'options'}],
+            'renderer_classes': getattr(func, 'renderer_classes', APIView.renderer_classes),
+            'parser_classes': getattr(func, 'parser_classes', APIView.parser_classes),
+        })
+
+        async def handler(self, *args, **kwargs):
+            return await func(*args, **kwargs)
+
+        for method in http_method_names:
+            setattr(view_class, method.lower(), handler)
+        return view_class.as_view()
+
+    return decorator
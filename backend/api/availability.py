@@ -0,0 +1,112 @@
+# backend/api/availability.py
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db.models import OuterRef, Subquery
+
+from .models import DeviceStatus, DeviceStatusTransition
+
+
+def summarize_transitions(state, events, since, until):
+    """
+    Walk one device's up/down events inside [since, until).
+
+    `state` is the device's is_up at `since` (None if it was not known yet) and `events`
+    its (is_up, timestamp) transitions in order. Time before the first known state is
+    not counted as observed.
+    """
+    up = down = longest = timedelta(0)
+    outages = failures = 0
+    cursor = down_start = since
+    if state is False:
+        outages += 1
+
+    for is_up, timestamp in events:
+        if is_up == state:
+            continue
+        if state is True:
+            up += timestamp - cursor
+        elif state is False:
+            down += timestamp - cursor
+            longest = max(longest, timestamp - down_start)
+        if not is_up:
+            outages += 1
+            down_start = timestamp
+            if state is True:
+                failures += 1
+        state, cursor = is_up, timestamp
+
+    if state is True:
+        up += until - cursor
+    elif state is False:
+        down += until - cursor
+        longest = max(longest, until - down_start)
+
+    return {'up': up, 'down': down, 'outages': outages, 'failures': failures, 'longest': longest}
+
+
+def format_stats(stats):
+    """Turn accumulated timedeltas into the seconds/percent figures returned by the API."""
+    observed = stats['up'] + stats['down']
+    return {
+        'observed_seconds': observed.total_seconds(),
+        'uptime_seconds': stats['up'].total_seconds(),
+        'uptime_percent': 100 * stats['up'] / observed if observed else None,
+        'outage_count': stats['outages'],
+        'mtbf_seconds': stats['up'].total_seconds() / stats['failures'] if stats['failures'] else None,
+        'longest_outage_seconds': stats['longest'].total_seconds(),
+    }
+
+
+def availability(since, until, mac_address=None, location=None, group_by_location=False):
+    """
+    Compute uptime %, outage count, MTBF and longest outage per device (or per location)
+    over [since, until) from DeviceStatusTransition rows only.
+
+    Costs two queries: the devices with their state at `since`, and the transitions
+    inside the window.
+    """
+    state_at_since = DeviceStatusTransition.objects.filter(
+        mac_address=OuterRef('mac_address'), timestamp__lt=since,
+    ).order_by('-timestamp', '-id').values('is_up')[:1]
+    devices = DeviceStatus.objects.all()
+    if mac_address:
+        devices = devices.filter(mac_address=mac_address)
+    if location is not None:
+        devices = devices.filter(location=location)
+
+    transitions = DeviceStatusTransition.objects.filter(timestamp__gte=since, timestamp__lt=until)
+    if mac_address or location is not None:
+        transitions = transitions.filter(mac_address__in=devices.values('mac_address'))
+    events = defaultdict(list)
+    for mac, is_up, timestamp in transitions.order_by('timestamp', 'id').values_list('mac_address', 'is_up', 'timestamp'):
+        events[mac].append((is_up, timestamp))
+
+    results = []
+    rows = devices.annotate(state_at_since=Subquery(state_at_since)).order_by('mac_address')
+    for mac, device_location, state in rows.values_list('mac_address', 'location', 'state_at_since'):
+        stats = summarize_transitions(state, events[mac], since, until)
+        results.append({'mac_address': mac, 'location': device_location, **stats})
+
+    if not group_by_location:
+        return [
+            {'mac_address': row['mac_address'], 'location': row['location'], **format_stats(row)}
+            for row in results
+        ]
+
+    groups = {}
+    for row in results:
+        group = groups.setdefault(row['location'], {
+            'up': timedelta(0), 'down': timedelta(0), 'outages': 0, 'failures': 0, 'longest': timedelta(0),
+            'device_count': 0,
+        })
+        group['up'] += row['up']
+        group['down'] += row['down']
+        group['outages'] += row['outages']
+        group['failures'] += row['failures']
+        group['longest'] = max(group['longest'], row['longest'])
+        group['device_count'] += 1
+    return [
+        {'location': name, 'device_count': group['device_count'], **format_stats(group)}
+        for name, group in sorted(groups.items())
+    ]
@@ -0,0 +1,108 @@
+# backend/api/batch.py
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import OperationalError, transaction
+from django.utils import timezone
+
+from .ingest import ingest_scan, normalize_device, parse_scope
+from .latency import normalize_probes
+from .models import ScanReportKey
+from .pagination import parse_timestamp
+
+logger = logging.getLogger(__name__)
+
+# Reports accepted per batch at most
+BATCH_MAX_REPORTS = 100
+REPORT_KEY_MAX_LENGTH = 64
+
+
+def parse_batch(data):
+    """
+    Validate a batch upload of {"reports": [{"key", "devices", "scope", "probes",
+    "scanned_at"}, ...]}, oldest report first.
+
+    Returns one dict per report, in order: its parsed fields, or its `error` if it can
+    never be applied. Raises ValueError for a malformed batch or a report without a key.
+    """
+    reports = data.get('reports') if isinstance(data, dict) else None
+    if not isinstance(reports, list) or not all(isinstance(report, dict) for report in reports):
+        raise ValueError("reports must be a list of objects")
+    if len(reports) > BATCH_MAX_REPORTS:
+        raise ValueError(f"a batch holds at most {BATCH_MAX_REPORTS} reports")
+    parsed = []
+    for report in reports:
+        key = report.get('key')
+        if not isinstance(key, str) or not 0 < len(key) <= REPORT_KEY_MAX_LENGTH:
+            raise ValueError(f"every report needs a key of 1 to {REPORT_KEY_MAX_LENGTH} characters")
+        try:
+            parsed.append({'key': key, **parse_batch_report(report)})
+        except ValueError as e:
+            parsed.append({'key': key, 'error': str(e)})
+    return parsed
+
+
+def parse_batch_report(report):
+    devices = report.get('devices', [])
+    if not isinstance(devices, list) or not all(isinstance(device, dict) for device in devices):
+        raise ValueError("devices must be a list of objects")
+    for device in devices:
+        record = normalize_device(device)
+        if not all(isinstance(record[field], str) and record[field] for field in ('mac_address', 'ip_address')):
+            raise ValueError("every device needs a mac_address and an ip_address")
+    agent_id, cidrs = parse_scope(report.get('scope'))
+    scanned_at = report.get('scanned_at')
+    if scanned_at is not None and not isinstance(scanned_at, str):
+        raise ValueError("scanned_at must be an ISO 8601 timestamp")
+    return {
+        'devices': devices, 'agent_id': agent_id, 'cidrs': cidrs,
+        'probes': normalize_probes(report.get('probes')),
+        'scanned_at': parse_timestamp('scanned_at', scanned_at),
+    }
+
+
+def apply_batch(reports):
+    """
+    Apply reports from parse_batch() in order in one transaction, each dated by its
+    `scanned_at` (never later than now), and record their keys.
+
+    A report whose key was already applied, in an earlier batch or earlier in this one,
+    is skipped. Each report is applied in its own savepoint, so one that fails is
+    rejected alone; only a locked or unavailable database fails the whole batch, to be
+    resent. Returns a {"key", "status"} result per report, the status being "applied"
+    (with the `scan_id`), "duplicate" or "rejected" (with the `error`). See ingest_scan
+    for what a report older than the devices' state changes.
+    """
+    now = timezone.now()
+    results = []
+    with transaction.atomic():
+        ScanReportKey.objects.filter(received__lt=now - timedelta(days=settings.SCAN_REPORT_KEY_DAYS)).delete()
+        applied = set(ScanReportKey.objects.filter(
+            key__in=[report['key'] for report in reports],
+        ).values_list('key', flat=True))
+        keys = []
+        for report in reports:
+            key = report['key']
+            if key in applied:
+                results.append({'key': key, 'status': 'duplicate'})
+            elif 'error' in report:
+                results.append({'key': key, 'status': 'rejected', 'error': report['error']})
+            else:
+                scanned_at = min(report['scanned_at'] or now, now)
+                try:
+                    with transaction.atomic():
+                        scan = ingest_scan(
+                            report['devices'], report['agent_id'], report['cidrs'], report['probes'], scanned_at,
+                        )
+                except OperationalError:
+                    raise
+                except Exception:
+                    logger.exception("Failed to apply batched scan report %s", key)
+                    results.append({'key': key, 'status': 'rejected', 'error': "report could not be applied"})
+                    continue
+                keys.append(ScanReportKey(key=key, scan=scan, received=now))
+                applied.add(key)
+                results.append({'key': key, 'status': 'applied', 'scan_id': scan.pk})
+        ScanReportKey.objects.bulk_create(keys)
+    return results
@@ -0,0 +1,168 @@
+# backend/api/delta.py
+import hashlib
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .events import publish_device_changes
+from .ingest import (
+    flag_stale_agents, ingest_scan, mark_devices_down, normalize_device, record_agent_report,
+    record_status_changes, upsert_seen_devices,
+)
+from .latency import normalize_probes, record_probes
+from .metrics import ingest_timer
+from .models import ScanLog, DeviceStatus, PingSegment, ScanSession
+
+
+class ResyncRequired(Exception):
+    """Raised when a delta cannot be applied and the scanner must send a full report."""
+
+    def __init__(self, reason, expected_seq=None):
+        super().__init__(reason)
+        self.reason = reason
+        self.expected_seq = expected_seq
+
+
+def device_state(records):
+    """Reduce normalized device records to the {mac: [ip, location, version]} state the digest covers."""
+    return {record['mac_address']: [record['ip_address'], record['location'], record['version']] for record in records}
+
+
+def state_digest(state):
+    """
+    SHA-256 over the sorted "mac|ip|location|version" lines of a device state.
+
+    scripts/network_scanner.py computes the same digest over its own state, so the two
+    sides can tell whether they still agree.
+    """
+    lines = sorted(f"{mac}|{ip}|{location}|{version}" for mac, (ip, location, version) in state.items())
+    return hashlib.sha256("\n".join(lines).encode()).hexdigest()
+
+
+def _device_list(payload, key):
+    value = payload.get(key, [])
+    if not isinstance(value, list) or not all(isinstance(device, dict) for device in value):
+        raise ValueError(f"{key} must be a list of devices")
+    return [normalize_device(device) for device in value]
+
+
+def extend_ping_segments(session, state, touched, now):
+    """
+    Record a delta scan in the ping history of the devices of `state`, its session's state
+    after the delta, `touched` being the MACs it added, changed or removed.
+
+    Each device has one open PingSegment per session, "still up since" its first_seen.
+    Unchanged devices cost no new row: one UPDATE moves the last_seen of all open segments
+    forward. Touched devices get their segment closed, and a new one opened if still
+    present. The first delta after a keyframe, which closes them all, opens one per device.
+    """
+    segments = PingSegment.objects.filter(session=session)
+    if segments.exists():
+        segments.filter(mac_address__in=touched).update(session=None)
+        segments.update(last_seen=now, ping_count=F('ping_count') + 1, scan_count=F('scan_count') + 1)
+        opened = [mac_address for mac_address in touched if mac_address in state]
+    else:
+        opened = list(state)
+    PingSegment.objects.bulk_create([
+        PingSegment(
+            mac_address=mac_address, session=session, first_seen=now, last_seen=now, ping_count=1, scan_count=1,
+            ip_addresses=[state[mac_address][0]], locations=[state[mac_address][1]],
+            versions=[state[mac_address][2]],
+        )
+        for mac_address in opened
+    ])
+
+
+def apply_scan_report(payload, agent_id=None, cidrs=None):
+    """
+    Apply one report of the delta scan protocol and return the acknowledged (seq, digest).
+
+    A report with `full: true` is a keyframe: `devices` lists every device found, it is
+    ingested like a regular scan and replaces the session state. Otherwise the report
+    carries `added`/`changed` device records and `removed` MAC addresses relative to the
+    previous report (all empty for a heartbeat). Its `seq` must follow the last applied
+    one and `digest` must match the state after applying it, or ResyncRequired is raised.
+
+    Only added and changed devices get a DeviceStatus write; unchanged ones stay up.
+    Removed devices go down with last_seen set to the previous report, the last time they
+    were seen up. Ping history is kept the same way, see extend_ping_segments().
+    """
+    seq = payload.get('seq')
+    digest = payload.get('digest')
+    if not isinstance(seq, int) or isinstance(seq, bool) or seq < 0:
+        raise ValueError("seq must be a non-negative integer")
+    if digest is not None and not isinstance(digest, str):
+        raise ValueError("digest must be a string")
+    session_id = agent_id or ''
+    probes = normalize_probes(payload.get('probes'))
+
+    if payload.get('full'):
+        devices = payload.get('devices', [])
+        state = device_state(_device_list(payload, 'devices'))
+        computed = state_digest(state)
+        if digest is not None and digest != computed:
+            raise ValueError("digest does not match the devices of the full report")
+        with transaction.atomic():
+            ingest_scan(devices, agent_id, cidrs, probes)
+            # The keyframe logged a ping per device; the next delta opens new segments
+            PingSegment.objects.filter(session__session_id=session_id).update(session=None)
+            ScanSession.objects.update_or_create(session_id=session_id, defaults={
+                'seq': seq, 'digest': computed, 'devices': state, 'last_report': timezone.now(),
+            })
+        return seq, computed
+
+    if digest is None:
+        raise ValueError("digest is required")
+    added = _device_list(payload, 'added')
+    changed = _device_list(payload, 'changed')
+    removed = payload.get('removed', [])
+    if not isinstance(removed, list) or not all(isinstance(mac, str) for mac in removed):
+        raise ValueError("removed must be a list of MAC addresses")
+
+    now = timezone.now()
+    with ingest_timer('delta', len(added) + len(changed) + len(removed)), transaction.atomic():
+        session = ScanSession.objects.filter(session_id=session_id).first()
+        if session is None:
+            raise ResyncRequired('unknown session')
+        if seq != session.seq + 1:
+            raise ResyncRequired('sequence gap', expected_seq=session.seq + 1)
+        state = dict(session.devices)
+        state.update(device_state(added + changed))
+        for mac_address in removed:
+            state.pop(mac_address, None)
+        if state_digest(state) != digest:
+            raise ResyncRequired('digest mismatch')
+
+        ScanLog.objects.create(agent_id=agent_id or '', kind=ScanLog.DELTA, timestamp=now, reported_devices=len(state))
+        latest = {record['mac_address']: record for record in added + changed}
+        extend_ping_segments(session, state, list(latest) + removed, now)
+        came_up, changed_macs = upsert_seen_devices(latest, now)
+
+        gone = DeviceStatus.objects.filter(Q(is_up=True) | Q(is_stale=True), mac_address__in=removed)
+        gone = list(gone.values_list('mac_address', 'is_up'))
+        went_down = mark_devices_down(gone, now, last_seen=session.last_report)
+
+        # A returning agent's heartbeat clears the stale flag of the devices it still sees
+        stale = list(DeviceStatus.objects.filter(is_stale=True, mac_address__in=list(state))
+                     .values_list('mac_address', flat=True)) if agent_id else []
+        if stale:
+            DeviceStatus.objects.filter(mac_address__in=stale).update(is_stale=False)
+
+        record_status_changes(now, came_up, went_down, touched=bool(latest or gone or stale))
+        publish_device_changes(changed_macs + [mac_address for mac_address, _ in gone] + stale)
+        record_probes(probes, now)
+        if agent_id:
+            record_agent_report(agent_id, cidrs, now)
+
+        session.seq = seq
+        session.last_report = now
+        if latest or removed:
+            session.digest = digest
+            session.devices = state
+            session.save()
+        else:
+            session.save(update_fields=['seq', 'last_report'])
+
+    flag_stale_agents(now)
+    return seq, digest
@@ -0,0 +1,88 @@
+# backend/api/device_query.py
+from ipaddress import ip_network
+
+from django.db.models import Q
+
+from .models import DeviceStatus
+from .pagination import InvalidQueryParam, parse_bool, parse_timestamp
+
+# Fields the status query can sort by; the MAC address breaks ties
+DEVICE_ORDERING_FIELDS = ['mac_address', 'ip_address', 'location', 'version', 'is_up', 'last_seen']
+DEVICE_FIELDS = [field.name for field in DeviceStatus._meta.fields if field.name != 'id']
+# Query params that turn GET /api/devices/statuses/ from the cached full list into a query
+DEVICE_QUERY_PARAMS = {
+    'is_up', 'is_stale', 'location', 'version', 'ip', 'last_seen_since', 'last_seen_until', 'ordering', 'fields',
+    'limit', 'cursor',
+}
+
+
+def ip_q(value):
+    """
+    Match IP addresses inside an IPv4 CIDR such as "10.0.4.0/22", or starting with a
+    plain prefix such as "10.0.".
+
+    Addresses are stored as text, so a CIDR is turned into the dotted prefixes it covers,
+    e.g. "10.0.4.", "10.0.5.", "10.0.6." and "10.0.7." for a /22; never more than 128.
+    Networks longer than /24 match their addresses exactly.
+    """
+    if '/' not in value:
+        return Q(ip_address__startswith=value)
+    try:
+        network = ip_network(value, strict=False)
+    except ValueError:
+        raise InvalidQueryParam(f"Invalid CIDR: {value}")
+    if network.version != 4:
+        raise InvalidQueryParam("ip must be an IPv4 CIDR or an address prefix")
+    if network.prefixlen == 0:
+        return Q(ip_address__contains='.')
+    octets = (network.prefixlen + 7) // 8
+    if octets == 4:
+        # Inside the last octet the addresses themselves are the prefixes
+        return Q(ip_address__in=[str(address) for address in network])
+    condition = Q()
+    for subnet in network.subnets(new_prefix=octets * 8):
+        prefix = '.'.join(str(subnet.network_address).split('.')[:octets]) + '.'
+        condition |= Q(ip_address__startswith=prefix)
+    return condition
+
+
+def query_device_statuses(params):
+    """
+    Build the DeviceStatus query described by the request's query params.
+
+    Returns (queryset, ordering, fields) for paginate() and the serializer. Raises
+    InvalidQueryParam for a malformed parameter.
+    """
+    devices = DeviceStatus.objects.all()
+    for name in ('is_up', 'is_stale'):
+        value = parse_bool(name, params.get(name), default=None)
+        if value is not None:
+            devices = devices.filter(**{name: value})
+    for name in ('location', 'version'):
+        # Repeat the parameter to match any of several values
+        values = params.getlist(name)
+        if values:
+            devices = devices.filter(**{f"{name}__in": values})
+    if params.get('ip'):
+        devices = devices.filter(ip_q(params['ip']))
+    since = parse_timestamp('last_seen_since', params.get('last_seen_since'))
+    until = parse_timestamp('last_seen_until', params.get('last_seen_until'))
+    if since:
+        devices = devices.filter(last_seen__gte=since)
+    if until:
+        devices = devices.filter(last_seen__lt=until)
+
+    sort = params.get('ordering') or 'mac_address'
+    if sort.lstrip('-') not in DEVICE_ORDERING_FIELDS:
+        raise InvalidQueryParam(f"ordering must be one of {', '.join(DEVICE_ORDERING_FIELDS)}, optionally prefixed with '-'")
+    ordering = [sort] if sort.lstrip('-') == 'mac_address' else [sort, '-mac_address' if sort.startswith('-') else 'mac_address']
+
+    fields = DEVICE_FIELDS
+    if params.get('fields'):
+        fields = [name.strip() for name in params['fields'].split(',') if name.strip()]
+        unknown = [name for name in fields if name not in DEVICE_FIELDS]
+        if unknown:
+            raise InvalidQueryParam(f"Unknown fields: {', '.join(unknown)}")
+        # Only load the requested columns, plus the ones the cursor is built from
+        devices = devices.only(*{*fields, *(field.lstrip('-') for field in ordering)})
+    return devices, ordering, fields
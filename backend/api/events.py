@@ -0,0 +1,192 @@
+# backend/api/events.py
+import asyncio
+import json
+import threading
+import uuid
+from collections import deque
+
+from django.db import transaction
+
+from .fastpath import device_status_records
+from .models import DeviceStatus
+from .snapshot import aget_status_snapshot, changed_elsewhere, read_status_version
+
+# Events kept for clients resuming with Last-Event-ID
+EVENT_BUFFER_SIZE = 1000
+# Events a slow client may have queued before it is switched to a fresh snapshot
+SUBSCRIBER_QUEUE_SIZE = 100
+
+# How often an idle stream checks for changes committed by other worker processes
+VERSION_POLL_SECONDS = 2
+KEEPALIVE_SECONDS = 15
+
+RESYNC = object()  # Queued in place of events a subscriber fell too far behind on
+
+
+class Subscriber:
+    """Bounded per-client event queue living on the client's event loop."""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.resync_pending = False
+
+    def offer(self, event):
+        # Runs on self.loop. A full queue means the client cannot keep up: drop what it
+        # has pending and let it catch up from a snapshot instead.
+        if self.resync_pending:
+            return
+        if self.queue.full():
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+            self.resync_pending = True
+        else:
+            self.queue.put_nowait(event)
+
+    async def get(self):
+        item = await self.queue.get()
+        if item is RESYNC:
+            self.resync_pending = False
+        return item
+
+
+class StatusBroadcaster:
+    """
+    In-process fan-out of DeviceStatus changes to push clients.
+
+    Events are (seq, token, records) tuples where seq increases per process and token is
+    the status version published with the change. An epoch chosen at start-up makes
+    sequence numbers from a previous process run unusable for resuming.
+    """
+
+    def __init__(self):
+        self.epoch = uuid.uuid4().hex[:8]
+        self.seq = 0
+        self.buffer = deque(maxlen=EVENT_BUFFER_SIZE)
+        self.subscribers = set()
+        self.lock = threading.Lock()
+
+    def event_id(self, seq):
+        return f"{self.epoch}:{seq}"
+
+    def parse_event_id(self, event_id):
+        """Return the sequence number of an event id from this process, or None."""
+        epoch, _, seq = (event_id or '').partition(':')
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        return int(seq)
+
+    def publish(self, records):
+        """Record one batch of changed device records and hand it to every subscriber."""
+        with self.lock:
+            self.seq += 1
+            event = (self.seq, read_status_version(), records)
+            self.buffer.append(event)
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.loop.call_soon_threadsafe(subscriber.offer, event)
+            except RuntimeError:
+                # The subscriber's loop has been closed
+                self.unsubscribe(subscriber)
+
+    def subscribe(self):
+        """Register a subscriber on the running event loop; returns it and the current seq."""
+        subscriber = Subscriber(asyncio.get_running_loop())
+        with self.lock:
+            self.subscribers.add(subscriber)
+            return subscriber, self.seq
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    def events_since(self, seq):
+        """Return buffered events after `seq`, or None if some of them were already evicted."""
+        with self.lock:
+            if seq == self.seq:
+                return []
+            if seq > self.seq or not self.buffer or self.buffer[0][0] > seq + 1:
+                return None
+            return [event for event in self.buffer if event[0] > seq]
+
+
+broadcaster = StatusBroadcaster()
+
+
+def publish_device_changes(mac_addresses):
+    """Push the current rows of `mac_addresses` to subscribers once the transaction commits."""
+    if not mac_addresses:
+        return
+    devices = DeviceStatus.objects.filter(mac_address__in=list(mac_addresses)).order_by('mac_address')
+    records = device_status_records(devices)
+    transaction.on_commit(lambda: broadcaster.publish(records))
+
+
+def format_event(name, event_id, data):
+    """Encode one Server-Sent Events message."""
+    lines = [f"event: {name}"]
+    if event_id:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {json.dumps(data, separators=(',', ':'))}")
+    return "\n".join(lines) + "\n\n"
+
+
+async def status_event_stream(last_event_id=None):
+    """
+    Yield Server-Sent Events for DeviceStatus changes.
+
+    Starts with a `snapshot` event holding every device, or with the missed `update`
+    events when `last_event_id` can be resumed from this process's buffer. Each `update`
+    carries only the changed records. Changes committed by another worker process are
+    noticed through the shared status version and sent as a fresh snapshot; version
+    bumps of this process, such as a scan only moving last_seen, are not.
+    """
+    subscriber, current_seq = broadcaster.subscribe()
+    try:
+        resume_seq = broadcaster.parse_event_id(last_event_id)
+        replay = broadcaster.events_since(resume_seq) if resume_seq is not None else None
+        if replay is None:
+            token, data = await aget_status_snapshot()
+            sent_seq = current_seq
+            yield format_event('snapshot', broadcaster.event_id(sent_seq), data)
+        else:
+            token, sent_seq = read_status_version(), resume_seq
+            for seq, _, records in replay:
+                sent_seq = seq
+                yield format_event('update', broadcaster.event_id(seq), records)
+
+        idle = 0
+        while True:
+            try:
+                item = await asyncio.wait_for(subscriber.get(), VERSION_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                idle += VERSION_POLL_SECONDS
+                current = read_status_version()
+                if current != token and changed_elsewhere(token, current):
+                    item = RESYNC
+                elif current != token:
+                    # Bumped by this process, whose changes come as events
+                    token = current
+                    continue
+                elif idle >= KEEPALIVE_SECONDS:
+                    idle = 0
+                    yield ": keepalive\n\n"
+                    continue
+                else:
+                    continue
+
+            idle = 0
+            if item is RESYNC:
+                sent_seq = broadcaster.seq
+                token, data = await aget_status_snapshot()
+                yield format_event('snapshot', broadcaster.event_id(sent_seq), data)
+                continue
+            seq, token, records = item
+            if seq <= sent_seq:
+                continue  # Already covered by the snapshot or replay
+            sent_seq = seq
+            yield format_event('update', broadcaster.event_id(seq), records)
+    finally:
+        broadcaster.unsubscribe(subscriber)
@@ -0,0 +1,190 @@
+# backend/api/export.py
+import csv
+import gzip
+import io
+import json
+
+from asgiref.sync import sync_to_async
+from django.db.models import Count, Exists, OuterRef, Q
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .fastpath import format_datetime
+from .models import PingLog, PingSegment, ScanLog
+from .pagination import InvalidQueryParam, keyset_q, parse_timestamp
+
+EXPORT_ROWS = ('pings', 'scans', 'segments')
+EXPORT_FORMATS = ('csv', 'ndjson')
+# The id and the timestamp the rows are ordered by come first
+EXPORT_FIELDS = {
+    'pings': ['id', 'timestamp', 'scan_id', 'mac_address', 'ip_address', 'location', 'version'],
+    'scans': ['id', 'timestamp', 'kind', 'agent_id', 'device_count'],
+    'segments': [
+        'id', 'first_seen', 'last_seen', 'mac_address', 'ping_count', 'scan_count', 'ip_addresses', 'locations',
+        'versions',
+    ],
+}
+DATETIME_FIELDS = ('timestamp', 'first_seen', 'last_seen')
+LIST_FIELDS = ('ip_addresses', 'locations', 'versions')
+# Rows read per keyset query; each query only holds this many rows in memory
+EXPORT_CHUNK_SIZE = 2000
+
+
+def parse_export_cursor(value):
+    """
+    Parse an `after` cursor of the form "<timestamp>,<id>", the timestamp and id of the
+    last row received, so an interrupted export resumes right after it.
+    """
+    if value in (None, ''):
+        return None
+    timestamp, _, row_id = value.rpartition(',')
+    if not timestamp or not row_id.isdigit():
+        raise InvalidQueryParam("after must be '<timestamp>,<id>' of the last row received")
+    return [parse_timestamp('after', timestamp), int(row_id)]
+
+
+def format_export_cursor(key):
+    return f"{format_datetime(key[0], timezone.get_current_timezone())},{key[1]}"
+
+
+class HistoryExport:
+    """
+    PingLog, ScanLog or PingSegment rows of a time range, oldest first, encoded as CSV or
+    NDJSON chunks.
+
+    Rows are read with keyset queries of EXPORT_CHUNK_SIZE rows on (timestamp, id), or
+    (first_seen, id) for segments, so memory stays flat whatever the size of the export
+    and no read transaction is held while a slow client downloads. `cursor` is the key of
+    the last row of the chunk yielded last, `after` the key the export started after.
+    """
+
+    def __init__(self, rows='pings', output_format='csv', since=None, until=None, mac_address=None,
+                 location=None, after=None):
+        if rows not in EXPORT_ROWS:
+            raise InvalidQueryParam("rows must be 'pings', 'scans' or 'segments'")
+        if output_format not in EXPORT_FORMATS:
+            raise InvalidQueryParam("output must be 'csv' or 'ndjson'")
+        self.rows = rows
+        self.output_format = output_format
+        self.fields = EXPORT_FIELDS[rows]
+        self.ordering = [self.fields[1], 'id']
+        self.queryset = self.build_queryset(since, until, mac_address, location)
+        self.after = after
+        self.cursor = after
+
+    def build_queryset(self, since, until, mac_address, location):
+        pings = PingLog.objects.all()
+        if mac_address:
+            pings = pings.filter(mac_address=mac_address)
+        if location is not None:
+            pings = pings.filter(location=location)
+
+        if self.rows == 'segments':
+            # Archived pings and delta scans, each segment overlapping the time range
+            if location is not None:
+                raise InvalidQueryParam("location cannot filter segments, which may span several")
+            queryset = PingSegment.objects.all()
+            if mac_address:
+                queryset = queryset.filter(mac_address=mac_address)
+            if since:
+                queryset = queryset.filter(last_seen__gte=since)
+            if until:
+                queryset = queryset.filter(first_seen__lt=until)
+            return queryset.order_by(*self.ordering)
+        if self.rows == 'pings':
+            queryset = pings
+        else:
+            queryset = ScanLog.objects.all()
+            ping_filter = None
+            if mac_address or location is not None:
+                # Only scans that pinged the device(s), counting only their pings
+                queryset = queryset.filter(Exists(pings.filter(scan=OuterRef('pk'))))
+                ping_filter = Q()
+                if mac_address:
+                    ping_filter &= Q(pings__mac_address=mac_address)
+                if location is not None:
+                    ping_filter &= Q(pings__location=location)
+            if ping_filter is None:
+                # Delta scans log no pings, only the count of devices they reported
+                queryset = queryset.annotate(device_count=Coalesce('reported_devices', Count('pings')))
+            else:
+                queryset = queryset.annotate(device_count=Count('pings', filter=ping_filter))
+        if since:
+            queryset = queryset.filter(timestamp__gte=since)
+        if until:
+            queryset = queryset.filter(timestamp__lt=until)
+        return queryset.order_by(*self.ordering)
+
+    def row_chunks(self):
+        """Yield lists of value tuples of `fields`, one keyset query each."""
+        key = self.after
+        while True:
+            queryset = self.queryset
+            if key is not None:
+                queryset = queryset.filter(keyset_q(self.ordering, key))
+            rows = list(queryset.values_list(*self.fields)[:EXPORT_CHUNK_SIZE])
+            if not rows:
+                return
+            key = [rows[-1][1], rows[-1][0]]
+            yield rows
+            if len(rows) < EXPORT_CHUNK_SIZE:
+                return
+
+    def chunks(self):
+        """
+        Yield the encoded export as bytes, one chunk per keyset query. A resumed CSV export
+        has no header line, so it can be appended to the interrupted file.
+        """
+        tz = timezone.get_current_timezone()
+        datetimes = [i for i, field in enumerate(self.fields) if field in DATETIME_FIELDS]
+        lists = [i for i, field in enumerate(self.fields) if field in LIST_FIELDS]
+        if self.output_format == 'csv' and self.after is None:
+            yield (','.join(self.fields) + '\r\n').encode()
+        for rows in self.row_chunks():
+            buffer = io.StringIO()
+            writer = csv.writer(buffer) if self.output_format == 'csv' else None
+            for row in rows:
+                row = list(row)
+                for i in datetimes:
+                    row[i] = format_datetime(row[i], tz)
+                if writer:
+                    for i in lists:
+                        row[i] = json.dumps(row[i])
+                    writer.writerow(row)
+                else:
+                    buffer.write(json.dumps(dict(zip(self.fields, row))) + '\n')
+            self.cursor = [rows[-1][1], rows[-1][0]]
+            yield buffer.getvalue().encode()
+
+    @property
+    def content_type(self):
+        return 'text/csv; charset=utf-8' if self.output_format == 'csv' else 'application/x-ndjson'
+
+    @property
+    def filename(self):
+        return f"{self.rows}.{self.output_format}"
+
+
+def gzip_chunk(chunk):
+    """
+    Compress a chunk into its own gzip member. Concatenated members are one valid gzip
+    file, so a resumed export can be appended to an interrupted one.
+    """
+    return gzip.compress(chunk, compresslevel=6, mtime=0)
+
+
+def gzip_chunks(chunks):
+    for chunk in chunks:
+        yield gzip_chunk(chunk)
+
+
+async def async_chunks(chunks):
+    """
+    Pull a sync iterator from the sync thread, so an ASGI server streams it; Django
+    otherwise reads a sync iterator into one list before sending it under ASGI.
+    """
+    iterator = iter(chunks)
+    done = object()
+    pull = sync_to_async(next)
+    while (chunk := await pull(iterator, done)) is not done:
+        yield chunk
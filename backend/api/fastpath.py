@@ -0,0 +1,91 @@
+# backend/api/fastpath.py
+from collections import defaultdict
+
+from django.utils import timezone
+
+from .models import DeviceStatus, PingLog
+from .serializers import DeviceStatusSerializer, PingLogSerializer
+
+# Output fields of the serializers, in their order, so the fast path renders the same JSON
+DEVICE_STATUS_FIELDS = list(DeviceStatusSerializer().fields)
+PING_FIELDS = list(PingLogSerializer().fields)
+DATETIME_FIELDS = {'last_seen', 'initial_uptime', 'timestamp'}
+
+
+def format_datetime(value, tz):
+    """Format a datetime the way DRF's DateTimeField does with the default ISO 8601 format."""
+    if not value:
+        return None
+    value = value.astimezone(tz).isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+def to_records(rows, fields):
+    """
+    Turn value tuples of `fields` into the dicts the DRF serializers produce.
+
+    Skips serializer and field instantiation per row; only datetime columns need
+    converting, everything else is already what the serializer would output.
+    """
+    tz = timezone.get_current_timezone()
+    datetimes = [i for i, field in enumerate(fields) if field in DATETIME_FIELDS]
+    records = []
+    for row in rows:
+        if datetimes:
+            row = list(row)
+            for i in datetimes:
+                row[i] = format_datetime(row[i], tz)
+        records.append(dict(zip(fields, row)))
+    return records
+
+
+def device_status_records(queryset=None, fields=DEVICE_STATUS_FIELDS):
+    """DeviceStatusSerializer(queryset, many=True).data, read through values_list()."""
+    queryset = DeviceStatus.objects.all() if queryset is None else queryset
+    return to_records(queryset.values_list(*fields), fields)
+
+
+def instance_records(instances, fields):
+    """Records for model instances that were already loaded, e.g. a keyset page."""
+    return to_records(([getattr(instance, field) for field in fields] for instance in instances), fields)
+
+
+def scan_ping_rows(scans, pings=None):
+    """Value tuples of scan_id and PING_FIELDS for the pings (all by default) of a page of scans."""
+    pings = PingLog.objects.all() if pings is None else pings
+    return pings.filter(scan__in=[scan.pk for scan in scans]).order_by('id').values_list('scan_id', *PING_FIELDS)
+
+
+def group_scan_records(scans, rows):
+    by_scan = defaultdict(list)
+    for record in to_records(rows, ['scan_id', *PING_FIELDS]):
+        by_scan[record.pop('scan_id')].append(record)
+    tz = timezone.get_current_timezone()
+    return [
+        {'id': scan.pk, 'timestamp': format_datetime(scan.timestamp, tz), 'pings': by_scan[scan.pk]}
+        for scan in scans
+    ]
+
+
+def scan_records(scans, pings=None):
+    """
+    ScanLogSerializer output for a page of scans: their pings (from `pings`, all pings by
+    default) are read with one values_list() query and grouped by scan.
+    """
+    return group_scan_records(scans, scan_ping_rows(scans, pings))
+
+
+async def ascan_records(scans, pings=None):
+    """scan_records() for async views, reading the pings through the async ORM."""
+    return group_scan_records(scans, [row async for row in scan_ping_rows(scans, pings)])
+
+
+def scan_timeline_records(scans):
+    """ScanTimelineSerializer output for a page of scans annotated with device_count."""
+    tz = timezone.get_current_timezone()
+    return [
+        {'id': scan.pk, 'timestamp': format_datetime(scan.timestamp, tz), 'device_count': scan.device_count}
+        for scan in scans
+    ]
@@ -0,0 +1,184 @@
+# backend/api/fleet.py
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.db import connection
+from django.utils import timezone
+
+from .models import DeviceStatus, FleetCommand, FleetCommandResult
+
+DEVICE_TIMEOUT_SECONDS = 5
+FLEET_DEFAULT_CONCURRENCY = 32
+FLEET_MAX_CONCURRENCY = 256
+FLEET_DEFAULT_DEADLINE_SECONDS = 30
+FLEET_MAX_DEADLINE_SECONDS = 300
+# Hosts whose keep-alive connections the shared session holds on to
+FLEET_POOLED_HOSTS = 1024
+
+_session_lock = threading.Lock()
+_session = None
+
+
+def device_session():
+    """Return the process-wide HTTP session, which keeps connections to each device alive between commands."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            session.mount('http://', HTTPAdapter(pool_connections=FLEET_POOLED_HOSTS, pool_maxsize=2))
+            _session = session
+        return _session
+
+
+def send_request_to_device(ip_address, endpoint, payload, timeout=DEVICE_TIMEOUT_SECONDS, session=None):
+    url = f"http://{ip_address}{endpoint}"
+    session = session or device_session()
+
+    try:
+        response = session.post(url, data=json.dumps(payload), timeout=timeout)
+        response.raise_for_status()  # Raise an exception for HTTP errors
+        return {"ip": ip_address, "success": True, "status_code": response.status_code, "response": response.json()}
+    except requests.RequestException as e:
+        status_code = e.response.status_code if e.response is not None else None
+        return {"ip": ip_address, "success": False, "status_code": status_code, "error": str(e)}
+
+
+def parse_bounded_int(name, value, default, maximum):
+    """Validate an optional positive integer request field, capped at `maximum`."""
+    if value is None:
+        return default
+    if not isinstance(value, (int, float)) or isinstance(value, bool) or value <= 0:
+        raise ValueError(f"{name} must be a positive number")
+    return min(value, maximum)
+
+
+def select_targets(targets):
+    """
+    Return the up devices matched by a `targets` filter, ordered by MAC address.
+
+    `targets` may combine `mac_addresses` (a list), `location` and `version`; at least one
+    is required so a command never reaches the whole fleet by accident.
+    """
+    if not isinstance(targets, dict):
+        raise ValueError("targets must be an object")
+    mac_addresses = targets.get('mac_addresses')
+    location = targets.get('location')
+    version = targets.get('version')
+    if mac_addresses is None and location is None and version is None:
+        raise ValueError("targets needs at least one of mac_addresses, location or version")
+
+    devices = DeviceStatus.objects.filter(is_up=True)
+    if mac_addresses is not None:
+        if not isinstance(mac_addresses, list) or not all(isinstance(mac, str) for mac in mac_addresses):
+            raise ValueError("targets.mac_addresses must be a list of MAC addresses")
+        devices = devices.filter(mac_address__in=mac_addresses)
+    for name, value in (('location', location), ('version', version)):
+        if value is not None:
+            if not isinstance(value, str):
+                raise ValueError(f"targets.{name} must be a string")
+            devices = devices.filter(**{name: value})
+    return devices.order_by('mac_address')
+
+
+def create_fleet_command(endpoint, payload, targets):
+    """Validate a command and persist its job record; the devices are picked when it runs."""
+    if not isinstance(endpoint, str) or not endpoint.startswith('/') or len(endpoint) > 200:
+        raise ValueError("endpoint must be a device path starting with '/'")
+    device_count = select_targets(targets).count()
+    return FleetCommand.objects.create(endpoint=endpoint, payload=payload, targets=targets, device_count=device_count)
+
+
+def _call_device(session, ip_address, endpoint, payload, expires):
+    started = time.monotonic()
+    timeout = max(0.1, min(DEVICE_TIMEOUT_SECONDS, expires - started))
+    result = send_request_to_device(ip_address, endpoint, payload, timeout=timeout, session=session)
+    result['elapsed_ms'] = (time.monotonic() - started) * 1000
+    return result
+
+
+def _save_result(command, mac_address, result):
+    row = FleetCommandResult.objects.create(
+        command=command,
+        mac_address=mac_address,
+        ip_address=result['ip'],
+        success=result['success'],
+        status_code=result.get('status_code'),
+        response=result.get('response'),
+        error=result.get('error', ''),
+        elapsed_ms=result['elapsed_ms'],
+    )
+    return {
+        'mac_address': row.mac_address,
+        'ip_address': row.ip_address,
+        'success': row.success,
+        'status_code': row.status_code,
+        'response': row.response,
+        'error': row.error,
+        'elapsed_ms': round(row.elapsed_ms, 1),
+    }
+
+
+def run_fleet_command(command, concurrency=FLEET_DEFAULT_CONCURRENCY, deadline=FLEET_DEFAULT_DEADLINE_SECONDS):
+    """
+    Send `command` to its target devices and yield each device's result as it completes.
+
+    At most `concurrency` requests are in flight at once over the shared keep-alive
+    session. Devices still pending after `deadline` seconds are reported as failed.
+    Results are saved as they arrive, so a running job can be polled; the job is marked
+    done with its success/failure counts at the end.
+    """
+    devices = list(select_targets(command.targets).values_list('mac_address', 'ip_address'))
+    command.status = FleetCommand.RUNNING
+    command.device_count = len(devices)
+    command.save(update_fields=['status', 'device_count'])
+
+    session = device_session()
+    expires = time.monotonic() + deadline
+    executor = ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(devices))))
+    futures = {
+        executor.submit(_call_device, session, ip_address, command.endpoint, command.payload, expires): mac_address
+        for mac_address, ip_address in devices
+    }
+    pending = set(futures)
+    succeeded = failed = 0
+    try:
+        try:
+            for future in as_completed(futures, timeout=max(0, expires - time.monotonic())):
+                pending.discard(future)
+                result = _save_result(command, futures[future], future.result())
+                succeeded += result['success']
+                failed += not result['success']
+                yield result
+        except FuturesTimeoutError:
+            ips = dict(devices)
+            for future in sorted(pending, key=futures.get):
+                future.cancel()
+                result = _save_result(command, futures[future], {
+                    'ip': ips[futures[future]], 'success': False, 'error': 'Deadline exceeded',
+                    'elapsed_ms': deadline * 1000,
+                })
+                failed += 1
+                yield result
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        command.status = FleetCommand.DONE
+        command.succeeded = succeeded
+        command.failed = failed
+        command.finished = timezone.now()
+        command.save(update_fields=['status', 'succeeded', 'failed', 'finished'])
+
+
+def start_fleet_command(command, concurrency=FLEET_DEFAULT_CONCURRENCY, deadline=FLEET_DEFAULT_DEADLINE_SECONDS):
+    """Run `command` on a background thread; its progress is read back from the job record."""
+    def work():
+        try:
+            for _ in run_fleet_command(command, concurrency, deadline):
+                pass
+        finally:
+            connection.close()
+
+    threading.Thread(target=work, name=f"fleet-command-{command.pk}", daemon=True).start()
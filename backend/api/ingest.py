@@ -0,0 +1,360 @@
+# backend/api/ingest.py
+from datetime import timedelta
+from ipaddress import ip_address, ip_network
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+from .models import ScanLog, PingLog, DeviceStatus, DeviceStatusTransition, ScanAgent
+from .snapshot import publish_status_change
+from .events import publish_device_changes
+from .streams import assign_stream_ids
+from .metrics import ingest_timer
+from .latency import record_probes
+from .summary import SummaryDelta
+
+# Columns rewritten on an existing DeviceStatus row when its MAC shows up in a scan
+DEVICE_UPSERT_FIELDS = ['ip_address', 'location', 'version', 'is_up', 'last_seen', 'initial_uptime', 'is_stale']
+# Rows per INSERT of the bulk writes, to stay under SQLite's 999 parameters with the widest row (a DeviceStatus upsert)
+INGEST_BATCH = 100
+
+
+def normalize_device(device):
+    """Map a scanner device record onto the PingLog/DeviceStatus field names."""
+    return {
+        'mac_address': device.get('mac_address') or device.get('mac'),
+        'ip_address': device.get('ip_address') or device.get('ip'),
+        'location': device.get('location', ''),  # Default to empty if location is not provided
+        'version': device.get('version', ''),  # Default to empty if version is not provided
+    }
+
+
+def parse_scope(scope):
+    """
+    Validate the optional `scope` of a scan report.
+
+    Returns (agent_id, cidrs) where cidrs is a list of normalized CIDR strings, or
+    (None, None) for an unscoped report. An agent may omit cidrs to reuse the ones from
+    its previous report. Raises ValueError for a malformed scope.
+    """
+    if scope is None:
+        return None, None
+    if not isinstance(scope, dict):
+        raise ValueError("scope must be an object")
+    agent_id = scope.get('agent_id') or ''
+    if not isinstance(agent_id, str) or len(agent_id) > 100:
+        raise ValueError("scope.agent_id must be a string of at most 100 characters")
+    cidrs = scope.get('cidrs')
+    if cidrs is None:
+        agent = ScanAgent.objects.filter(agent_id=agent_id).first() if agent_id else None
+        if agent is None:
+            raise ValueError("scope.cidrs is required for a new agent")
+        cidrs = agent.cidrs
+    if not isinstance(cidrs, list) or not all(isinstance(cidr, str) for cidr in cidrs):
+        raise ValueError("scope.cidrs must be a list of CIDR strings")
+    try:
+        cidrs = [str(ip_network(cidr, strict=False)) for cidr in cidrs]
+    except ValueError as e:
+        raise ValueError(f"Invalid CIDR in scope: {e}")
+    return agent_id, cidrs
+
+
+def in_networks(address, networks):
+    try:
+        address = ip_address(address)
+    except ValueError:
+        return False
+    return any(address in network for network in networks)
+
+
+def flag_stale_agents(now=None):
+    """
+    Flag the devices covered by agents that stopped reporting as stale.
+
+    Each agent is flagged once, when it passes SCAN_AGENT_STALE_SECONDS without a report;
+    its next report clears the flags of the devices in its scope. Returns the number of
+    agents newly flagged.
+    """
+    now = now or timezone.now()
+    stale_agents = list(ScanAgent.objects.filter(
+        is_stale=False, last_report__lt=now - timedelta(seconds=settings.SCAN_AGENT_STALE_SECONDS),
+    ))
+    if not stale_agents:
+        return 0
+    with transaction.atomic():
+        networks = [ip_network(cidr) for agent in stale_agents for cidr in agent.cidrs]
+        stale_macs = [
+            mac_address
+            for mac_address, address in DeviceStatus.objects.filter(is_stale=False).values_list('mac_address', 'ip_address')
+            if in_networks(address, networks)
+        ]
+        if stale_macs:
+            DeviceStatus.objects.filter(mac_address__in=stale_macs).update(is_stale=True)
+            publish_status_change()
+            publish_device_changes(stale_macs)
+        ScanAgent.objects.filter(pk__in=[agent.pk for agent in stale_agents]).update(is_stale=True)
+    return len(stale_agents)
+
+
+def upsert_seen_devices(latest, now):
+    """
+    Load the existing rows of the MACs in `latest` in one query and upsert them all as up.
+
+    Returns (came_up, changed): the MACs that switched to up, and the MACs whose state,
+    IP, location, version or staleness differ from before. Devices coming up without a
+    stream ID are given one, and the fleet summary counts follow the changes.
+    """
+    existing = {
+        device.mac_address: device
+        for device in DeviceStatus.objects.filter(mac_address__in=list(latest))
+    }
+    upserts = []
+    came_up = []
+    changed = []
+    summary = SummaryDelta()
+    for mac_address, record in latest.items():
+        previous = existing.get(mac_address)
+        summary.move(
+            previous and (previous.is_up, previous.location, previous.version),
+            (True, record['location'], record['version']),
+        )
+        # initial_uptime only restarts when a device comes (back) up
+        if previous is None or not previous.is_up:
+            initial_uptime = now
+            came_up.append(mac_address)
+            changed.append(mac_address)
+        else:
+            initial_uptime = previous.initial_uptime
+            if previous.is_stale or any(
+                getattr(previous, field) != record[field] for field in ('ip_address', 'location', 'version')
+            ):
+                changed.append(mac_address)
+        upserts.append(DeviceStatus(
+            **record, is_up=True, last_seen=now, initial_uptime=initial_uptime, is_stale=False,
+        ))
+
+    DeviceStatus.objects.bulk_create(
+        upserts, update_conflicts=True, unique_fields=['mac_address'], update_fields=DEVICE_UPSERT_FIELDS,
+        batch_size=INGEST_BATCH,
+    )
+    if came_up:
+        # New devices get their Janus stream ID in the same transaction
+        assign_stream_ids(came_up)
+    summary.apply(now)
+    return came_up, changed
+
+
+def select_unseen(seen, networks=None):
+    """
+    Return (mac_address, is_up) for the devices outside `seen` (MACs, or a values()
+    subquery) that are up or stale, limited to those whose IP is inside `networks`.
+    """
+    rows = DeviceStatus.objects.filter(Q(is_up=True) | Q(is_stale=True)).exclude(mac_address__in=seen)
+    return [
+        (mac_address, is_up)
+        for mac_address, address, is_up in rows.values_list('mac_address', 'ip_address', 'is_up')
+        if networks is None or in_networks(address, networks)
+    ]
+
+
+def mark_devices_down(unseen, now, **extra):
+    """
+    Mark the (mac_address, is_up) pairs in `unseen` down and clear their stale flag.
+
+    Returns the MACs that were up before. `extra` holds further columns to set, e.g. a
+    last_seen for devices reported gone by a delta scan.
+    """
+    went_down = [mac_address for mac_address, is_up in unseen if is_up]
+    if went_down:
+        summary = SummaryDelta()
+        groups = DeviceStatus.objects.filter(mac_address__in=went_down).values_list('location', 'version')
+        for location, version, count in groups.annotate(count=Count('id')).order_by():
+            summary.move((True, location, version), (False, location, version), count)
+        summary.apply(now)
+    if unseen:
+        DeviceStatus.objects.filter(mac_address__in=[mac_address for mac_address, _ in unseen]).update(
+            is_up=False, initial_uptime=None, is_stale=False, **extra
+        )
+    return went_down
+
+
+def record_status_changes(now, came_up, went_down, touched):
+    """Append the transitions of one ingest and publish its changes after commit."""
+    DeviceStatusTransition.objects.bulk_create(
+        [DeviceStatusTransition(mac_address=mac, is_up=True, timestamp=now) for mac in came_up]
+        + [DeviceStatusTransition(mac_address=mac, is_up=False, timestamp=now) for mac in went_down],
+        batch_size=INGEST_BATCH,
+    )
+    if touched:
+        publish_status_change()
+
+
+def ingest_scan(devices, agent_id=None, cidrs=None, probes=None, scanned_at=None):
+    """
+    Apply one scan report with O(n / INGEST_BATCH) statements in a single transaction.
+
+    Inserts the ScanLog and all PingLogs, loads the existing DeviceStatus rows in one
+    query, upserts every device seen in the scan and marks the rest as down, recording
+    a DeviceStatusTransition for every device whose is_up flipped. For n devices that is
+    a fixed number of statements plus at most 4 * ceil(n / INGEST_BATCH): the pings,
+    upserts and transitions are written INGEST_BATCH rows per INSERT and new devices get
+    their stream IDs in UPDATEs of ALLOCATION_BATCH.
+
+    A scoped report (`cidrs` from parse_scope) only marks down devices whose last IP is
+    inside one of its CIDRs, so several agents can cover different subnets; `agent_id`
+    records when the agent last reported. `probes` (from latency.normalize_probes) are
+    appended to the devices' RTT series. `scanned_at` dates a report delivered late, so
+    its scan, pings and transitions keep the time the scan ran; it changes no device, and
+    no agent, that a newer report already covered.
+    """
+    now = scanned_at or timezone.now()
+    records = [normalize_device(device) for device in devices]
+    # A MAC reported twice keeps the values of its last record, as the old per-device loop did
+    latest = {record['mac_address']: record for record in records}
+    networks = [ip_network(cidr) for cidr in cidrs] if cidrs is not None else None
+
+    with ingest_timer('full', len(records)), transaction.atomic():
+        scan = ScanLog.objects.create(agent_id=agent_id or '', timestamp=now)
+        PingLog.objects.bulk_create([PingLog(scan=scan, timestamp=now, **record) for record in records],
+                                    batch_size=INGEST_BATCH)
+
+        # Set to "down" any devices not seen in this scan that were previously "up" without updating last_seen,
+        # and clear the stale flag of the ones this report covers
+        seen = list(latest)
+        unseen = select_unseen(seen, networks)
+        if scanned_at is not None:
+            # A report delivered late only logs pings for devices a newer report already covered
+            newer = changed_since(seen + [mac_address for mac_address, _ in unseen], now)
+            latest = {mac_address: record for mac_address, record in latest.items() if mac_address not in newer}
+            unseen = [(mac_address, is_up) for mac_address, is_up in unseen if mac_address not in newer]
+        came_up, changed = upsert_seen_devices(latest, now)
+        went_down = mark_devices_down(unseen, now)
+
+        record_status_changes(now, came_up, went_down, touched=bool(latest or unseen))
+        publish_device_changes(changed + [mac_address for mac_address, _ in unseen])
+        record_probes(probes, now)
+        if agent_id and not (scanned_at and ScanAgent.objects.filter(agent_id=agent_id, last_report__gt=now).exists()):
+            record_agent_report(agent_id, cidrs, now)
+
+    flag_stale_agents(now)
+    return scan
+
+
+def ingest_scans(reports, agent_id=None, cidrs=None):
+    """
+    Apply consecutive reports of one scope, oldest first, with the outcome of one
+    ingest_scan() call per report but a single write per DeviceStatus row.
+
+    `reports` are (devices, probes, scanned_at) tuples, each dated. Every report keeps its
+    ScanLog, pings, probe samples and the transitions of the devices it switched up or
+    down, at its scanned_at; the devices are replayed report by report in memory and only
+    their final state is written. Returns the ScanLogs.
+    """
+    networks = [ip_network(cidr) for cidr in cidrs] if cidrs is not None else None
+    runs = []
+    for devices, probes, scanned_at in reports:
+        records = [normalize_device(device) for device in devices]
+        runs.append((scanned_at, records, {record['mac_address']: record for record in records}, probes))
+    seen = list({mac_address for _, _, latest, _ in runs for mac_address in latest})
+    first, last = runs[0][0], runs[-1][0]
+
+    with ingest_timer('full', sum(len(records) for _, records, _, _ in runs)), transaction.atomic():
+        scans = [ScanLog.objects.create(agent_id=agent_id or '', timestamp=scanned_at) for scanned_at, *_ in runs]
+        PingLog.objects.bulk_create([
+            PingLog(scan=scan, timestamp=scan.timestamp, **record)
+            for scan, (_, records, _, _) in zip(scans, runs) for record in records
+        ], batch_size=INGEST_BATCH)
+
+        # The devices the reports see, and the up or stale ones they may mark down
+        rows = DeviceStatus.objects.filter(Q(mac_address__in=seen) | Q(is_up=True) | Q(is_stale=True))
+        devices = {row['mac_address']: row for row in rows.values('mac_address', *DEVICE_UPSERT_FIELDS)}
+        # Like ingest_scan() for a late report, a device changed after a report is left alone by it
+        newer = {mac_address: device['last_seen'] for mac_address, device in devices.items()}
+        flips = DeviceStatusTransition.objects.filter(mac_address__in=list(devices), timestamp__gt=first)
+        for mac_address, timestamp in flips.values_list('mac_address').annotate(latest=Max('timestamp')).order_by():
+            newer[mac_address] = max(newer[mac_address], timestamp)
+
+        summary = SummaryDelta()
+        transitions = []
+        came_up, changed, upserted, unseen = set(), set(), set(), set()
+        for scanned_at, _, latest, _ in runs:
+            for mac_address, record in latest.items():
+                previous = devices.get(mac_address)
+                if previous is not None and newer[mac_address] > scanned_at:
+                    continue
+                summary.move(
+                    previous and (previous['is_up'], previous['location'], previous['version']),
+                    (True, record['location'], record['version']),
+                )
+                if previous is None or not previous['is_up']:
+                    initial_uptime = scanned_at
+                    transitions.append(DeviceStatusTransition(mac_address=mac_address, is_up=True,
+                                                              timestamp=scanned_at))
+                    came_up.add(mac_address)
+                    changed.add(mac_address)
+                else:
+                    initial_uptime = previous['initial_uptime']
+                    if previous['is_stale'] or any(
+                        previous[field] != record[field] for field in ('ip_address', 'location', 'version')
+                    ):
+                        changed.add(mac_address)
+                devices[mac_address] = {
+                    **record, 'is_up': True, 'last_seen': scanned_at, 'initial_uptime': initial_uptime,
+                    'is_stale': False,
+                }
+                newer.setdefault(mac_address, scanned_at)
+                upserted.add(mac_address)
+            for mac_address, device in devices.items():
+                if mac_address in latest or not (device['is_up'] or device['is_stale']) \
+                        or newer[mac_address] > scanned_at \
+                        or networks is not None and not in_networks(device['ip_address'], networks):
+                    continue
+                if device['is_up']:
+                    summary.move((True, device['location'], device['version']),
+                                 (False, device['location'], device['version']))
+                    transitions.append(DeviceStatusTransition(mac_address=mac_address, is_up=False,
+                                                              timestamp=scanned_at))
+                device.update(is_up=False, initial_uptime=None, is_stale=False)
+                unseen.add(mac_address)
+
+        DeviceStatus.objects.bulk_create(
+            [DeviceStatus(**devices[mac_address]) for mac_address in upserted],
+            update_conflicts=True, unique_fields=['mac_address'], update_fields=DEVICE_UPSERT_FIELDS,
+            batch_size=INGEST_BATCH,
+        )
+        if unseen - upserted:
+            DeviceStatus.objects.filter(mac_address__in=list(unseen - upserted)).update(
+                is_up=False, initial_uptime=None, is_stale=False,
+            )
+        if came_up:
+            assign_stream_ids(list(came_up))
+        summary.apply(last)
+        DeviceStatusTransition.objects.bulk_create(transitions, batch_size=INGEST_BATCH)
+        if upserted or unseen:
+            publish_status_change()
+        publish_device_changes(list(changed | unseen))
+        for scanned_at, _, _, probes in runs:
+            record_probes(probes, scanned_at)
+        if agent_id and not ScanAgent.objects.filter(agent_id=agent_id, last_report__gt=last).exists():
+            record_agent_report(agent_id, cidrs, last)
+
+    flag_stale_agents(last)
+    return scans
+
+
+def changed_since(mac_addresses, now):
+    """Return the MACs among `mac_addresses` last seen, or switched up or down, after `now`."""
+    newer = set(DeviceStatus.objects.filter(
+        mac_address__in=mac_addresses, last_seen__gt=now,
+    ).values_list('mac_address', flat=True))
+    newer.update(DeviceStatusTransition.objects.filter(
+        mac_address__in=mac_addresses, timestamp__gt=now,
+    ).values_list('mac_address', flat=True))
+    return newer
+
+
+def record_agent_report(agent_id, cidrs, now):
+    ScanAgent.objects.update_or_create(
+        agent_id=agent_id, defaults={'cidrs': cidrs, 'last_report': now, 'is_stale': False},
+    )
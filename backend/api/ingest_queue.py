@@ -0,0 +1,171 @@
+# backend/api/ingest_queue.py
+import logging
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .ingest import ingest_scans
+
+logger = logging.getLogger(__name__)
+
+# Reports applied per writer transaction at most
+INGEST_BATCH_SIZE = 50
+
+
+class QueueFull(Exception):
+    """Raised when a report arrives while SCAN_INGEST_QUEUE_SIZE reports are already waiting."""
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    """
+    Let dashboard reads run while the writer holds the write lock: WAL journal, and
+    synchronous=NORMAL, which is durable across application crashes in WAL mode.
+    """
+    if connection.vendor == 'sqlite' and settings.SCAN_INGEST_MODE == 'queue':
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode=WAL')
+            cursor.execute('PRAGMA synchronous=NORMAL')
+
+
+def coalesce(reports):
+    """
+    Group consecutive reports from the same scope into runs, in order.
+
+    A full scan states every device of its scope, so of consecutive reports with the same
+    agent and CIDRs only the last one decides the final DeviceStatus table; ingest_scans()
+    writes each device once per run, while still logging every report's pings and
+    transitions.
+    """
+    runs = []
+    for report in reports:
+        if runs and runs[-1][-1]['scope_key'] == report['scope_key']:
+            runs[-1].append(report)
+        else:
+            runs.append([report])
+    return runs
+
+
+class IngestQueue:
+    """
+    Write-behind queue for scan reports.
+
+    Requests enqueue validated reports; a single writer thread drains them, coalesces
+    consecutive reports from the same scope and applies each batch in one transaction,
+    so only one thread ever waits on the SQLite write lock. Reports are dated by when they
+    were enqueued, not applied.
+    """
+
+    def __init__(self, maxsize=None):
+        self.queue = queue.Queue(maxsize=maxsize or settings.SCAN_INGEST_QUEUE_SIZE)
+        self.autostart = True
+        self.writer = None
+        self.lock = threading.Lock()
+        self.in_flight = None  # Enqueue time of the oldest report in the batch being applied
+        self.applied = 0
+        self.coalesced = 0
+        self.failed = 0
+        self.last_applied = None
+
+    def enqueue(self, devices, agent_id=None, cidrs=None, probes=None):
+        now = time.time()
+        report = {
+            'devices': devices, 'agent_id': agent_id, 'cidrs': cidrs, 'probes': probes or [], 'enqueued': now,
+            'received': timezone.now(),
+            'scope_key': (agent_id, tuple(cidrs) if cidrs is not None else None),
+        }
+        try:
+            self.queue.put_nowait(report)
+        except queue.Full:
+            raise QueueFull()
+        if self.autostart:
+            self.start_writer()
+        return self.queue.qsize()
+
+    def start_writer(self):
+        with self.lock:
+            if self.writer is None or not self.writer.is_alive():
+                self.writer = threading.Thread(target=self.run, name="scan-ingest-writer", daemon=True)
+                self.writer.start()
+
+    def take_batch(self, block=True):
+        """Take up to INGEST_BATCH_SIZE queued reports, waiting for the first one if `block`."""
+        try:
+            batch = [self.queue.get(block=block)]
+        except queue.Empty:
+            return []
+        while len(batch) < INGEST_BATCH_SIZE:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def apply(self, batch):
+        runs = coalesce(batch)
+        failed = 0
+        with self.lock:
+            self.in_flight = batch[0]['enqueued']
+        try:
+            with transaction.atomic():
+                for run in runs:
+                    try:
+                        # Each run has its own savepoint, so a bad one does not undo the batch
+                        ingest_scans(
+                            [(report['devices'], report['probes'], report['received']) for report in run],
+                            run[0]['agent_id'], run[0]['cidrs'],
+                        )
+                    except Exception:
+                        logger.exception("Failed to apply %d queued scan report(s)", len(run))
+                        failed += len(run)
+        finally:
+            with self.lock:
+                self.in_flight = None
+        with self.lock:
+            self.applied += len(batch) - failed
+            self.coalesced += len(batch) - len(runs)
+            self.failed += failed
+            self.last_applied = time.time()
+
+    def drain(self):
+        """Apply every queued report on the calling thread."""
+        while True:
+            batch = self.take_batch(block=False)
+            if not batch:
+                return
+            self.apply(batch)
+
+    def run(self):
+        while True:
+            batch = self.take_batch()
+            close_old_connections()
+            try:
+                self.apply(batch)
+            except Exception:
+                logger.exception("Scan ingest writer failed to apply a batch")
+
+    def oldest_pending(self):
+        """Return the enqueue time of the oldest report not applied yet, or None."""
+        with self.queue.mutex:
+            head = self.queue.queue[0]['enqueued'] if self.queue.queue else None
+        with self.lock:
+            return self.in_flight if self.in_flight is not None else head
+
+    def stats(self):
+        oldest = self.oldest_pending()
+        with self.lock:
+            return {
+                'mode': settings.SCAN_INGEST_MODE,
+                'depth': self.queue.qsize(),
+                'lag_seconds': round(time.time() - oldest, 3) if oldest is not None else 0.0,
+                'applied': self.applied,
+                'coalesced': self.coalesced,
+                'failed': self.failed,
+                'last_applied': self.last_applied,
+            }
+
+
+ingest_queue = IngestQueue()
@@ -0,0 +1,334 @@
+# backend/api/latency.py
+import math
+import struct
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import BinaryField, Case, F, Func, Value, When
+from django.utils import timezone
+
+from .models import DeviceStatus, LatencyRollup, LatencySamples
+
+# Failure reasons reported by the scanner; a sample's result code is its index, 0 for an answered probe
+PROBE_RESULTS = ('ok', 'timeout', 'refused', 'error', 'not_device')
+# Seconds into the hour, result code, RTT in ms
+SAMPLE = struct.Struct('<HBf')
+# Sparse histogram entry of a rollup: bucket index, count
+HISTOGRAM_ENTRY = struct.Struct('<HI')
+# Bucket i counts RTTs in (BASE * GROWTH^(i-1), BASE * GROWTH^i], so percentiles are within 10%
+HISTOGRAM_BASE_MS = 0.1
+HISTOGRAM_GROWTH = 1.1
+
+RAW_HOURS = 48
+MINUTE_DAYS = 14
+# Hours are rolled up once they ended this long ago, so reports still being applied are not missed
+ROLLUP_GRACE = timedelta(minutes=1)
+APPEND_BATCH = 500  # Devices per UPDATE, to stay under SQLite's parameter limit
+ROLLUP_BATCH = 200  # Hours of samples rolled up per transaction
+RESOLUTIONS = (LatencyRollup.MINUTE, LatencyRollup.HOUR)
+ROLLUP_STATS_FIELDS = ['sample_count', 'rtt_sum_ms', 'rtt_max_ms', 'histogram', 'failures']
+
+
+class AppendBytes(Func):
+    """`blob || blob`, which SQLite returns as text unless cast back."""
+    template = '(%(expressions)s)'
+    arg_joiner = ' || '
+    output_field = BinaryField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='CAST((%(expressions)s) AS BLOB)', **extra_context)
+
+
+def normalize_probes(probes):
+    """
+    Validate the `probes` of a scan report: a list of {"mac_address", "rtt_ms"} for
+    devices that answered and {"mac_address", "error"} for known devices that did not.
+    Returns (mac_address, result code, rtt_ms) tuples; raises ValueError.
+    """
+    if probes is None:
+        return []
+    if not isinstance(probes, list) or not all(isinstance(probe, dict) for probe in probes):
+        raise ValueError("probes must be a list of objects")
+    samples = []
+    for probe in probes:
+        mac_address = probe.get('mac_address')
+        if not isinstance(mac_address, str) or not mac_address:
+            raise ValueError("every probe needs a mac_address")
+        error = probe.get('error')
+        if error is not None:
+            if error not in PROBE_RESULTS[1:]:
+                raise ValueError(f"probe error must be one of {', '.join(PROBE_RESULTS[1:])}")
+            samples.append((mac_address, PROBE_RESULTS.index(error), 0.0))
+            continue
+        rtt_ms = probe.get('rtt_ms')
+        if isinstance(rtt_ms, bool) or not isinstance(rtt_ms, (int, float)) or not 0 <= rtt_ms < 1e6:
+            raise ValueError("probe rtt_ms must be a non-negative number of milliseconds")
+        samples.append((mac_address, 0, float(rtt_ms)))
+    return samples
+
+
+def floor_time(value, resolution):
+    if resolution == LatencyRollup.MINUTE:
+        return value.replace(second=0, microsecond=0)
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def record_probes(samples, now):
+    """
+    Append normalized probe samples to each device's LatencySamples row of the current hour.
+
+    Costs one INSERT of the missing hour rows and one UPDATE per 500 devices that appends
+    to the blobs in SQL, so ingest never reads a series back. Samples of a report delivered
+    late, for an hour already rolled up, are merged into its rollups instead.
+    """
+    if not samples:
+        return
+    hour = floor_time(now, LatencyRollup.HOUR)
+    offset = int((now - hour).total_seconds())
+    packed = defaultdict(bytes)
+    for mac_address, code, rtt_ms in samples:
+        packed[mac_address] += SAMPLE.pack(offset, code, rtt_ms)
+
+    if hour < floor_time(timezone.now() - ROLLUP_GRACE, LatencyRollup.HOUR):
+        # rollup_latency never reads an hour it rolled up again
+        rolled_up = LatencyRollup.objects.filter(resolution=LatencyRollup.HOUR, start=hour)
+        for batch in batched(list(packed), APPEND_BATCH):
+            macs = rolled_up.filter(mac_address__in=batch).values_list('mac_address', flat=True)
+            merge_into_rollups({mac_address: packed.pop(mac_address) for mac_address in macs}, hour)
+        if not packed:
+            return
+
+    LatencySamples.objects.bulk_create(
+        [LatencySamples(mac_address=mac_address, hour=hour) for mac_address in packed],
+        ignore_conflicts=True, batch_size=APPEND_BATCH,
+    )
+    for batch in batched(list(packed.items()), APPEND_BATCH):
+        LatencySamples.objects.filter(hour=hour, mac_address__in=[mac_address for mac_address, _ in batch]).update(
+            samples=AppendBytes(F('samples'), Case(
+                *(When(mac_address=mac_address, then=Value(data)) for mac_address, data in batch),
+                output_field=BinaryField(),
+            )),
+        )
+
+
+def batched(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def merge_into_rollups(packed, hour):
+    """Add packed samples of an hour already rolled up to the minute and hour rollups of each device."""
+    if not packed:
+        return
+    added = {}
+    for mac_address, data in packed.items():
+        minutes, total = summarize_hour(hour, data)
+        added.update({(mac_address, LatencyRollup.MINUTE, start): stats for start, stats in minutes.items()})
+        added[(mac_address, LatencyRollup.HOUR, hour)] = total
+    existing = LatencyRollup.objects.filter(
+        mac_address__in=list(packed), start__gte=hour, start__lt=hour + timedelta(hours=1),
+    ).values_list('mac_address', 'resolution', 'start', *ROLLUP_STATS_FIELDS)
+    for mac_address, resolution, start, *summary in existing:
+        if (mac_address, resolution, start) in added:
+            added[(mac_address, resolution, start)].merge(LatencyStats.from_rollup(*summary))
+    LatencyRollup.objects.bulk_create(
+        [stats.to_rollup(*key) for key, stats in added.items()],
+        update_conflicts=True, unique_fields=['mac_address', 'resolution', 'start'],
+        update_fields=ROLLUP_STATS_FIELDS, batch_size=APPEND_BATCH,
+    )
+
+
+def decode_samples(hour, data):
+    """Yield (timestamp, result code, rtt_ms) for the packed samples of an hour row."""
+    for offset, code, rtt_ms in SAMPLE.iter_unpack(bytes(data)):
+        yield hour + timedelta(seconds=offset), code, rtt_ms
+
+
+def bucket_index(rtt_ms):
+    if rtt_ms <= HISTOGRAM_BASE_MS:
+        return 0
+    return min(65535, math.ceil(math.log(rtt_ms / HISTOGRAM_BASE_MS, HISTOGRAM_GROWTH) - 1e-9))
+
+
+class LatencyStats:
+    """Mergeable summary of probe samples: RTT histogram, sum and max, and failures by reason."""
+
+    def __init__(self):
+        self.count = 0
+        self.rtt_sum = 0.0
+        self.rtt_max = 0.0
+        self.histogram = defaultdict(int)
+        self.failures = defaultdict(int)
+
+    def add(self, code, rtt_ms):
+        if code:
+            self.failures[PROBE_RESULTS[code]] += 1
+            return
+        self.count += 1
+        self.rtt_sum += rtt_ms
+        self.rtt_max = max(self.rtt_max, rtt_ms)
+        self.histogram[bucket_index(rtt_ms)] += 1
+
+    def merge(self, other):
+        self.count += other.count
+        self.rtt_sum += other.rtt_sum
+        self.rtt_max = max(self.rtt_max, other.rtt_max)
+        for index, count in other.histogram.items():
+            self.histogram[index] += count
+        for reason, count in other.failures.items():
+            self.failures[reason] += count
+        return self
+
+    @classmethod
+    def from_rollup(cls, count, rtt_sum, rtt_max, histogram, failures):
+        stats = cls()
+        stats.count, stats.rtt_sum, stats.rtt_max = count, rtt_sum, rtt_max
+        for index, bucket_count in HISTOGRAM_ENTRY.iter_unpack(bytes(histogram)):
+            stats.histogram[index] = bucket_count
+        stats.failures.update(failures)
+        return stats
+
+    def to_rollup(self, mac_address, resolution, start):
+        return LatencyRollup(
+            mac_address=mac_address, resolution=resolution, start=start,
+            sample_count=self.count, rtt_sum_ms=self.rtt_sum, rtt_max_ms=self.rtt_max,
+            histogram=b''.join(HISTOGRAM_ENTRY.pack(index, count) for index, count in sorted(self.histogram.items())),
+            failures=dict(self.failures),
+        )
+
+    def percentile(self, fraction):
+        """Upper bound of the histogram bucket holding the given fraction of the RTTs, capped at the max."""
+        if not self.count:
+            return None
+        rank = max(1, math.ceil(fraction * self.count))
+        seen = 0
+        for index in sorted(self.histogram):
+            seen += self.histogram[index]
+            if seen >= rank:
+                return round(min(HISTOGRAM_BASE_MS * HISTOGRAM_GROWTH ** index, self.rtt_max), 3)
+        return round(self.rtt_max, 3)
+
+    def as_dict(self):
+        probes = self.count + sum(self.failures.values())
+        return {
+            'samples': self.count,
+            'failures': dict(sorted(self.failures.items())),
+            'failure_rate': (probes - self.count) / probes if probes else None,
+            'mean_ms': round(self.rtt_sum / self.count, 3) if self.count else None,
+            'p50_ms': self.percentile(0.5),
+            'p90_ms': self.percentile(0.9),
+            'p99_ms': self.percentile(0.99),
+            'max_ms': round(self.rtt_max, 3) if self.count else None,
+        }
+
+
+def summarize_hour(hour, data):
+    """Return the per-minute LatencyStats of an hour's packed samples, and their total."""
+    minutes = defaultdict(LatencyStats)
+    for timestamp, code, rtt_ms in decode_samples(hour, data):
+        minutes[floor_time(timestamp, LatencyRollup.MINUTE)].add(code, rtt_ms)
+    total = LatencyStats()
+    for stats in minutes.values():
+        total.merge(stats)
+    return minutes, total
+
+
+def rollup_latency(raw_hours=RAW_HOURS, minute_days=MINUTE_DAYS, now=None):
+    """
+    Fold every completed hour of LatencySamples into per-minute and per-hour LatencyRollups,
+    then delete samples older than `raw_hours` and minute rollups older than `minute_days`.
+
+    Each batch of hours is rolled up and flagged in one transaction, so queries never count
+    a sample both raw and rolled up. Returns (hours rolled up, raw rows deleted, minute rollups deleted).
+    """
+    now = now or timezone.now()
+    cutoff = floor_time(now - ROLLUP_GRACE, LatencyRollup.HOUR)
+    pending = LatencySamples.objects.filter(rolled_up=False, hour__lt=cutoff)
+
+    rolled_up = 0
+    while True:
+        rows = list(pending.order_by('id').values_list('id', 'mac_address', 'hour', 'samples')[:ROLLUP_BATCH])
+        if not rows:
+            break
+        rollups = []
+        for _, mac_address, hour, data in rows:
+            minutes, total = summarize_hour(hour, data)
+            rollups += [
+                stats.to_rollup(mac_address, LatencyRollup.MINUTE, start) for start, stats in sorted(minutes.items())
+            ]
+            rollups.append(total.to_rollup(mac_address, LatencyRollup.HOUR, hour))
+        with transaction.atomic():
+            LatencyRollup.objects.bulk_create(rollups, batch_size=APPEND_BATCH)
+            LatencySamples.objects.filter(pk__in=[row[0] for row in rows]).update(rolled_up=True)
+        rolled_up += len(rows)
+
+    raw_deleted, _ = LatencySamples.objects.filter(rolled_up=True, hour__lt=now - timedelta(hours=raw_hours)).delete()
+    minute_deleted, _ = LatencyRollup.objects.filter(
+        resolution=LatencyRollup.MINUTE, start__lt=now - timedelta(days=minute_days),
+    ).delete()
+    return rolled_up, raw_deleted, minute_deleted
+
+
+def device_latency(since, until, resolution, mac_address=None, location=None, group_by_location=False):
+    """
+    Compute RTT percentiles, mean, max and failures by reason per device (or per location)
+    over [since, until), with a trend of the same figures per minute or hour.
+
+    Reads the rollups of `resolution` for hours already rolled up and decodes the raw
+    samples of the others, so the current hour is always included.
+    """
+    devices = DeviceStatus.objects.all()
+    if mac_address:
+        devices = devices.filter(mac_address=mac_address)
+    if location is not None:
+        devices = devices.filter(location=location)
+    locations = dict(devices.order_by('mac_address').values_list('mac_address', 'location'))
+
+    rollups = LatencyRollup.objects.filter(
+        resolution=resolution, start__gte=floor_time(since, resolution), start__lt=until,
+    )
+    raw = LatencySamples.objects.filter(
+        rolled_up=False, hour__gte=floor_time(since, LatencyRollup.HOUR), hour__lt=until,
+    )
+    if mac_address or location is not None:
+        rollups = rollups.filter(mac_address__in=list(locations))
+        raw = raw.filter(mac_address__in=list(locations))
+
+    trends = defaultdict(lambda: defaultdict(LatencyStats))
+    rows = rollups.values_list('mac_address', 'start', *ROLLUP_STATS_FIELDS)
+    for mac, start, *summary in rows:
+        if mac in locations:
+            trends[mac][start].merge(LatencyStats.from_rollup(*summary))
+    for mac, hour, data in raw.values_list('mac_address', 'hour', 'samples'):
+        if mac not in locations:
+            continue
+        for timestamp, code, rtt_ms in decode_samples(hour, data):
+            if since <= timestamp < until:
+                trends[mac][floor_time(timestamp, resolution)].add(code, rtt_ms)
+
+    if group_by_location:
+        groups = defaultdict(lambda: defaultdict(LatencyStats))
+        device_counts = defaultdict(int)
+        for mac, device_location in locations.items():
+            device_counts[device_location] += 1
+            for start, stats in trends[mac].items():
+                groups[device_location][start].merge(stats)
+        return [
+            {'location': name, 'device_count': device_counts[name], **summarize(groups[name])}
+            for name in sorted(device_counts)
+        ]
+    return [
+        {'mac_address': mac, 'location': device_location, **summarize(trends[mac])}
+        for mac, device_location in locations.items()
+    ]
+
+
+def summarize(trend):
+    total = LatencyStats()
+    for stats in trend.values():
+        total.merge(stats)
+    return {
+        **total.as_dict(),
+        'trend': [{'start': start, **stats.as_dict()} for start, stats in sorted(trend.items())],
+    }
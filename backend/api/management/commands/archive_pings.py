@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.archive import ARCHIVE_HOURS, ARCHIVE_SEGMENT_LENGTH, archive_pings
+
+
+class Command(BaseCommand):
+    help = "Compact PingLog rows older than --hours into per-device PingSegments and delete the raw rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hours", type=int, default=ARCHIVE_HOURS,
+                            help="Archive pings older than this many hours")
+        parser.add_argument("--segment-length", type=int, default=ARCHIVE_SEGMENT_LENGTH,
+                            help="Number of pings summarized by each segment")
+        parser.add_argument("--interval", type=int, default=0,
+                            help="Keep running and archive every INTERVAL seconds (0 runs once)")
+
+    def handle(self, *args, **options):
+        if options["segment_length"] < 1:
+            raise CommandError("--segment-length must be at least 1")
+
+        while True:
+            archived, segments = archive_pings(options["hours"], options["segment_length"])
+            self.stdout.write(f"Archived {archived} pings into {segments} segments.")
+            if not options["interval"]:
+                break
+            time.sleep(options["interval"])
@@ -0,0 +1,162 @@
+import json
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import AsyncClient, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from api.ingest import ingest_scan
+from api.models import DeviceStatus, PingLog, ScanLog
+from api.snapshot import _bump_status_version
+from api.summary import rebuild_fleet_summary
+
+
+def make_fleet(size):
+    return [
+        {
+            "ssid": f"cam-{i}",
+            "mac_address": f"02:00:00:{(i >> 16) & 0xff:02x}:{(i >> 8) & 0xff:02x}:{i & 0xff:02x}",
+            "ip_address": f"10.{(i >> 16) & 0xff}.{(i >> 8) & 0xff}.{i & 0xff}",
+            "location": f"site-{i % 10}/pole-{i}",
+            "version": ("1.4.2", "1.5.0", "1.5.1")[i % 3],
+        }
+        for i in range(size)
+    ]
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+class Command(BaseCommand):
+    help = ("Benchmark create_scan, get_device_statuses, get_device_summary and get_scans against simulated fleets on a scratch "
+            "database, and compare the results with a JSON baseline.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000],
+                            help="Fleet sizes to benchmark")
+        parser.add_argument("--history", type=int, default=20,
+                            help="Scans ingested before measuring, so the tables hold some history")
+        parser.add_argument("--requests", type=int, default=20,
+                            help="Requests per endpoint and fleet size")
+        parser.add_argument("--churn", type=float, default=0.01,
+                            help="Fraction of the fleet missing from each scan")
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--output", type=str, default=None,
+                            help="Write the results to this JSON file")
+        parser.add_argument("--baseline", type=str, default=None,
+                            help="Compare the results with this JSON file")
+        parser.add_argument("--tolerance", type=float, default=0.25,
+                            help="Allowed p50 slowdown against the baseline, as a fraction")
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options["seed"])
+        self.churn = options["churn"]
+        old_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with tempfile.TemporaryDirectory() as tmp, override_settings(
+                STATUS_VERSION_FILE=Path(tmp) / "status_version", SCAN_INGEST_MODE="sync",
+            ):
+                results = {}
+                for size in options["sizes"]:
+                    results.update(self.run_size(size, options["history"], options["requests"]))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<24} p50 {result['p50_ms']:>9.2f} ms  p99 {result['p99_ms']:>9.2f} ms  "
+                f"{result['rps']:>8.1f} req/s  {result['queries']:>3} queries  {result['bytes']:>9} bytes"
+            )
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+        if options["baseline"]:
+            with open(options["baseline"]) as f:
+                regressions = self.compare(results, json.load(f), options["tolerance"])
+            for line in regressions:
+                self.stderr.write(f"Regression: {line}")
+            if regressions:
+                raise CommandError(f"{len(regressions)} benchmarks regressed against {options['baseline']}")
+
+    def scan(self, fleet):
+        return [device for device in fleet if self.rng.random() >= self.churn]
+
+    def run_size(self, size, history, requests):
+        PingLog.objects.all().delete()
+        ScanLog.objects.all().delete()
+        DeviceStatus.objects.all().delete()
+        rebuild_fleet_summary()
+        fleet = make_fleet(size)
+        for _ in range(history):
+            ingest_scan(self.scan(fleet))
+        return async_to_sync(self.measure_size)(size, fleet, requests)
+
+    async def measure_size(self, size, fleet, requests):
+        """
+        Send the requests through the ASGI handler, as the API is served. The views'
+        sync_to_async() calls run on this command's thread, so its connection sees
+        every query.
+        """
+        client = AsyncClient()
+        results = {}
+
+        async def measure(case, request, before=None):
+            durations = []
+            queries = []
+            size_bytes = 0
+            for _ in range(requests):
+                if before:
+                    before()
+                ctx = CaptureQueriesContext(connection)
+                await sync_to_async(ctx.__enter__)()
+                started = time.perf_counter()
+                response = await request()
+                durations.append(time.perf_counter() - started)
+                await sync_to_async(ctx.__exit__)(None, None, None)
+                if response.status_code >= 400:
+                    raise CommandError(f"{case} answered {response.status_code}")
+                queries.append(await sync_to_async(lambda: len(ctx.captured_queries))())
+                size_bytes = len(response.content)
+            results[f"{case}/{size}"] = {
+                "p50_ms": round(statistics.median(durations) * 1000, 3),
+                "p99_ms": round(percentile(durations, 0.99) * 1000, 3),
+                "rps": round(len(durations) / sum(durations), 1),
+                "queries": max(queries),
+                "bytes": size_bytes,
+            }
+
+        await measure("create_scan", lambda: client.post(
+            "/api/scans/", json.dumps({"devices": self.scan(fleet)}), content_type="application/json",
+        ))
+        await measure("statuses", lambda: client.get("/api/devices/statuses/"))
+        await measure("statuses_uncached", lambda: client.get("/api/devices/statuses/"), before=_bump_status_version)
+        etag = (await client.get("/api/devices/statuses/"))["ETag"]
+        await measure("statuses_304", lambda: client.get("/api/devices/statuses/", headers={"If-None-Match": etag}))
+        await measure("statuses_down", lambda: client.get(
+            "/api/devices/statuses/", {"is_up": "false", "fields": "mac_address,location,last_seen"},
+        ))
+        await measure("summary", lambda: client.get("/api/devices/summary/"))
+        await measure("scans", lambda: client.get("/api/scans/reports/", {"limit": 10}))
+        await measure("scans_timeline", lambda: client.get("/api/scans/reports/", {"pings": "false"}))
+        return results
+
+    def compare(self, results, baseline, tolerance):
+        regressions = []
+        for name, result in results.items():
+            previous = baseline.get(name)
+            if not previous:
+                continue
+            if result["p50_ms"] > previous["p50_ms"] * (1 + tolerance):
+                regressions.append(f"{name}: p50 {result['p50_ms']} ms, baseline {previous['p50_ms']} ms")
+            if result["queries"] > previous["queries"]:
+                regressions.append(f"{name}: {result['queries']} queries, baseline {previous['queries']}")
+        return regressions
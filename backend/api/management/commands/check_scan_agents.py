@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.ingest import flag_stale_agents
+
+
+class Command(BaseCommand):
+    help = "Flag devices covered by scanner agents that stopped reporting as stale."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--interval", type=int, default=0,
+                            help="Keep running and check every INTERVAL seconds (0 runs once)")
+
+    def handle(self, *args, **options):
+        while True:
+            flagged = flag_stale_agents()
+            if flagged:
+                self.stdout.write(f"Flagged {flagged} stale agents.")
+            if not options["interval"]:
+                break
+            time.sleep(options["interval"])
@@ -0,0 +1,50 @@
+import gzip
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+try:
+    import brotli
+except ImportError:  # Only gzip variants are written when brotli is not installed
+    brotli = None
+
+# Text formats worth compressing; images and fonts are already compressed
+COMPRESSIBLE_SUFFIXES = {'.js', '.css', '.html', '.json', '.map', '.svg', '.txt', '.xml', '.ico', '.ttf', '.eot'}
+# Smaller files do not gain enough to offset the Content-Encoding overhead
+MIN_SIZE = 1024
+
+
+class Command(BaseCommand):
+    help = ("Write .gz (and, with the brotli package, .br) variants of the built frontend files, served by "
+            "backend.views.asset to clients that accept them. Run after every `npm run build`.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dir", type=str, default=None,
+                            help="Build directory (defaults to FRONTEND_DIST_DIR)")
+
+    def handle(self, *args, **options):
+        root = Path(options["dir"] or settings.FRONTEND_DIST_DIR)
+        compressors = [('.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            compressors.append(('.br', lambda data: brotli.compress(data, quality=11)))
+        else:
+            self.stderr.write("brotli is not installed, writing gzip variants only.")
+
+        original = compressed = files = 0
+        for path in sorted(root.rglob('*')):
+            if not path.is_file() or path.suffix not in COMPRESSIBLE_SUFFIXES:
+                continue
+            data = path.read_bytes()
+            for suffix, compress in compressors:
+                variant = path.with_name(path.name + suffix)
+                packed = compress(data) if len(data) >= MIN_SIZE else data
+                if len(packed) >= len(data):
+                    # Not worth it; drop a variant left over from an earlier build
+                    variant.unlink(missing_ok=True)
+                    continue
+                variant.write_bytes(packed)
+                original += len(data)
+                compressed += len(packed)
+                files += 1
+        self.stdout.write(f"Wrote {files} compressed files: {original} bytes down to {compressed}.")
@@ -0,0 +1,57 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.export import (
+    EXPORT_FORMATS, EXPORT_ROWS, HistoryExport, format_export_cursor, gzip_chunk, parse_export_cursor,
+)
+from api.pagination import InvalidQueryParam, parse_timestamp
+
+
+class Command(BaseCommand):
+    help = ("Export ping, scan or ping segment history as CSV or NDJSON, oldest first, streaming rows in chunks "
+            "so memory stays flat. An interrupted export prints the --after value that resumes it.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", choices=EXPORT_ROWS, default="pings")
+        parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+        parser.add_argument("--since", type=str, default=None, help="ISO 8601 start of the range")
+        parser.add_argument("--until", type=str, default=None, help="ISO 8601 end of the range (exclusive)")
+        parser.add_argument("--mac-address", type=str, default=None)
+        parser.add_argument("--location", type=str, default=None)
+        parser.add_argument("--after", type=str, default=None,
+                            help="'<timestamp>,<id>' of the last row already exported, to resume")
+        parser.add_argument("--gzip", action="store_true", help="Compress the output with gzip")
+        parser.add_argument("--output", type=str, default=None,
+                            help="File to write, appended to with --after (defaults to stdout)")
+
+    def handle(self, *args, **options):
+        try:
+            export = HistoryExport(
+                rows=options["rows"],
+                output_format=options["format"],
+                since=parse_timestamp("since", options["since"]),
+                until=parse_timestamp("until", options["until"]),
+                mac_address=options["mac_address"],
+                location=options["location"],
+                after=parse_export_cursor(options["after"]),
+            )
+        except InvalidQueryParam as e:
+            raise CommandError(str(e))
+
+        output = open(options["output"], "ab" if options["after"] else "wb") if options["output"] else None
+        # Chunks end on a row (and gzip member) boundary, so the output can be resumed after any of them
+        written = export.after
+        try:
+            for data in export.chunks():
+                (output or sys.stdout.buffer).write(gzip_chunk(data) if options["gzip"] else data)
+                written = export.cursor
+        except (KeyboardInterrupt, OSError) as e:
+            if written is None:
+                raise CommandError(f"Export interrupted before any rows were written: {e!r}")
+            raise CommandError(f"Export interrupted ({e!r}); resume with --after {format_export_cursor(written)}")
+        finally:
+            if output:
+                output.close()
+        if written is not None:
+            self.stderr.write(f"Exported up to {format_export_cursor(written)}.")
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.summary import check_fleet_summary, rebuild_fleet_summary
+
+
+class Command(BaseCommand):
+    help = ("Rebuild the fleet summary served by /api/devices/summary/ from the device statuses and the "
+            "transition log, or with --check only compare them.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--check", action="store_true",
+                            help="Report summary rows that differ from the devices and fail if any do, "
+                                 "without rebuilding")
+
+    def handle(self, *args, **options):
+        if options["check"]:
+            problems = check_fleet_summary()
+            for line in problems:
+                self.stderr.write(line)
+            if problems:
+                raise CommandError(f"{len(problems)} fleet summary rows are out of date; "
+                                   f"run rebuild_fleet_summary to fix them")
+            self.stdout.write("The fleet summary matches the devices.")
+            return
+
+        counts, minutes = rebuild_fleet_summary()
+        self.stdout.write(f"Rebuilt {counts} summary rows and {minutes} minute buckets.")
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.latency import MINUTE_DAYS, RAW_HOURS, rollup_latency
+
+
+class Command(BaseCommand):
+    help = ("Summarize completed hours of probe RTT samples into per-minute and per-hour rollups, and delete "
+            "samples and minute rollups past their retention.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--raw-hours", type=int, default=RAW_HOURS,
+                            help="Keep raw samples for this many hours")
+        parser.add_argument("--minute-days", type=int, default=MINUTE_DAYS,
+                            help="Keep minute rollups for this many days")
+        parser.add_argument("--interval", type=int, default=0,
+                            help="Keep running and roll up every INTERVAL seconds (0 runs once)")
+
+    def handle(self, *args, **options):
+        if options["raw_hours"] < 1 or options["minute_days"] < 1:
+            raise CommandError("--raw-hours and --minute-days must be at least 1")
+
+        while True:
+            hours, raw_deleted, minutes_deleted = rollup_latency(options["raw_hours"], options["minute_days"])
+            self.stdout.write(f"Rolled up {hours} device-hours, deleted {raw_deleted} raw hours "
+                              f"and {minutes_deleted} minute rollups.")
+            if not options["interval"]:
+                break
+            time.sleep(options["interval"])
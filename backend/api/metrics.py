@@ -0,0 +1,231 @@
+# backend/api/metrics.py
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db.models import Count, Max, Min
+
+from .models import DeviceStatus, PingLog
+
+# Upper bounds of the latency histograms, in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+BATCH_SIZE_BUCKETS = (1, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(names, values, extra=()):
+    pairs = [f'{name}="{escape(value)}"' for name, value in (*zip(names, values), *extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for label_values, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{format_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets, labels=()):
+        self.name = name
+        self.help = help_text
+        self.buckets = buckets
+        self.labels = labels
+        self.values = {}  # label values -> [bucket counts..., +Inf count, sum]
+        self.lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.values.get(label_values)
+            if series is None:
+                series = self.values[label_values] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for label_values, series in sorted(self.values.items()):
+                cumulative = 0
+                for bound, count in zip((*self.buckets, '+Inf'), series):
+                    cumulative += count
+                    bucket_labels = format_labels(self.labels, label_values, [('le', bound)])
+                    lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+                labels = format_labels(self.labels, label_values)
+                lines.append(f"{self.name}_sum{labels} {series[-1]}")
+                lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+http_requests = Counter(
+    'ubivision_http_requests_total', 'HTTP requests handled, by view, method and status.', ('view', 'method', 'status'),
+)
+http_latency = Histogram(
+    'ubivision_http_request_duration_seconds', 'Time to produce the response of a request.', LATENCY_BUCKETS,
+    ('view', 'method'),
+)
+request_queries = Histogram(
+    'ubivision_http_request_queries', 'SQL queries run by a request.', QUERY_COUNT_BUCKETS, ('view',),
+)
+request_query_time = Histogram(
+    'ubivision_http_request_query_duration_seconds', 'Time a request spent in SQL queries.', LATENCY_BUCKETS,
+    ('view',),
+)
+ingest_devices = Histogram(
+    'ubivision_ingest_batch_devices', 'Devices per ingested scan report.', BATCH_SIZE_BUCKETS, ('kind',),
+)
+ingest_latency = Histogram(
+    'ubivision_ingest_duration_seconds', 'Time to apply one scan report.', LATENCY_BUCKETS, ('kind',),
+)
+
+REGISTRY = [http_requests, http_latency, request_queries, request_query_time, ingest_devices, ingest_latency]
+
+
+# QueryTimer of the request being handled; copied into the threads sync_to_async runs queries in
+current_query_timer = ContextVar('current_query_timer', default=None)
+
+
+class QueryTimer:
+    """Execute wrapper counting the queries of one request and their time."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - started
+
+
+def time_queries(execute, sql, params, many, context):
+    """Execute wrapper of every connection, timing the query for the current request if any."""
+    timer = current_query_timer.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+    return timer(execute, sql, params, many, context)
+
+
+def install_query_timer(sender, connection, **kwargs):
+    """connection_created receiver installing time_queries."""
+    if time_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, time_queries)
+
+
+class MetricsMiddleware:
+    """
+    Record latency, status and SQL queries of every request by view name.
+
+    Works in both modes, so under ASGI async views are not pushed to a thread by it.
+    Queries are attributed through a context variable rather than a wrapper on the
+    current connection, since async views run theirs on other threads' connections.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        timer = QueryTimer()
+        token = current_query_timer.set(timer)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_query_timer.reset(token)
+        self.record(request, response, timer, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        timer = QueryTimer()
+        token = current_query_timer.set(timer)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_query_timer.reset(token)
+        self.record(request, response, timer, time.perf_counter() - started)
+        return response
+
+    def record(self, request, response, timer, elapsed):
+        match = request.resolver_match
+        view = match.view_name if match else 'unmatched'
+        http_requests.inc(view, request.method, response.status_code)
+        http_latency.observe(elapsed, view, request.method)
+        request_queries.observe(timer.count, view)
+        request_query_time.observe(timer.seconds, view)
+
+
+@contextmanager
+def ingest_timer(kind, devices):
+    """Record the size and duration of one ingested report."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        ingest_devices.observe(devices, kind)
+        ingest_latency.observe(time.perf_counter() - started, kind)
+
+
+def render_gauge(name, help_text, samples, labels=()):
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+    lines.extend(f"{name}{format_labels(labels, label_values)} {value}" for label_values, value in samples)
+    return lines
+
+
+def render_metrics():
+    """Render every metric in the Prometheus text exposition format."""
+    from .ingest_queue import ingest_queue  # Imports ingest, which records into this module
+
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+
+    # Counting the ping log scans the whole table; its id range, read off the primary key,
+    # is an upper bound that only overcounts the rows archived or deleted out of order
+    pings = PingLog.objects.aggregate(first=Min('id'), last=Max('id'))
+    lines.extend(render_gauge('ubivision_table_rows', 'Rows in the largest tables (estimated for pinglog).', [
+        (('pinglog',), pings['last'] - pings['first'] + 1 if pings['last'] is not None else 0),
+        (('devicestatus',), DeviceStatus.objects.count()),
+    ], ('table',)))
+    devices = DeviceStatus.objects.values_list('location', 'is_up').annotate(count=Count('id')).order_by('location', 'is_up')
+    lines.extend(render_gauge('ubivision_devices', 'Devices by location and state.', [
+        ((location, 'up' if is_up else 'down'), count) for location, is_up, count in devices
+    ], ('location', 'state')))
+
+    queue = ingest_queue.stats()
+    lines.extend(render_gauge('ubivision_ingest_queue_depth', 'Scan reports waiting for the writer.', [((), queue['depth'])]))
+    lines.extend(render_gauge(
+        'ubivision_ingest_queue_lag_seconds', 'Age of the oldest scan report not applied yet.', [((), queue['lag_seconds'])],
+    ))
+    return '\n'.join(lines) + '\n'
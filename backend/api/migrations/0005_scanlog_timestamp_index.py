@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-17 11:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_devicestatus_stream_id_devicestatus_unique_stream_id'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='scanlog',
+            name='timestamp',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2 on 2026-10-17 11:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_scanlog_timestamp_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PingSegment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mac_address', models.CharField(max_length=17)),
+                ('first_seen', models.DateTimeField()),
+                ('last_seen', models.DateTimeField()),
+                ('ping_count', models.PositiveIntegerField()),
+                ('scan_count', models.PositiveIntegerField()),
+                ('ip_addresses', models.JSONField(default=list)),
+                ('locations', models.JSONField(default=list)),
+                ('versions', models.JSONField(default=list)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='pingsegment',
+            index=models.Index(fields=['mac_address', 'last_seen'], name='pingsegment_mac_last_seen'),
+        ),
+    ]
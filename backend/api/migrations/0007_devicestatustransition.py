@@ -0,0 +1,45 @@
+# Generated by Django 4.2 on 2026-10-17 11:44
+
+from django.db import migrations, models
+
+
+def seed_transitions(apps, schema_editor):
+    """Give every existing device one transition for its current state."""
+    DeviceStatus = apps.get_model("api", "DeviceStatus")
+    DeviceStatusTransition = apps.get_model("api", "DeviceStatusTransition")
+    DeviceStatusTransition.objects.bulk_create(
+        DeviceStatusTransition(
+            mac_address=device.mac_address,
+            is_up=device.is_up,
+            timestamp=(device.initial_uptime or device.last_seen) if device.is_up else device.last_seen,
+        )
+        for device in DeviceStatus.objects.all()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_pingsegment'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeviceStatusTransition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mac_address', models.CharField(max_length=17)),
+                ('is_up', models.BooleanField()),
+                ('timestamp', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='devicestatustransition',
+            index=models.Index(fields=['mac_address', 'timestamp'], name='transition_mac_timestamp'),
+        ),
+        migrations.AddIndex(
+            model_name='devicestatustransition',
+            index=models.Index(fields=['timestamp'], name='transition_timestamp'),
+        ),
+        migrations.RunPython(seed_transitions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2 on 2026-10-17 11:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_devicestatustransition'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScanAgent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('agent_id', models.CharField(max_length=100, unique=True)),
+                ('cidrs', models.JSONField(default=list)),
+                ('last_report', models.DateTimeField()),
+                ('is_stale', models.BooleanField(default=False)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='devicestatus',
+            name='is_stale',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='scanlog',
+            name='agent_id',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+    ]
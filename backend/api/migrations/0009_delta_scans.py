@@ -0,0 +1,29 @@
+# Generated by Django 4.2 on 2026-10-17 11:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_scan_agents'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScanSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('session_id', models.CharField(max_length=100, unique=True)),
+                ('seq', models.PositiveIntegerField()),
+                ('digest', models.CharField(max_length=64)),
+                ('devices', models.JSONField(default=dict)),
+                ('last_report', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='scanlog',
+            name='kind',
+            field=models.CharField(choices=[('full', 'Full'), ('delta', 'Delta')], default='full', max_length=5),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2 on 2026-10-17 11:57
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_delta_scans'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FleetCommand',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('endpoint', models.CharField(max_length=200)),
+                ('payload', models.JSONField(default=dict)),
+                ('targets', models.JSONField(default=dict)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done')], default='pending', max_length=7)),
+                ('device_count', models.PositiveIntegerField(default=0)),
+                ('succeeded', models.PositiveIntegerField(default=0)),
+                ('failed', models.PositiveIntegerField(default=0)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('finished', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='FleetCommandResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mac_address', models.CharField(max_length=17)),
+                ('ip_address', models.GenericIPAddressField()),
+                ('success', models.BooleanField()),
+                ('status_code', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('response', models.JSONField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+                ('elapsed_ms', models.FloatField()),
+                ('command', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='results', to='api.fleetcommand')),
+            ],
+        ),
+    ]
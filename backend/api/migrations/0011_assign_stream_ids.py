@@ -0,0 +1,30 @@
+# Generated by Django 4.2 on 2026-10-17 16:05
+
+from django.db import migrations
+
+ID_BASE = 6000
+
+
+def assign_stream_ids(apps, schema_editor):
+    """Give every existing device without a stream ID the lowest free one from ID_BASE upward."""
+    DeviceStatus = apps.get_model("api", "DeviceStatus")
+    used = set(DeviceStatus.objects.filter(stream_id__isnull=False).values_list('stream_id', flat=True))
+    candidate = ID_BASE
+    devices = list(DeviceStatus.objects.filter(stream_id__isnull=True).order_by('id'))
+    for device in devices:
+        while candidate in used:
+            candidate += 1
+        device.stream_id = candidate
+        used.add(candidate)
+    DeviceStatus.objects.bulk_update(devices, ['stream_id'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_fleet_commands'),
+    ]
+
+    operations = [
+        migrations.RunPython(assign_stream_ids, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2 on 2026-10-17 12:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_assign_stream_ids'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='devicestatus',
+            index=models.Index(fields=['is_up', 'mac_address'], name='devicestatus_is_up'),
+        ),
+        migrations.AddIndex(
+            model_name='devicestatus',
+            index=models.Index(fields=['location', 'mac_address'], name='devicestatus_location'),
+        ),
+        migrations.AddIndex(
+            model_name='devicestatus',
+            index=models.Index(fields=['version', 'mac_address'], name='devicestatus_version'),
+        ),
+        migrations.AddIndex(
+            model_name='devicestatus',
+            index=models.Index(fields=['last_seen', 'mac_address'], name='devicestatus_last_seen'),
+        ),
+        migrations.AddIndex(
+            model_name='pinglog',
+            index=models.Index(fields=['mac_address', 'timestamp'], name='pinglog_mac_timestamp'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 4.2 on 2026-10-17 12:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_status_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LatencyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mac_address', models.CharField(max_length=17)),
+                ('resolution', models.CharField(choices=[('minute', 'Minute'), ('hour', 'Hour')], max_length=6)),
+                ('start', models.DateTimeField()),
+                ('sample_count', models.PositiveIntegerField()),
+                ('rtt_sum_ms', models.FloatField()),
+                ('rtt_max_ms', models.FloatField()),
+                ('histogram', models.BinaryField()),
+                ('failures', models.JSONField(default=dict)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LatencySamples',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mac_address', models.CharField(max_length=17)),
+                ('hour', models.DateTimeField()),
+                ('samples', models.BinaryField(default=bytes)),
+                ('rolled_up', models.BooleanField(default=False)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='latencysamples',
+            index=models.Index(fields=['rolled_up', 'hour'], name='latencysamples_rolled_up'),
+        ),
+        migrations.AddConstraint(
+            model_name='latencysamples',
+            constraint=models.UniqueConstraint(fields=('mac_address', 'hour'), name='unique_latency_samples_hour'),
+        ),
+        migrations.AddIndex(
+            model_name='latencyrollup',
+            index=models.Index(fields=['resolution', 'start'], name='latencyrollup_start'),
+        ),
+        migrations.AddConstraint(
+            model_name='latencyrollup',
+            constraint=models.UniqueConstraint(fields=('mac_address', 'resolution', 'start'), name='unique_latency_rollup'),
+        ),
+    ]
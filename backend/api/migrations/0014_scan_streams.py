@@ -0,0 +1,30 @@
+# Generated by Django 4.2 on 2026-10-17 12:17
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_latency_telemetry'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='scanlog',
+            name='kind',
+            field=models.CharField(choices=[('full', 'Full'), ('delta', 'Delta'), ('stream', 'Stream')], default='full', max_length=6),
+        ),
+        migrations.CreateModel(
+            name='ScanStream',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cidrs', models.JSONField(blank=True, null=True)),
+                ('received', models.PositiveIntegerField(default=0)),
+                ('last_batch', models.DateTimeField(blank=True, null=True)),
+                ('completed', models.DateTimeField(blank=True, null=True)),
+                ('scan', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stream', to='api.scanlog')),
+            ],
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 4.2 on 2026-10-17 12:24
+
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def seed_fleet_summary(apps, schema_editor):
+    """Count the existing devices; the added/lost buckets fill up as changes are ingested."""
+    DeviceStatus = apps.get_model("api", "DeviceStatus")
+    FleetSummaryCount = apps.get_model("api", "FleetSummaryCount")
+    counts = defaultdict(lambda: [0, 0])
+    groups = DeviceStatus.objects.values_list('location', 'version', 'is_up').annotate(count=Count('id')).order_by()
+    for location, version, is_up, count in groups:
+        for key in (('fleet', ''), ('location', location), ('version', version)):
+            counts[key][0 if is_up else 1] += count
+    FleetSummaryCount.objects.bulk_create([
+        FleetSummaryCount(dimension=dimension, value=value, up=up, down=down)
+        for (dimension, value), (up, down) in counts.items()
+    ], batch_size=200)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_scan_streams'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FleetChangeMinute',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('minute', models.DateTimeField(unique=True)),
+                ('added', models.IntegerField(default=0)),
+                ('lost', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='FleetSummaryCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.CharField(choices=[('fleet', 'Fleet'), ('location', 'Location'), ('version', 'Version')], max_length=8)),
+                ('value', models.CharField(blank=True, max_length=100)),
+                ('up', models.IntegerField(default=0)),
+                ('down', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='fleetsummarycount',
+            constraint=models.UniqueConstraint(fields=('dimension', 'value'), name='unique_fleet_summary_count'),
+        ),
+        migrations.RunPython(seed_fleet_summary, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2 on 2026-10-17 12:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_fleet_summary'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pinglog',
+            index=models.Index(fields=['timestamp', 'id'], name='pinglog_timestamp'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2 on 2026-10-17 13:34
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_scan_report_keys'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pingsegment',
+            name='session',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.scansession'),
+        ),
+        migrations.AddField(
+            model_name='scanlog',
+            name='reported_devices',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -2,7 +2,18 @@ from django.db import models
 from django.utils import timezone
 
 class ScanLog(models.Model):
-    timestamp = models.DateTimeField(auto_now_add=True)  # When the scan was started
+    FULL = 'full'
+    DELTA = 'delta'
+    STREAM = 'stream'
+    KIND_CHOICES = [(FULL, 'Full'), (DELTA, 'Delta'), (STREAM, 'Stream')]
+
+    # When the scan was started; reports delivered late from a scanner's spool carry their own
+    timestamp = models.DateTimeField(default=timezone.now, db_index=True)
+    agent_id = models.CharField(max_length=100, blank=True)  # Scanner agent that reported it, if scoped
+    # Full scans log a ping per device found, stream scans as batches arrive. Delta scans log
+    # none: they extend the open PingSegment of each device of their session (see delta.py)
+    kind = models.CharField(max_length=6, choices=KIND_CHOICES, default=FULL)
+    reported_devices = models.PositiveIntegerField(null=True, blank=True)  # Devices a delta scan reported present
 
     def __str__(self):
         return f"Scan at {self.timestamp}"
@@ -13,7 +24,14 @@ class PingLog(models.Model):
     ip_address = models.GenericIPAddressField()
     location = models.CharField(max_length=100, blank=True)
     version = models.CharField(max_length=100, blank=True)
-    timestamp = models.DateTimeField(auto_now_add=True)  # Automatically set to ping time
+    timestamp = models.DateTimeField(default=timezone.now)  # Ping time, the time of its scan
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['mac_address', 'timestamp'], name='pinglog_mac_timestamp'),
+            # Keyset order of the history export
+            models.Index(fields=['timestamp', 'id'], name='pinglog_timestamp'),
+        ]
 
     def __str__(self):
         return f"{self.mac_address} - {self.ip_address} at {self.timestamp}"
@@ -27,6 +45,7 @@ class DeviceStatus(models.Model):
     last_seen = models.DateTimeField()  # Last up/down state change timestamp
     initial_uptime = models.DateTimeField(null=True, blank=True)  # When device first went up
     stream_id = models.IntegerField(null=True, blank=True)  # Janus stream ID for this device
+    is_stale = models.BooleanField(default=False)  # True if the scanner agent covering it stopped reporting
 
     class Meta:
         constraints = [
@@ -34,7 +53,206 @@ class DeviceStatus(models.Model):
                 fields=['stream_id'], name='unique_stream_id', condition=models.Q(stream_id__isnull=False)
             ),
         ]
+        # Filters of the status query API, with the MAC address as keyset tie-breaker
+        indexes = [
+            models.Index(fields=['is_up', 'mac_address'], name='devicestatus_is_up'),
+            models.Index(fields=['location', 'mac_address'], name='devicestatus_location'),
+            models.Index(fields=['version', 'mac_address'], name='devicestatus_version'),
+            models.Index(fields=['last_seen', 'mac_address'], name='devicestatus_last_seen'),
+        ]
+
+    def __str__(self):
+        status = "Up" if self.is_up else "Down"
+        return f"{self.mac_address} - {status} since {self.last_seen}"
+# Compacted run of consecutive archived PingLog rows for one device, or the scans of a delta
+# session that found the device unchanged since the segment opened
+class PingSegment(models.Model):
+    mac_address = models.CharField(max_length=17)
+    # Delta session still extending the segment; None once closed or archived
+    session = models.ForeignKey('ScanSession', null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+    first_seen = models.DateTimeField()  # Timestamp of the first ping in the segment
+    last_seen = models.DateTimeField()  # Timestamp of the last ping in the segment
+    ping_count = models.PositiveIntegerField()  # Scans the device answered in this segment
+    scan_count = models.PositiveIntegerField()  # Scans run between first_seen and last_seen
+    ip_addresses = models.JSONField(default=list)  # Distinct values, in order of appearance
+    locations = models.JSONField(default=list)
+    versions = models.JSONField(default=list)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['mac_address', 'last_seen'], name='pingsegment_mac_last_seen'),
+        ]
+
+    def __str__(self):
+        return f"{self.mac_address} - {self.ping_count} pings from {self.first_seen} to {self.last_seen}"
+
+# Append-only log of DeviceStatus.is_up flips, used for availability reporting
+class DeviceStatusTransition(models.Model):
+    mac_address = models.CharField(max_length=17)
+    is_up = models.BooleanField()  # State the device switched to
+    timestamp = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['mac_address', 'timestamp'], name='transition_mac_timestamp'),
+            models.Index(fields=['timestamp'], name='transition_timestamp'),
+        ]
 
     def __str__(self):
         status = "Up" if self.is_up else "Down"
-        return f"{self.mac_address} - {status} since {self.last_seen}"
\ No newline at end of file
+        return f"{self.mac_address} - {status} at {self.timestamp}"
+
+
+# Scanner agent reporting scoped scans for a set of subnets
+class ScanAgent(models.Model):
+    agent_id = models.CharField(max_length=100, unique=True)
+    cidrs = models.JSONField(default=list)  # Subnets covered by the agent's last report
+    last_report = models.DateTimeField()
+    is_stale = models.BooleanField(default=False)  # True once the agent missed SCAN_AGENT_STALE_SECONDS
+
+    def __str__(self):
+        return f"{self.agent_id} - last report at {self.last_report}"
+
+
+# Idempotency key of a report applied through the batch scan endpoint, so a resent report is skipped
+class ScanReportKey(models.Model):
+    key = models.CharField(max_length=64, unique=True)
+    scan = models.ForeignKey(ScanLog, null=True, blank=True, on_delete=models.SET_NULL, related_name="+")
+    received = models.DateTimeField(default=timezone.now, db_index=True)  # Pruned after SCAN_REPORT_KEY_DAYS
+
+    def __str__(self):
+        return f"{self.key} - scan {self.scan_id}"
+
+
+# State last acknowledged to a scanner using the delta scan protocol
+class ScanSession(models.Model):
+    session_id = models.CharField(max_length=100, unique=True)  # Agent id, or empty for an unscoped scanner
+    seq = models.PositiveIntegerField()  # Sequence number of the last applied report
+    digest = models.CharField(max_length=64)  # state_digest() of devices
+    devices = models.JSONField(default=dict)  # MAC address -> [ip_address, location, version]
+    last_report = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.session_id or '(unscoped)'} - seq {self.seq} at {self.last_report}"
+
+
+# Command sent to a set of devices through the fleet command API
+class FleetCommand(models.Model):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    STATUS_CHOICES = [(PENDING, 'Pending'), (RUNNING, 'Running'), (DONE, 'Done')]
+
+    endpoint = models.CharField(max_length=200)  # Device path the payload is POSTed to, e.g. "/settings"
+    payload = models.JSONField(default=dict)
+    targets = models.JSONField(default=dict)  # mac_addresses/location/version filter the devices were picked by
+    status = models.CharField(max_length=7, choices=STATUS_CHOICES, default=PENDING)
+    device_count = models.PositiveIntegerField(default=0)
+    succeeded = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    created = models.DateTimeField(auto_now_add=True)
+    finished = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.endpoint} to {self.device_count} devices ({self.status})"
+
+class FleetCommandResult(models.Model):
+    command = models.ForeignKey(FleetCommand, on_delete=models.CASCADE, related_name="results")
+    mac_address = models.CharField(max_length=17)
+    ip_address = models.GenericIPAddressField()
+    success = models.BooleanField()
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)  # None if no HTTP response came back
+    response = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    elapsed_ms = models.FloatField()
+
+    def __str__(self):
+        return f"{self.mac_address} - {'ok' if self.success else 'failed'}"
+
+
+# Scan uploaded as NDJSON batches while it runs; devices it did not see are marked down on completion
+class ScanStream(models.Model):
+    scan = models.OneToOneField(ScanLog, on_delete=models.CASCADE, related_name="stream")
+    cidrs = models.JSONField(null=True, blank=True)  # Scope of the scan, None if unscoped
+    received = models.PositiveIntegerField(default=0)  # Device records applied so far
+    last_batch = models.DateTimeField(null=True, blank=True)
+    completed = models.DateTimeField(null=True, blank=True)  # Set by the "complete" marker
+
+    def __str__(self):
+        return f"Stream of scan {self.scan_id} - {'complete' if self.completed else 'open'}"
+
+
+# RTTs and failures of one device's /status probes during one hour, packed as latency.SAMPLE records
+class LatencySamples(models.Model):
+    mac_address = models.CharField(max_length=17)
+    hour = models.DateTimeField()  # Start of the hour the samples were reported in
+    samples = models.BinaryField(default=bytes)  # Appended in arrival order
+    rolled_up = models.BooleanField(default=False)  # True once summarized into LatencyRollups
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['mac_address', 'hour'], name='unique_latency_samples_hour'),
+        ]
+        indexes = [
+            models.Index(fields=['rolled_up', 'hour'], name='latencysamples_rolled_up'),
+        ]
+
+    def __str__(self):
+        return f"{self.mac_address} - samples of {self.hour}"
+
+# Summary of a device's probe samples over one minute or one hour
+class LatencyRollup(models.Model):
+    MINUTE = 'minute'
+    HOUR = 'hour'
+    RESOLUTION_CHOICES = [(MINUTE, 'Minute'), (HOUR, 'Hour')]
+
+    mac_address = models.CharField(max_length=17)
+    resolution = models.CharField(max_length=6, choices=RESOLUTION_CHOICES)
+    start = models.DateTimeField()
+    sample_count = models.PositiveIntegerField()  # Probes the device answered
+    rtt_sum_ms = models.FloatField()
+    rtt_max_ms = models.FloatField()
+    histogram = models.BinaryField()  # Non-empty RTT buckets as latency.HISTOGRAM_ENTRY records
+    failures = models.JSONField(default=dict)  # Failure reason -> count
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['mac_address', 'resolution', 'start'], name='unique_latency_rollup'),
+        ]
+        indexes = [
+            models.Index(fields=['resolution', 'start'], name='latencyrollup_start'),
+        ]
+
+    def __str__(self):
+        return f"{self.mac_address} - {self.resolution} from {self.start}"
+
+
+# Up and down device counts of the whole fleet and of each location and firmware version,
+# kept current by every path that changes a DeviceStatus (see summary.py)
+class FleetSummaryCount(models.Model):
+    FLEET = 'fleet'
+    LOCATION = 'location'
+    VERSION = 'version'
+    DIMENSION_CHOICES = [(FLEET, 'Fleet'), (LOCATION, 'Location'), (VERSION, 'Version')]
+
+    dimension = models.CharField(max_length=8, choices=DIMENSION_CHOICES)
+    value = models.CharField(max_length=100, blank=True)  # Location or version; empty for the fleet row
+    up = models.IntegerField(default=0)
+    down = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['dimension', 'value'], name='unique_fleet_summary_count'),
+        ]
+
+    def __str__(self):
+        return f"{self.dimension} {self.value!r} - {self.up} up, {self.down} down"
+
+# Devices that joined the fleet and devices that went down during one minute
+class FleetChangeMinute(models.Model):
+    minute = models.DateTimeField(unique=True)
+    added = models.IntegerField(default=0)
+    lost = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.minute} - {self.added} added, {self.lost} lost"
@@ -0,0 +1,128 @@
+# backend/api/pagination.py
+import base64
+import binascii
+import json
+from datetime import datetime, timezone as dt_timezone
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+class InvalidQueryParam(ValueError):
+    """Raised when a list endpoint receives a malformed query parameter."""
+
+
+def encode_cursor(values):
+    """Encode the sort key of the last row of a page as an opaque cursor string."""
+    values = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Decode a cursor produced by encode_cursor back into its list of sort key values."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, ValueError):
+        raise InvalidQueryParam("Invalid cursor")
+    if not isinstance(values, list):
+        raise InvalidQueryParam("Invalid cursor")
+    return values
+
+
+def parse_limit(value, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    """Parse a page size query parameter, clamped to [1, maximum]."""
+    if value in (None, ''):
+        return default
+    try:
+        limit = int(value)
+    except ValueError:
+        raise InvalidQueryParam("limit must be an integer")
+    return max(1, min(limit, maximum))
+
+
+def parse_timestamp(name, value):
+    """Parse an ISO 8601 query parameter, treating naive values as UTC."""
+    if value in (None, ''):
+        return None
+    try:
+        parsed = parse_datetime(value)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise InvalidQueryParam(f"{name} must be an ISO 8601 timestamp")
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, dt_timezone.utc)
+    return parsed
+
+
+def parse_bool(name, value, default):
+    """Parse a true/false query parameter."""
+    if value in (None, ''):
+        return default
+    lowered = value.lower()
+    if lowered in ('1', 'true', 'yes'):
+        return True
+    if lowered in ('0', 'false', 'no'):
+        return False
+    raise InvalidQueryParam(f"{name} must be true or false")
+
+
+def keyset_q(ordering, values):
+    """
+    Build the filter selecting rows strictly after `values` in `ordering`.
+
+    `ordering` uses the order_by() syntax, e.g. ['-timestamp', '-id'], and must end with
+    a unique field so that the key is a total order.
+    """
+    if len(values) != len(ordering):
+        raise InvalidQueryParam("Invalid cursor")
+    condition = Q()
+    for i, field in enumerate(ordering):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        step = Q(**{f"{name}__{lookup}": values[i]})
+        for previous, value in zip(ordering[:i], values[:i]):
+            step &= Q(**{previous.lstrip('-'): value})
+        condition |= step
+    return condition
+
+
+def page_queryset(queryset, ordering, cursor=None):
+    """`queryset` in `ordering`, starting after the row `cursor` points at."""
+    queryset = queryset.order_by(*ordering)
+    if cursor:
+        queryset = queryset.filter(keyset_q(ordering, decode_cursor(cursor)))
+    return queryset
+
+
+def split_page(rows, ordering, limit):
+    """Cut the `limit` + 1 rows fetched for a page to `limit` and derive the next page's cursor."""
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([getattr(rows[-1], field.lstrip('-')) for field in ordering])
+    return rows, next_cursor
+
+
+def paginate(queryset, ordering, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """Return one keyset page of `queryset` and the cursor of the next page (or None)."""
+    try:
+        page = list(page_queryset(queryset, ordering, cursor)[:limit + 1])
+    except (ValidationError, TypeError):
+        # A cursor that decodes but carries values of the wrong type
+        raise InvalidQueryParam("Invalid cursor")
+    return split_page(page, ordering, limit)
+
+
+async def apaginate(queryset, ordering, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """paginate() for async views; the page is fetched by the async ORM, off the event loop."""
+    try:
+        page = [row async for row in page_queryset(queryset, ordering, cursor)[:limit + 1]]
+    except (ValidationError, TypeError):
+        raise InvalidQueryParam("Invalid cursor")
+    return split_page(page, ordering, limit)
@@ -0,0 +1,35 @@
+# backend/api/parsers.py
+import json
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+
+class NDJSONParser(BaseParser):
+    """
+    Newline-delimited JSON (`Content-Type: application/x-ndjson`).
+
+    `request.data` is a generator yielding one object per non-empty line as the body is
+    read, so a large upload is never parsed in one piece. A malformed line raises
+    ParseError when the iteration reaches it.
+    """
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', 'utf-8')
+        return self.iter_lines(stream, encoding)
+
+    def iter_lines(self, stream, encoding):
+        if stream is None:
+            return
+        for number, line in enumerate(stream, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                value = json.loads(line.decode(encoding))
+            except ValueError as e:
+                raise ParseError(f"Line {number} is not valid JSON: {e}")
+            if not isinstance(value, dict):
+                raise ParseError(f"Line {number} is not a JSON object")
+            yield value
@@ -0,0 +1,55 @@
+# backend/api/renderers.py
+from rest_framework.renderers import BaseRenderer, BrowsableAPIRenderer, JSONRenderer
+
+try:
+    import msgpack
+except ImportError:  # MessagePack responses are only offered when msgpack is installed
+    msgpack = None
+
+
+def to_columns(records):
+    """Turn a list of record dicts into {"fields": [...], "columns": [[...], ...]} with one array per field."""
+    if not records:
+        return {'fields': [], 'columns': []}
+    fields = list(records[0])
+    return {'fields': fields, 'columns': [[record[field] for record in records] for field in fields]}
+
+
+def columnar(data):
+    """Apply to_columns to a top-level record list or to the `results` of a page."""
+    if isinstance(data, list):
+        return to_columns(data)
+    if isinstance(data, dict) and isinstance(data.get('results'), list):
+        return {**data, 'results': to_columns(data['results'])}
+    return data
+
+
+class ColumnarJSONRenderer(JSONRenderer):
+    """
+    Compact JSON with one array per field instead of one object per row, selected with
+    `Accept: application/vnd.ubivision.columnar+json` or `?format=columnar`.
+    """
+    media_type = 'application/vnd.ubivision.columnar+json'
+    format = 'columnar'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return super().render(columnar(data), accepted_media_type, renderer_context)
+
+
+class MessagePackRenderer(BaseRenderer):
+    """The regular response structure encoded as MessagePack (`Accept: application/msgpack`)."""
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, use_bin_type=True)
+
+
+# Renderers of the hot list endpoints: JSON stays the default
+LIST_RENDERERS = [JSONRenderer, BrowsableAPIRenderer, ColumnarJSONRenderer]
+if msgpack is not None:
+    LIST_RENDERERS.append(MessagePackRenderer)
@@ -0,0 +1,108 @@
+# backend/api/scan_stream.py
+from ipaddress import ip_network
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .events import publish_device_changes
+from .ingest import (
+    flag_stale_agents, mark_devices_down, normalize_device, record_agent_report, record_status_changes,
+    select_unseen, upsert_seen_devices,
+)
+from .latency import normalize_probes, record_probes
+from .metrics import ingest_timer
+from .models import ScanLog, PingLog, ScanStream
+
+# Records upserted per transaction while a chunk is read
+STREAM_BATCH_SIZE = 200
+
+
+class StreamClosed(Exception):
+    """Raised when records arrive for a stream that was already completed."""
+
+
+def open_stream(agent_id=None, cidrs=None):
+    """Start a streamed scan; its ScanLog collects the pings of every batch."""
+    with transaction.atomic():
+        scan = ScanLog.objects.create(agent_id=agent_id or '', kind=ScanLog.STREAM)
+        return ScanStream.objects.create(scan=scan, cidrs=cidrs)
+
+
+def apply_stream_batch(stream, devices, probes):
+    """
+    Log and upsert one micro-batch of device records as up, in one transaction.
+
+    Devices missing from the batch are left alone: only complete_stream marks the devices
+    the whole scan did not see as down.
+    """
+    now = timezone.now()
+    records = [normalize_device(device) for device in devices]
+    latest = {record['mac_address']: record for record in records}
+    with ingest_timer(ScanLog.STREAM, len(records)), transaction.atomic():
+        PingLog.objects.bulk_create([PingLog(scan=stream.scan, **record) for record in records])
+        came_up, changed = upsert_seen_devices(latest, now)
+        record_status_changes(now, came_up, [], touched=bool(latest))
+        publish_device_changes(changed)
+        record_probes(probes, now)
+        ScanStream.objects.filter(pk=stream.pk).update(received=F('received') + len(records), last_batch=now)
+
+
+def complete_stream(stream):
+    """Mark the devices in the stream's scope that it never reported as down, and close it."""
+    now = timezone.now()
+    networks = [ip_network(cidr) for cidr in stream.cidrs] if stream.cidrs is not None else None
+    agent_id = stream.scan.agent_id
+    with transaction.atomic():
+        unseen = select_unseen(PingLog.objects.filter(scan=stream.scan).values('mac_address'), networks)
+        went_down = mark_devices_down(unseen, now)
+        record_status_changes(now, [], went_down, touched=bool(unseen))
+        publish_device_changes([mac_address for mac_address, _ in unseen])
+        if agent_id:
+            record_agent_report(agent_id, stream.cidrs, now)
+        stream.completed = now
+        stream.save(update_fields=['completed'])
+    flag_stale_agents(now)
+
+
+def ingest_stream_chunk(stream, lines):
+    """
+    Apply the NDJSON lines of one upload to an open stream, STREAM_BATCH_SIZE records at a time.
+
+    Each line is a device record as in a full scan report, a probe
+    ({"type": "probe", "mac_address": ..., "rtt_ms" or "error": ...}) or the final
+    {"type": "complete"} marker. Returns (records applied, completed). Raises ValueError
+    for a malformed line and StreamClosed once the stream is complete; batches before
+    the bad line stay applied.
+    """
+    if stream.completed:
+        raise StreamClosed()
+    devices = []
+    probes = []
+    applied = 0
+    completed = False
+    for line in lines:
+        if completed:
+            raise ValueError("the complete marker must be the last line")
+        kind = line.get('type', 'device')
+        if kind == 'complete':
+            completed = True
+        elif kind == 'probe':
+            probes.extend(normalize_probes([line]))
+        elif kind == 'device':
+            if not (line.get('mac_address') or line.get('mac')) or not (line.get('ip_address') or line.get('ip')):
+                raise ValueError("device records need a mac_address and an ip_address")
+            devices.append(line)
+        else:
+            raise ValueError(f"Unknown line type: {kind}")
+        if len(devices) + len(probes) >= STREAM_BATCH_SIZE:
+            apply_stream_batch(stream, devices, probes)
+            applied += len(devices)
+            devices, probes = [], []
+
+    if devices or probes:
+        apply_stream_batch(stream, devices, probes)
+        applied += len(devices)
+    if completed:
+        complete_stream(stream)
+    return applied, completed
@@ -1,6 +1,6 @@
 # backend/api/serializers.py
 from rest_framework import serializers
-from .models import ScanLog, PingLog, DeviceStatus
+from .models import ScanLog, PingLog, DeviceStatus, ScanAgent, FleetCommand, FleetCommandResult
 
 class PingLogSerializer(serializers.ModelSerializer):
     class Meta:
@@ -14,7 +14,60 @@ class ScanLogSerializer(serializers.ModelSerializer):
         model = ScanLog
         fields = ['id', 'timestamp', 'pings']
 
+class ScanTimelineSerializer(serializers.ModelSerializer):
+    device_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = ScanLog
+        fields = ['id', 'timestamp', 'device_count']
+
 class DeviceStatusSerializer(serializers.ModelSerializer):
     class Meta:
         model = DeviceStatus
-        exclude = ['id']
\ No newline at end of file
+        exclude = ['id']
+
+    def __init__(self, *args, fields=None, **kwargs):
+        # `fields` restricts the output to a sparse fieldset
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+class DeviceHistoryEntrySerializer(serializers.Serializer):
+    source = serializers.CharField()
+    first_seen = serializers.DateTimeField()
+    last_seen = serializers.DateTimeField()
+    ping_count = serializers.IntegerField()
+    scan_count = serializers.IntegerField()
+    ip_addresses = serializers.ListField(child=serializers.CharField())
+    locations = serializers.ListField(child=serializers.CharField(allow_blank=True))
+    versions = serializers.ListField(child=serializers.CharField(allow_blank=True))
+    open = serializers.BooleanField()
+
+
+class ScanAgentSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ScanAgent
+        fields = ['agent_id', 'cidrs', 'last_report', 'is_stale']
+
+
+class FleetCommandResultSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = FleetCommandResult
+        fields = ['mac_address', 'ip_address', 'success', 'status_code', 'response', 'error', 'elapsed_ms']
+
+
+class FleetCommandSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = FleetCommand
+        fields = [
+            'id', 'endpoint', 'payload', 'targets', 'status', 'device_count', 'succeeded', 'failed', 'created',
+            'finished',
+        ]
+
+
+class FleetCommandDetailSerializer(FleetCommandSerializer):
+    results = FleetCommandResultSerializer(many=True, read_only=True)
+
+    class Meta(FleetCommandSerializer.Meta):
+        fields = FleetCommandSerializer.Meta.fields + ['results']
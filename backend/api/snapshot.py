@@ -0,0 +1,134 @@
+# backend/api/snapshot.py
+import fcntl
+import os
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+
+from .fastpath import device_status_records
+
+_cache_lock = threading.Lock()
+_cached = None  # (token, data) of the last DeviceStatus snapshot loaded by this process
+# Version numbers this process bumped to lately, so push streams can tell its own changes,
+# whose events they get from the broadcaster, from changes made by other processes
+_local_versions = deque(maxlen=1000)
+
+
+def _version_file():
+    return settings.STATUS_VERSION_FILE
+
+
+def read_status_version():
+    """
+    Return the current status version token, e.g. "12 1729160000.123456", or None
+    before the first change has been published.
+
+    The token is shared by every worker process through STATUS_VERSION_FILE, so checking
+    it costs one small file read and no database query.
+    """
+    try:
+        with open(_version_file()) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def _bump_status_version():
+    path = _version_file()
+    with open(path, 'a+') as f:
+        # Serialize bumps across processes so the counter only moves forward
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            f.seek(0)
+            current = f.read().split()
+            version = int(current[0]) + 1 if current else 1
+            f.seek(0)
+            f.truncate()
+            f.write(f"{version} {time.time():.6f}")
+            f.flush()
+            os.fsync(f.fileno())
+            _local_versions.append(version)
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def publish_status_change():
+    """Bump the status version once the current transaction commits."""
+    transaction.on_commit(_bump_status_version)
+
+
+def version_number(token):
+    return int(token.split()[0]) if token else 0
+
+
+def changed_elsewhere(since, token):
+    """Whether any status version after `since`, up to `token`, was published by another process."""
+    start, end = version_number(since), version_number(token)
+    if end - start > _local_versions.maxlen:
+        return True
+    local = set(_local_versions)
+    return any(version not in local for version in range(start + 1, end + 1))
+
+
+@lru_cache(maxsize=None)
+def representation_generation():
+    """
+    Return the number of this app's latest migration on disk, e.g. "0018".
+
+    Migrations can change what a status looks like without publishing a change (a new
+    column, a backfill), so the ETag carries this too and copies from before go stale.
+    """
+    from django.db.migrations.loader import MigrationLoader
+
+    leaves = MigrationLoader(None, ignore_no_migrations=True).graph.leaf_nodes('api')
+    return '+'.join(sorted(name.split('_')[0] for _, name in leaves)) or '0'
+
+
+def status_version_etag(token):
+    version = token.replace(" ", "-") if token else '0'
+    return f'"statuses-{representation_generation()}-{version}"'
+
+
+def status_version_modified(token):
+    """Return the Unix time of the last published change, or None."""
+    return float(token.split()[1]) if token else None
+
+
+def get_status_snapshot():
+    """
+    Return (token, data) where data is the serialized DeviceStatus list as of `token`.
+
+    The version is read before the rows, so a change committed while loading makes the
+    next call see a newer token and reload.
+    """
+    global _cached
+    token = read_status_version()
+    if token is None:
+        # Nothing has been published yet, so there is no version to cache against
+        return token, device_status_records()
+    cached = _cached
+    if cached is not None and cached[0] == token:
+        return cached
+    with _cache_lock:
+        if _cached is not None and _cached[0] == token:
+            return _cached
+        data = device_status_records()
+        _cached = (token, data)
+        return _cached
+
+
+async def aget_status_snapshot():
+    """
+    get_status_snapshot() for async views: a current cached snapshot is returned on the
+    event loop, and only loading a new one runs in a thread.
+    """
+    token = read_status_version()
+    cached = _cached
+    if token is not None and cached is not None and cached[0] == token:
+        return cached
+    return await sync_to_async(get_status_snapshot)()
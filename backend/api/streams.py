@@ -0,0 +1,109 @@
+# backend/api/streams.py
+import hashlib
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, IntegerField, Q, Value, When
+
+from .models import DeviceStatus
+
+ID_BASE = 6000  # First Janus stream ID; also the RTP port the device's video is sent to
+ALLOCATION_ATTEMPTS = 3
+ALLOCATION_BATCH = 500  # Devices per UPDATE, to stay under SQLite's parameter limit
+
+JANUS_VIDEO_PT = 96
+JANUS_VIDEO_RTPMAP = "H264/90000"
+JANUS_VIDEO_FMTP = "profile-level-id=42e01f;packetization-mode=1"
+
+
+def free_stream_ids(used, count, base=ID_BASE):
+    """Return the `count` lowest IDs from `base` upward that are not in `used`."""
+    free = []
+    candidate = base
+    while len(free) < count:
+        if candidate not in used:
+            free.append(candidate)
+        candidate += 1
+    return free
+
+
+def assign_stream_ids(mac_addresses=None):
+    """
+    Give every device without a stream ID (optionally only those in `mac_addresses`) the
+    lowest free IDs from ID_BASE upward, so IDs left by removed devices are reused.
+
+    IDs are assigned with one UPDATE per 500 devices that skips rows which got an ID in the meantime.
+    Two allocators picking the same free ID trip the unique_stream_id constraint; the
+    losing one rolls back to its savepoint and retries with fresh data. Returns the
+    {mac_address: stream_id} pairs assigned.
+    """
+    for attempt in range(ALLOCATION_ATTEMPTS):
+        # One query loads both the IDs in use and the devices still missing one
+        wanted = Q(stream_id__isnull=True)
+        if mac_addresses is not None:
+            wanted &= Q(mac_address__in=list(mac_addresses))
+        rows = DeviceStatus.objects.filter(wanted | Q(stream_id__isnull=False)).order_by('id')
+        used = set()
+        missing = []
+        for pk, mac_address, stream_id in rows.values_list('id', 'mac_address', 'stream_id'):
+            if stream_id is None:
+                missing.append((pk, mac_address))
+            else:
+                used.add(stream_id)
+        if not missing:
+            return {}
+
+        ids = dict(zip(missing, free_stream_ids(used, len(missing))))
+        try:
+            with transaction.atomic():
+                updated = 0
+                pairs = list(ids.items())
+                for start in range(0, len(pairs), ALLOCATION_BATCH):
+                    batch = pairs[start:start + ALLOCATION_BATCH]
+                    updated += DeviceStatus.objects.filter(
+                        pk__in=[pk for (pk, _), _ in batch], stream_id__isnull=True,
+                    ).update(stream_id=Case(
+                        *(When(pk=pk, then=Value(stream_id)) for (pk, _), stream_id in batch),
+                        output_field=IntegerField(),
+                    ))
+        except IntegrityError:
+            if attempt == ALLOCATION_ATTEMPTS - 1:
+                raise
+            continue
+        assigned = {mac_address: stream_id for (_, mac_address), stream_id in ids.items()}
+        if updated < len(ids):
+            # Another allocator handled some of the devices first; keep only the IDs that stuck
+            current = dict(DeviceStatus.objects.filter(mac_address__in=list(assigned)).values_list('mac_address', 'stream_id'))
+            assigned = {mac_address: stream_id for mac_address, stream_id in assigned.items()
+                        if current.get(mac_address) == stream_id}
+        return assigned
+    return {}
+
+
+def render_janus_config():
+    """
+    Render the Janus streaming plugin mountpoints (janus.plugin.streaming.jcfg) for every
+    device with a stream ID, in one query, ordered by stream ID.
+
+    Returns (config, etag) where the ETag is a hash of the config, so the Janus updater
+    can skip reloading Janus when nothing changed.
+    """
+    devices = DeviceStatus.objects.filter(stream_id__isnull=False).order_by('stream_id')
+    blocks = []
+    for stream_id, mac_address, location in devices.values_list('stream_id', 'mac_address', 'location'):
+        description = (location or mac_address).replace('\\', '\\\\').replace('"', '\\"')
+        blocks.append(
+            f"stream-{stream_id}: {{\n"
+            f"\ttype = \"rtp\"\n"
+            f"\tid = {stream_id}\n"
+            f"\tdescription = \"{description}\"\n"
+            f"\taudio = false\n"
+            f"\tvideo = true\n"
+            f"\tvideoport = {stream_id}\n"
+            f"\tvideopt = {JANUS_VIDEO_PT}\n"
+            f"\tvideortpmap = \"{JANUS_VIDEO_RTPMAP}\"\n"
+            f"\tvideofmtp = \"{JANUS_VIDEO_FMTP}\"\n"
+            f"}}\n"
+        )
+    config = "\n".join(blocks)
+    etag = f'"janus-{hashlib.sha256(config.encode()).hexdigest()[:32]}"'
+    return config, etag
@@ -0,0 +1,195 @@
+# backend/api/summary.py
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Case, Count, F, Min, Q, Sum, Value, When
+from django.utils import timezone
+
+from .models import DeviceStatus, DeviceStatusTransition, FleetChangeMinute, FleetSummaryCount
+
+# Window of the added/lost figures, as a number of minute buckets
+SUMMARY_WINDOW = timedelta(hours=1)
+SUMMARY_BATCH = 200  # Summary rows per UPDATE, to stay under SQLite's parameter limit
+# Locations and versions listed per response by default; fleets may have a location per device
+SUMMARY_BREAKDOWN_LIMIT = 100
+SUMMARY_BREAKDOWN_MAX = 1000
+
+
+def floor_minute(value):
+    return value.replace(second=0, microsecond=0)
+
+
+def summary_keys(location, version):
+    return [(FleetSummaryCount.FLEET, ''), (FleetSummaryCount.LOCATION, location), (FleetSummaryCount.VERSION, version)]
+
+
+class SummaryDelta:
+    """
+    Changes one ingest makes to the fleet summary, collected while it upserts devices and
+    written with apply() in the same transaction.
+    """
+
+    def __init__(self):
+        self.counts = defaultdict(lambda: [0, 0])  # (dimension, value) -> [up, down] change
+        self.added = 0
+        self.lost = 0
+
+    def move(self, before, after, count=1):
+        """
+        Account for `count` devices going from `before` to `after`, each an (is_up,
+        location, version) tuple; `before` is None for devices new to the fleet.
+        """
+        if before == after:
+            return
+        if before is None:
+            self.added += count
+        else:
+            for key in summary_keys(*before[1:]):
+                self.counts[key][0 if before[0] else 1] -= count
+            if before[0] and not after[0]:
+                self.lost += count
+        for key in summary_keys(*after[1:]):
+            self.counts[key][0 if after[0] else 1] += count
+
+    def apply(self, now=None):
+        """Add the changes to the summary rows, with one UPDATE per SUMMARY_BATCH rows touched."""
+        now = now or timezone.now()
+        changes = [(key, change) for key, change in self.counts.items() if change != [0, 0]]
+        if changes:
+            FleetSummaryCount.objects.bulk_create(
+                [FleetSummaryCount(dimension=dimension, value=value) for (dimension, value), _ in changes],
+                ignore_conflicts=True, batch_size=SUMMARY_BATCH,
+            )
+        for start in range(0, len(changes), SUMMARY_BATCH):
+            batch = changes[start:start + SUMMARY_BATCH]
+            condition = Q()
+            for dimension, value in (key for key, _ in batch):
+                condition |= Q(dimension=dimension, value=value)
+            FleetSummaryCount.objects.filter(condition).update(**{
+                field: F(field) + Case(
+                    *(When(dimension=dimension, value=value, then=Value(change[index]))
+                      for (dimension, value), change in batch if change[index]),
+                    default=Value(0),
+                )
+                for index, field in enumerate(('up', 'down'))
+            })
+
+        if self.added or self.lost:
+            minute = floor_minute(now)
+            bucket = FleetChangeMinute.objects.filter(minute=minute)
+            if not bucket.update(added=F('added') + self.added, lost=F('lost') + self.lost):
+                # First change of this minute: start its bucket and drop the ones that left the window
+                FleetChangeMinute.objects.bulk_create([FleetChangeMinute(minute=minute)], ignore_conflicts=True)
+                bucket.update(added=F('added') + self.added, lost=F('lost') + self.lost)
+                FleetChangeMinute.objects.filter(minute__lte=minute - SUMMARY_WINDOW).delete()
+
+
+def fleet_summary(limit=SUMMARY_BREAKDOWN_LIMIT, now=None):
+    """
+    Return the fleet's up/down counts overall, for the first `limit` locations and
+    versions in name order, and the devices added and lost over the last hour.
+
+    Reads one summary row, at most `limit` + 1 rows per breakdown and an hour of minute
+    buckets, so the cost does not depend on the fleet size.
+    """
+    now = now or timezone.now()
+    fleet = FleetSummaryCount.objects.filter(dimension=FleetSummaryCount.FLEET, value='')
+    up, down = fleet.values_list('up', 'down').first() or (0, 0)
+    summary = {'devices': up + down, 'up': up, 'down': down}
+    for dimension, name in ((FleetSummaryCount.LOCATION, 'locations'), (FleetSummaryCount.VERSION, 'versions')):
+        rows = FleetSummaryCount.objects.filter(dimension=dimension).exclude(up=0, down=0).order_by('value')
+        rows = list(rows.values_list('value', 'up', 'down')[:limit + 1])
+        summary[name] = [
+            {dimension: value, 'up': value_up, 'down': value_down} for value, value_up, value_down in rows[:limit]
+        ]
+        summary[f'{name}_truncated'] = len(rows) > limit
+    window = FleetChangeMinute.objects.filter(minute__gt=floor_minute(now) - SUMMARY_WINDOW)
+    changes = window.aggregate(added=Sum('added'), lost=Sum('lost'))
+    summary['last_hour'] = {'added': changes['added'] or 0, 'lost': changes['lost'] or 0}
+    return summary
+
+
+def compute_fleet_summary(now=None):
+    """
+    Derive the summary rows and minute buckets from DeviceStatus and the transition log.
+
+    Returns ({(dimension, value): (up, down)}, {minute: (added, lost)}); a device was added
+    at its first transition, and lost at each transition to down.
+    """
+    now = now or timezone.now()
+    counts = defaultdict(lambda: [0, 0])
+    groups = DeviceStatus.objects.values_list('location', 'version', 'is_up').annotate(count=Count('id')).order_by()
+    for location, version, is_up, count in groups:
+        for key in summary_keys(location, version):
+            counts[key][0 if is_up else 1] += count
+
+    since = floor_minute(now) - SUMMARY_WINDOW + timedelta(minutes=1)
+    minutes = defaultdict(lambda: [0, 0])
+    first_seen = (DeviceStatusTransition.objects.values('mac_address').annotate(first=Min('timestamp'))
+                  .filter(first__gte=since).values_list('first', flat=True))
+    for timestamp in first_seen:
+        minutes[floor_minute(timestamp)][0] += 1
+    for timestamp in DeviceStatusTransition.objects.filter(is_up=False, timestamp__gte=since).values_list(
+        'timestamp', flat=True,
+    ):
+        minutes[floor_minute(timestamp)][1] += 1
+    return (
+        {key: tuple(value) for key, value in counts.items()},
+        {minute: tuple(value) for minute, value in minutes.items()},
+    )
+
+
+def stored_fleet_summary(now=None):
+    """The summary rows and minute buckets as stored, in the shape of compute_fleet_summary()."""
+    now = now or timezone.now()
+    since = floor_minute(now) - SUMMARY_WINDOW + timedelta(minutes=1)
+    counts = {
+        (dimension, value): (up, down)
+        for dimension, value, up, down in FleetSummaryCount.objects.exclude(up=0, down=0).values_list(
+            'dimension', 'value', 'up', 'down',
+        )
+    }
+    minutes = {
+        minute: (added, lost)
+        for minute, added, lost in FleetChangeMinute.objects.filter(minute__gte=since).exclude(
+            added=0, lost=0,
+        ).values_list('minute', 'added', 'lost')
+    }
+    return counts, minutes
+
+
+def check_fleet_summary(now=None):
+    """Return a line per summary row or minute bucket that differs from the devices' actual state."""
+    now = now or timezone.now()
+    expected_counts, expected_minutes = compute_fleet_summary(now)
+    stored_counts, stored_minutes = stored_fleet_summary(now)
+    problems = []
+    for key in sorted(set(expected_counts) | set(stored_counts)):
+        expected, stored = expected_counts.get(key, (0, 0)), stored_counts.get(key, (0, 0))
+        if expected != stored:
+            problems.append(f"{key[0]} {key[1]!r}: stored {stored[0]} up/{stored[1]} down, "
+                            f"actual {expected[0]} up/{expected[1]} down")
+    for minute in sorted(set(expected_minutes) | set(stored_minutes)):
+        expected, stored = expected_minutes.get(minute, (0, 0)), stored_minutes.get(minute, (0, 0))
+        if expected != stored:
+            problems.append(f"minute {minute.isoformat()}: stored {stored[0]} added/{stored[1]} lost, "
+                            f"actual {expected[0]} added/{expected[1]} lost")
+    return problems
+
+
+def rebuild_fleet_summary(now=None):
+    """Replace the summary rows and minute buckets with ones derived from the devices."""
+    now = now or timezone.now()
+    with transaction.atomic():
+        counts, minutes = compute_fleet_summary(now)
+        FleetSummaryCount.objects.all().delete()
+        FleetChangeMinute.objects.all().delete()
+        FleetSummaryCount.objects.bulk_create([
+            FleetSummaryCount(dimension=dimension, value=value, up=up, down=down)
+            for (dimension, value), (up, down) in counts.items()
+        ], batch_size=SUMMARY_BATCH)
+        FleetChangeMinute.objects.bulk_create([
+            FleetChangeMinute(minute=minute, added=added, lost=lost) for minute, (added, lost) in minutes.items()
+        ], batch_size=SUMMARY_BATCH)
+    return len(counts), len(minutes)
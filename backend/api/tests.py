@@ -1,3 +1,1590 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import os
+import tempfile
+import time
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.db.models import Count, F
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from .archive import ARCHIVE_HOURS, archive_pings
+from .delta import device_state, state_digest
+from .export import EXPORT_FIELDS
+from .ingest import INGEST_BATCH, ingest_scan, ingest_scans, normalize_device
+from .fleet import run_fleet_command
+from .ingest_queue import IngestQueue
+from .metrics import Histogram
+from .latency import SAMPLE, normalize_probes, record_probes, rollup_latency
+from .scan_stream import apply_stream_batch
+from .summary import check_fleet_summary
+from .renderers import msgpack
+from .serializers import DeviceStatusSerializer, ScanLogSerializer, ScanTimelineSerializer
+from .streams import ID_BASE, assign_stream_ids, free_stream_ids
+from .events import RESYNC, SUBSCRIBER_QUEUE_SIZE, broadcaster, status_event_stream
+from .models import (
+    ScanLog, PingLog, DeviceStatus, PingSegment, DeviceStatusTransition, ScanAgent, ScanSession,
+    FleetCommand, FleetCommandResult, LatencySamples, LatencyRollup, ScanStream, FleetChangeMinute, ScanReportKey,
+    FleetSummaryCount,
+)
+
+
+def make_devices(count, start=0, **extra):
+    """Build a scanner-style device list with sequential MACs and IPs."""
+    return [
+        {
+            "ssid": "cam",
+            "mac_address": f"00:00:00:00:{(i >> 8) & 0xff:02x}:{i & 0xff:02x}",
+            "ip_address": f"10.0.{(i >> 8) & 0xff}.{i & 0xff}",
+            "location": f"loc-{i % 3}",
+            "version": "1.0",
+            **extra,
+        }
+        for i in range(start, start + count)
+    ]
+
+
+class StatusVersionFileMixin:
+    """Point STATUS_VERSION_FILE at a temporary file for tests that run on-commit callbacks."""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        settings_override = override_settings(STATUS_VERSION_FILE=os.path.join(tmp.name, "status_version"))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+
+class CreateScanTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def post_scan(self, devices):
+        response = self.client.post('/api/scans/', {"devices": devices}, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response
+
+    def test_new_devices_are_created_up(self):
+        self.post_scan(make_devices(3))
+        self.assertEqual(ScanLog.objects.count(), 1)
+        self.assertEqual(PingLog.objects.count(), 3)
+        self.assertEqual(DeviceStatus.objects.filter(is_up=True).count(), 3)
+        for device in DeviceStatus.objects.all():
+            self.assertIsNotNone(device.initial_uptime)
+            self.assertEqual(device.initial_uptime, device.last_seen)
+
+    def test_short_keys_are_accepted(self):
+        self.post_scan([{"mac": "aa:bb:cc:dd:ee:ff", "ip": "10.1.1.1"}])
+        device = DeviceStatus.objects.get(mac_address="aa:bb:cc:dd:ee:ff")
+        self.assertEqual(device.ip_address, "10.1.1.1")
+        self.assertEqual(device.location, "")
+
+    def test_up_device_keeps_initial_uptime(self):
+        self.post_scan(make_devices(1))
+        first = DeviceStatus.objects.get()
+        self.post_scan(make_devices(1, location="moved"))
+        second = DeviceStatus.objects.get()
+        self.assertEqual(second.initial_uptime, first.initial_uptime)
+        self.assertGreater(second.last_seen, first.last_seen)
+        self.assertEqual(second.location, "moved")
+
+    def test_missing_device_goes_down_and_recovers(self):
+        self.post_scan(make_devices(2))
+        self.post_scan(make_devices(1))
+        down = DeviceStatus.objects.get(mac_address=make_devices(2)[1]["mac_address"])
+        last_seen = down.last_seen
+        self.assertFalse(down.is_up)
+        self.assertIsNone(down.initial_uptime)
+
+        self.post_scan(make_devices(2))
+        down.refresh_from_db()
+        self.assertTrue(down.is_up)
+        self.assertGreater(down.last_seen, last_seen)
+        self.assertEqual(down.initial_uptime, down.last_seen)
+
+    def test_stream_id_is_preserved(self):
+        self.post_scan(make_devices(1))
+        DeviceStatus.objects.update(stream_id=6001)
+        self.post_scan(make_devices(1))
+        self.assertEqual(DeviceStatus.objects.get().stream_id, 6001)
+
+    def test_query_count_grows_with_the_number_of_batches_only(self):
+        counts = []
+        for size in (2, INGEST_BATCH, 10 * INGEST_BATCH + 1):  # The last one takes 11 batches
+            DeviceStatus.objects.all().delete()
+            # Half of the fleet already exists, one of them down
+            self.post_scan(make_devices(size // 2))
+            DeviceStatus.objects.filter(pk=DeviceStatus.objects.first().pk).update(
+                is_up=False, last_seen=timezone.now() - timedelta(hours=1)
+            )
+            with CaptureQueriesContext(connection) as ctx:
+                self.post_scan(make_devices(size))
+            counts.append(len(ctx.captured_queries))
+        self.assertEqual(counts[0], counts[1])
+        # Includes allocating stream IDs for the new devices and updating the fleet summary
+        self.assertLessEqual(counts[1], 17)
+        # Past one batch, only the batched pings, upserts, transitions and stream IDs add statements
+        self.assertLessEqual(counts[2], counts[1] - 4 + 4 * 11)
+
+
+class GetScansTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        for size in (3, 2, 1):
+            self.client.post('/api/scans/', {"devices": make_devices(size)}, format='json')
+
+    def test_pages_follow_cursor_newest_first(self):
+        response = self.client.get('/api/scans/reports/', {"limit": 2})
+        self.assertEqual(response.status_code, 200)
+        first = response.data
+        self.assertEqual([len(scan["pings"]) for scan in first["results"]], [1, 2])
+        self.assertIsNotNone(first["next_cursor"])
+
+        second = self.client.get('/api/scans/reports/', {"limit": 2, "cursor": first["next_cursor"]}).data
+        self.assertEqual([len(scan["pings"]) for scan in second["results"]], [3])
+        self.assertIsNone(second["next_cursor"])
+
+    def test_query_count_is_independent_of_page_size(self):
+        for _ in range(20):
+            self.client.post('/api/scans/', {"devices": make_devices(5)}, format='json')
+        with self.assertNumQueries(2):
+            self.client.get('/api/scans/reports/', {"limit": 2})
+        with self.assertNumQueries(2):
+            self.client.get('/api/scans/reports/', {"limit": 20})
+
+    def test_mac_address_filter_limits_scans_and_pings(self):
+        mac_address = make_devices(3)[2]["mac_address"]
+        results = self.client.get('/api/scans/reports/', {"mac_address": mac_address}).data["results"]
+        self.assertEqual(len(results), 1)
+        self.assertEqual([ping["mac_address"] for ping in results[0]["pings"]], [mac_address])
+
+    def test_time_filters(self):
+        oldest = ScanLog.objects.order_by('timestamp').first()
+        ScanLog.objects.filter(pk=oldest.pk).update(timestamp=timezone.now() - timedelta(days=2))
+        since = (timezone.now() - timedelta(days=1)).isoformat()
+        results = self.client.get('/api/scans/reports/', {"since": since}).data["results"]
+        self.assertEqual(len(results), 2)
+        results = self.client.get('/api/scans/reports/', {"until": since}).data["results"]
+        self.assertEqual([scan["id"] for scan in results], [oldest.pk])
+
+    def test_timeline_without_pings(self):
+        results = self.client.get('/api/scans/reports/', {"pings": "false"}).data["results"]
+        self.assertEqual([scan["device_count"] for scan in results], [1, 2, 3])
+        self.assertNotIn("pings", results[0])
+
+    def test_invalid_params_are_rejected(self):
+        for params in ({"since": "yesterday"}, {"limit": "x"}, {"cursor": "not-a-cursor"}):
+            response = self.client.get('/api/scans/reports/', params)
+            self.assertEqual(response.status_code, 400)
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.mac_address = make_devices(1)[0]["mac_address"]
+        for i in range(5):
+            devices = make_devices(2) if i % 2 == 0 else make_devices(1, location="moved")
+            self.client.post('/api/scans/', {"devices": devices}, format='json')
+        # Age everything but the newest scan past the archive window
+        old = timezone.now() - timedelta(hours=ARCHIVE_HOURS + 1)
+        newest = ScanLog.objects.latest('id')
+        ScanLog.objects.exclude(pk=newest.pk).update(timestamp=old)
+        PingLog.objects.exclude(scan=newest).update(timestamp=old)
+
+    def test_old_pings_are_compacted_into_segments(self):
+        archived, segments = archive_pings(segment_length=3)
+        self.assertEqual(archived, 6)
+        # Four pings of the first device give two segments, two pings of the second give one
+        self.assertEqual(segments, 3)
+        self.assertEqual(PingLog.objects.count(), 2)
+        # Scans are kept without their pings
+        self.assertEqual(ScanLog.objects.count(), 5)
+        timeline = self.client.get('/api/scans/reports/', {"pings": "false"}).data["results"]
+        self.assertEqual([scan["device_count"] for scan in timeline], [2, 0, 0, 0, 0])
+
+        first = PingSegment.objects.filter(mac_address=self.mac_address).order_by('first_seen', 'id').first()
+        self.assertEqual(first.ping_count, 3)
+        self.assertEqual(first.scan_count, 3)
+        self.assertEqual(first.locations, ["loc-0", "moved"])
+        self.assertEqual(first.ip_addresses, ["10.0.0.0"])
+
+        second_device = PingSegment.objects.exclude(mac_address=self.mac_address).get()
+        self.assertEqual((second_device.ping_count, second_device.scan_count), (2, 3))
+
+    def test_archiving_is_idempotent(self):
+        archive_pings(segment_length=3)
+        self.assertEqual(archive_pings(segment_length=3), (0, 0))
+
+    def test_history_reads_across_pings_and_segments(self):
+        before = self.client.get(f'/api/devices/{self.mac_address}/history/').data["results"]
+        archive_pings(segment_length=3)
+        response = self.client.get(f'/api/devices/{self.mac_address}/history/', {"limit": 2})
+        self.assertEqual(response.status_code, 200)
+        page = response.data["results"]
+        self.assertEqual([entry["source"] for entry in page], ["ping", "segment"])
+
+        rest = self.client.get(
+            f'/api/devices/{self.mac_address}/history/', {"limit": 2, "cursor": response.data["next_cursor"]}
+        ).data
+        self.assertEqual([entry["source"] for entry in rest["results"]], ["segment"])
+        self.assertIsNone(rest["next_cursor"])
+        self.assertEqual(sum(entry["ping_count"] for entry in page + rest["results"]), len(before))
+
+
+class AvailabilityTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.mac_address = make_devices(1)[0]["mac_address"]
+
+    def test_scans_record_transitions(self):
+        for devices in (make_devices(2), make_devices(1), make_devices(1), make_devices(2)):
+            self.client.post('/api/scans/', {"devices": devices}, format='json')
+        flips = DeviceStatusTransition.objects.exclude(mac_address=self.mac_address).order_by('id')
+        self.assertEqual([t.is_up for t in flips], [True, False, True])
+        self.assertEqual(DeviceStatusTransition.objects.filter(mac_address=self.mac_address).count(), 1)
+
+    def test_manual_status_update_records_transition(self):
+        self.client.post('/api/scans/', {"devices": make_devices(1)}, format='json')
+        self.client.patch(f'/api/devices/{self.mac_address}/status/', {"location": "x"}, format='json')
+        self.client.patch(f'/api/devices/{self.mac_address}/status/', {"is_up": False}, format='json')
+        self.assertEqual(
+            list(DeviceStatusTransition.objects.order_by('id').values_list('is_up', flat=True)), [True, False]
+        )
+
+    def test_availability_from_transitions(self):
+        start = timezone.now() - timedelta(hours=10)
+        DeviceStatus.objects.create(mac_address=self.mac_address, ip_address="10.0.0.1", location="a",
+                                    is_up=True, last_seen=start)
+        for hours, is_up in ((0, True), (2, False), (3, True), (6, False), (9, True)):
+            DeviceStatusTransition.objects.create(mac_address=self.mac_address, is_up=is_up,
+                                                  timestamp=start + timedelta(hours=hours))
+
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/devices/availability/', {
+                "since": (start + timedelta(hours=1)).isoformat(),
+                "until": (start + timedelta(hours=10)).isoformat(),
+            })
+        result = response.data["results"][0]
+        # Up 1h + 3h + 1h out of 9h, down 1h and 3h
+        self.assertAlmostEqual(result["uptime_percent"], 100 * 5 / 9)
+        self.assertEqual(result["outage_count"], 2)
+        self.assertEqual(result["longest_outage_seconds"], 3 * 3600)
+        self.assertEqual(result["mtbf_seconds"], 5 * 3600 / 2)
+
+        by_location = self.client.get('/api/devices/availability/', {
+            "since": start.isoformat(), "until": (start + timedelta(hours=10)).isoformat(), "group_by": "location",
+        }).data["results"]
+        self.assertEqual(by_location[0]["location"], "a")
+        self.assertEqual(by_location[0]["device_count"], 1)
+        self.assertAlmostEqual(by_location[0]["uptime_percent"], 60)
+
+    def test_outage_in_progress_at_window_start(self):
+        start = timezone.now() - timedelta(hours=4)
+        DeviceStatus.objects.create(mac_address=self.mac_address, ip_address="10.0.0.1", is_up=True, last_seen=start)
+        DeviceStatusTransition.objects.create(mac_address=self.mac_address, is_up=False, timestamp=start)
+        DeviceStatusTransition.objects.create(mac_address=self.mac_address, is_up=True,
+                                              timestamp=start + timedelta(hours=3))
+        result = self.client.get('/api/devices/availability/', {
+            "since": (start + timedelta(hours=1)).isoformat(),
+            "until": (start + timedelta(hours=4)).isoformat(),
+        }).data["results"][0]
+        self.assertEqual(result["outage_count"], 1)
+        self.assertEqual(result["longest_outage_seconds"], 2 * 3600)
+        self.assertIsNone(result["mtbf_seconds"])
+
+
+class DeviceStatusCacheTests(StatusVersionFileMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+
+    def post_scan(self, devices):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/scans/', {"devices": devices}, format='json')
+
+    def test_unchanged_poll_is_not_modified_without_queries(self):
+        self.post_scan(make_devices(2))
+        response = self.client.get('/api/devices/statuses/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 2)
+        etag = response.headers["ETag"]
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/devices/statuses/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        with mock.patch('api.views.time.time', return_value=time.time() + 1), self.assertNumQueries(0):
+            response = self.client.get('/api/devices/statuses/', HTTP_IF_NONE_MATCH=etag)
+            response = self.client.get('/api/devices/statuses/',
+                                       HTTP_IF_MODIFIED_SINCE=response.headers["Last-Modified"])
+        self.assertEqual(response.status_code, 304)
+
+    def test_if_modified_since_sees_changes_within_the_same_second(self):
+        self.post_scan(make_devices(2))
+        with open(settings.STATUS_VERSION_FILE, 'w') as f:
+            f.write("5 1000.2")
+        response = self.client.get('/api/devices/statuses/')
+        self.assertEqual(response["Last-Modified"], "Thu, 01 Jan 1970 00:16:41 GMT")
+
+        def poll(since):
+            return self.client.get('/api/devices/statuses/', HTTP_IF_MODIFIED_SINCE=since).status_code
+
+        self.assertEqual(poll(response["Last-Modified"]), 304)
+        # A change later in the same second as the client's copy
+        with open(settings.STATUS_VERSION_FILE, 'w') as f:
+            f.write("6 1000.7")
+        self.assertEqual(poll("Thu, 01 Jan 1970 00:16:40 GMT"), 200)
+        # If-None-Match wins over If-Modified-Since
+        self.assertEqual(self.client.get('/api/devices/statuses/', HTTP_IF_NONE_MATCH='"other"',
+                                         HTTP_IF_MODIFIED_SINCE=response["Last-Modified"]).status_code, 200)
+
+        # A copy served within the second of its change has no Last-Modified to revalidate with
+        with open(settings.STATUS_VERSION_FILE, 'w') as f:
+            f.write(f"7 {time.time():.6f}")
+        self.assertNotIn("Last-Modified", self.client.get('/api/devices/statuses/'))
+
+    def test_snapshot_is_reused_until_a_change_is_published(self):
+        self.post_scan(make_devices(2))
+        self.client.get('/api/devices/statuses/')
+        with self.assertNumQueries(0):
+            self.client.get('/api/devices/statuses/')
+
+        self.post_scan(make_devices(1))
+        response = self.client.get('/api/devices/statuses/')
+        self.assertEqual(sorted(device["is_up"] for device in response.data), [False, True])
+
+    def test_manual_update_invalidates_only_on_change(self):
+        self.post_scan(make_devices(1))
+        mac_address = make_devices(1)[0]["mac_address"]
+        etag = self.client.get('/api/devices/statuses/').headers["ETag"]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/api/devices/{mac_address}/status/', {"location": "loc-0"}, format='json')
+        self.assertEqual(self.client.get('/api/devices/statuses/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/api/devices/{mac_address}/status/', {"location": "lab"}, format='json')
+        response = self.client.get('/api/devices/statuses/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]["location"], "lab")
+
+    def test_admin_edits_invalidate(self):
+        self.post_scan(make_devices(2))
+        device = DeviceStatus.objects.order_by('mac_address').first()
+        etag = self.client.get('/api/devices/statuses/').headers["ETag"]
+        self.client.force_login(User.objects.create_superuser("admin", password="pw"))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/admin/api/devicestatus/{device.pk}/change/', {
+                "mac_address": device.mac_address, "ip_address": device.ip_address, "location": "lab",
+                "version": device.version, "is_up": "on", "last_seen_0": device.last_seen.strftime("%Y-%m-%d"),
+                "last_seen_1": device.last_seen.strftime("%H:%M:%S"), "stream_id": device.stream_id,
+            })
+        self.assertEqual(response.status_code, 302)
+        response = self.client.get('/api/devices/statuses/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]["location"], "lab")
+
+        etag = response.headers["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/admin/api/devicestatus/{device.pk}/delete/', {"post": "yes"})
+        response = self.client.get('/api/devices/statuses/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, len(response.data)), (200, 1))
+
+    def test_migrations_change_the_etag(self):
+        self.post_scan(make_devices(1))
+        etag = self.client.get('/api/devices/statuses/').headers["ETag"]
+        latest = max(path.name for path in (Path(__file__).parent / "migrations").glob("0*.py"))
+        self.assertTrue(etag.startswith(f'"statuses-{latest[:4]}-'))
+        with mock.patch('api.snapshot.representation_generation', return_value="9999"):
+            self.assertEqual(self.client.get('/api/devices/statuses/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class StatusEventTests(StatusVersionFileMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+
+    @staticmethod
+    def read_events(count, last_event_id=None, before=None):
+        async def run():
+            stream = status_event_stream(last_event_id)
+            events = [await stream.__anext__()]
+            if before:
+                await sync_to_async(before)()
+            while len(events) < count:
+                events.append(await stream.__anext__())
+            await stream.aclose()
+            return events
+        return async_to_sync(run)()
+
+    def test_scan_publishes_only_changed_devices(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/scans/', {"devices": make_devices(2)}, format='json')
+        seq = broadcaster.seq
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/scans/', {"devices": make_devices(2)}, format='json')
+        self.assertEqual(broadcaster.seq, seq)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/scans/', {"devices": make_devices(1, location="moved")}, format='json')
+        records = broadcaster.buffer[-1][2]
+        self.assertEqual([(r["location"], r["is_up"]) for r in records], [("moved", True), ("loc-1", False)])
+
+    def test_stream_starts_with_snapshot_then_updates(self):
+        self.client.post('/api/scans/', {"devices": make_devices(2)}, format='json')
+
+        def change():
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post('/api/scans/', {"devices": make_devices(1)}, format='json')
+
+        snapshot, update = self.read_events(2, before=change)
+        self.assertTrue(snapshot.startswith("event: snapshot\n"))
+        self.assertEqual(len(json.loads(snapshot.split("data: ", 1)[1])), 2)
+        self.assertTrue(update.startswith("event: update\n"))
+        self.assertIn(f"id: {broadcaster.event_id(broadcaster.seq)}\n", update)
+
+    def test_scans_without_changes_do_not_resync_streams(self):
+        self.client.post('/api/scans/', {"devices": make_devices(2)}, format='json')
+
+        def rescan():
+            for _ in range(3):
+                with self.captureOnCommitCallbacks(execute=True):
+                    self.client.post('/api/scans/', {"devices": make_devices(2)}, format='json')
+
+        with mock.patch('api.events.VERSION_POLL_SECONDS', 0.01), mock.patch('api.events.KEEPALIVE_SECONDS', 0.01):
+            snapshot, keepalive = self.read_events(2, before=rescan)
+        self.assertTrue(snapshot.startswith("event: snapshot\n"))
+        self.assertEqual(keepalive, ": keepalive\n\n")
+
+        # A bump by another process still resyncs the stream
+        def external_bump():
+            with open(settings.STATUS_VERSION_FILE, 'w') as f:
+                f.write("1000 1.0")
+
+        with mock.patch('api.events.VERSION_POLL_SECONDS', 0.01):
+            snapshot, resync = self.read_events(2, before=external_bump)
+        self.assertTrue(resync.startswith("event: snapshot\n"))
+
+    def test_stream_resumes_from_last_event_id(self):
+        start = broadcaster.event_id(broadcaster.seq)
+        broadcaster.publish([{"mac_address": "a"}])
+        broadcaster.publish([{"mac_address": "b"}])
+        events = self.read_events(2, last_event_id=start)
+        self.assertEqual([json.loads(e.split("data: ", 1)[1])[0]["mac_address"] for e in events], ["a", "b"])
+
+    def test_unknown_event_id_gets_snapshot(self):
+        (event,) = self.read_events(1, last_event_id="stale:3")
+        self.assertTrue(event.startswith("event: snapshot\n"))
+
+    def test_slow_subscriber_is_switched_to_resync(self):
+        async def run():
+            subscriber, _ = broadcaster.subscribe()
+            broadcaster.unsubscribe(subscriber)
+            for seq in range(SUBSCRIBER_QUEUE_SIZE + 5):
+                subscriber.offer((seq, None, []))
+            return [await subscriber.get() for _ in range(subscriber.queue.qsize())]
+        self.assertEqual(async_to_sync(run)(), [RESYNC])
+
+    def test_wsgi_request_is_rejected(self):
+        self.assertEqual(self.client.get('/api/devices/statuses/events/').status_code, 501)
+
+
+class ScopedScanTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        # Devices 0-1 live in 10.0.0.0/24, devices 256-257 in 10.0.1.0/24
+        self.vlan0 = make_devices(2)
+        self.vlan1 = make_devices(2, start=256)
+
+    def post_scan(self, devices, scope=None):
+        data = {"devices": devices}
+        if scope is not None:
+            data["scope"] = scope
+        return self.client.post('/api/scans/', data, format='json')
+
+    def up_macs(self):
+        return set(DeviceStatus.objects.filter(is_up=True).values_list('mac_address', flat=True))
+
+    def test_agents_only_mark_down_devices_in_their_scope(self):
+        self.post_scan(self.vlan0, {"agent_id": "a", "cidrs": ["10.0.0.0/24"]})
+        self.post_scan(self.vlan1, {"agent_id": "b", "cidrs": ["10.0.1.0/24"]})
+        self.assertEqual(len(self.up_macs()), 4)
+
+        self.post_scan(self.vlan0[:1], {"agent_id": "a"})
+        self.assertEqual(
+            self.up_macs(), {self.vlan0[0]["mac_address"]} | {device["mac_address"] for device in self.vlan1}
+        )
+        self.assertEqual(ScanLog.objects.filter(agent_id="a").count(), 2)
+
+    def test_unscoped_report_marks_everything_down(self):
+        self.post_scan(self.vlan0 + self.vlan1)
+        self.post_scan(self.vlan0)
+        self.assertEqual(self.up_macs(), {device["mac_address"] for device in self.vlan0})
+
+    def test_invalid_scope_is_rejected(self):
+        for scope in ({"agent_id": "new"}, {"cidrs": ["10.0.0.300/24"]}, {"cidrs": "10.0.0.0/24"}, []):
+            self.assertEqual(self.post_scan(self.vlan0, scope).status_code, 400)
+        self.assertFalse(DeviceStatus.objects.exists())
+
+    def test_stalled_agent_flags_its_devices_stale(self):
+        self.post_scan(self.vlan0, {"agent_id": "a", "cidrs": ["10.0.0.0/24"]})
+        self.post_scan(self.vlan1, {"agent_id": "b", "cidrs": ["10.0.1.0/24"]})
+        ScanAgent.objects.filter(agent_id="a").update(last_report=timezone.now() - timedelta(minutes=5))
+
+        self.post_scan(self.vlan1, {"agent_id": "b"})
+        stale = set(DeviceStatus.objects.filter(is_stale=True).values_list('mac_address', flat=True))
+        self.assertEqual(stale, {device["mac_address"] for device in self.vlan0})
+        self.assertEqual(len(self.up_macs()), 4)
+        agents = self.client.get('/api/scans/agents/').data
+        self.assertEqual([(agent["agent_id"], agent["is_stale"]) for agent in agents], [("a", True), ("b", False)])
+
+        self.post_scan(self.vlan0[:1], {"agent_id": "a"})
+        self.assertFalse(DeviceStatus.objects.filter(is_stale=True).exists())
+        self.assertFalse(ScanAgent.objects.filter(is_stale=True).exists())
+
+
+class DeltaScanTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.seq = 0
+
+    def post(self, payload):
+        return self.client.post('/api/scans/delta/', payload, format='json')
+
+    def digest(self, devices):
+        return state_digest(device_state([normalize_device(device) for device in devices]))
+
+    def keyframe(self, devices):
+        self.seq += 1
+        response = self.post({"full": True, "seq": self.seq, "devices": devices})
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def delta(self, state, added=(), changed=(), removed=(), seq=None):
+        self.seq += 1
+        return self.post({
+            "seq": self.seq if seq is None else seq, "digest": self.digest(state),
+            "added": list(added), "changed": list(changed), "removed": list(removed),
+        })
+
+    def test_delta_only_writes_changed_devices(self):
+        devices = make_devices(3)
+        self.keyframe(devices)
+        self.assertEqual(PingLog.objects.count(), 3)
+        # The first delta after a keyframe opens a ping segment per device
+        self.assertEqual(self.delta(devices).status_code, 200)
+        self.assertEqual(PingSegment.objects.filter(session__isnull=False).count(), 3)
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.delta(devices)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(any(query["sql"].startswith(('UPDATE "api_devicestatus"', 'INSERT INTO "api_pinglog"',
+                                                      'INSERT INTO "api_pingsegment"'))
+                             for query in ctx.captured_queries))
+        previous_report = ScanSession.objects.get().last_report
+        self.assertEqual(set(PingSegment.objects.values_list('last_seen', 'ping_count', 'scan_count')),
+                         {(previous_report, 2, 2)})
+
+        moved = dict(devices[0], location="moved")
+        new = make_devices(1, start=10)[0]
+        state = [moved, devices[1], new]
+        self.assertEqual(self.delta(state, added=[new], changed=[moved], removed=[devices[2]["mac_address"]])
+                         .status_code, 200)
+        self.assertEqual(PingLog.objects.count(), 3)
+        self.assertEqual(ScanLog.objects.filter(kind=ScanLog.DELTA).count(), 3)
+        self.assertEqual(ScanLog.objects.latest('id').reported_devices, 3)
+        now = ScanSession.objects.get().last_report
+        open_segments = PingSegment.objects.filter(session__isnull=False)
+        self.assertEqual(
+            sorted(open_segments.values_list('mac_address', 'ping_count', 'locations')),
+            sorted([(moved["mac_address"], 1, ["moved"]), (devices[1]["mac_address"], 3, ["loc-1"]),
+                    (new["mac_address"], 1, [new["location"]])]),
+        )
+        # Closed segments end at the last report that found the device unchanged
+        self.assertEqual(set(PingSegment.objects.filter(session__isnull=True).values_list('mac_address', 'last_seen')),
+                         {(devices[0]["mac_address"], previous_report), (devices[2]["mac_address"], previous_report)})
+        self.assertEqual(PingSegment.objects.filter(last_seen=now).count(), 3)
+
+        gone = DeviceStatus.objects.get(mac_address=devices[2]["mac_address"])
+        self.assertFalse(gone.is_up)
+        self.assertEqual(gone.last_seen, previous_report)
+        self.assertEqual(DeviceStatus.objects.get(mac_address=devices[0]["mac_address"]).location, "moved")
+        self.assertEqual(DeviceStatus.objects.filter(is_up=True).count(), 3)
+
+        # A keyframe logs pings again and closes the segments
+        self.keyframe(state)
+        self.assertEqual(PingLog.objects.count(), 6)
+        self.assertFalse(PingSegment.objects.filter(session__isnull=False).exists())
+
+    def test_delta_scans_in_history_scan_list_and_export(self):
+        devices = make_devices(2)
+        self.keyframe(devices)
+        self.delta(devices)
+        self.delta(devices)
+        mac_address = devices[0]["mac_address"]
+
+        history = self.client.get(f'/api/devices/{mac_address}/history/').data["results"]
+        self.assertEqual([(entry["source"], entry["ping_count"], entry["open"]) for entry in history],
+                         [('segment', 2, True), ('ping', 1, False)])
+
+        scans = self.client.get('/api/scans/reports/', {"pings": "false"}).data["results"]
+        self.assertEqual([scan["device_count"] for scan in scans], [2, 2, 2])
+
+        response = self.client.get('/api/scans/export/', {"rows": "segments", "mac_address": mac_address})
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual([(row["ping_count"], json.loads(row["ip_addresses"])) for row in rows],
+                         [("2", [devices[0]["ip_address"]])])
+        scans = self.client.get('/api/scans/export/', {"rows": "scans", "output": "ndjson"})
+        self.assertEqual([json.loads(line)["device_count"] for line in b''.join(scans.streaming_content).splitlines()],
+                         [2, 2, 2])
+
+    def test_gap_and_digest_mismatch_require_resync(self):
+        devices = make_devices(2)
+        self.keyframe(devices)
+        response = self.delta(devices, seq=5)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data["expected_seq"], 2)
+
+        self.seq = 1
+        response = self.delta(devices[:1])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data["reason"], "digest mismatch")
+        # Nothing was applied
+        self.assertEqual(DeviceStatus.objects.filter(is_up=True).count(), 2)
+
+        self.keyframe(devices[:1])
+        self.assertEqual(DeviceStatus.objects.filter(is_up=True).count(), 1)
+        self.assertEqual(self.delta(devices[:1]).status_code, 200)
+
+    def test_unknown_session_requires_resync(self):
+        self.assertEqual(self.delta([]).status_code, 409)
+
+
+class BatchScanTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def post(self, reports):
+        return self.client.post('/api/scans/batch/', {"reports": reports}, format='json')
+
+    def test_reports_are_applied_in_order_at_their_scan_time(self):
+        first = timezone.now() - timedelta(minutes=10)
+        second = first + timedelta(minutes=5)
+        response = self.post([
+            {"key": "a", "devices": make_devices(2), "scanned_at": first.isoformat()},
+            {"key": "b", "devices": make_devices(1), "scanned_at": second.isoformat()},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result["status"] for result in response.data["results"]], ["applied", "applied"])
+        self.assertEqual(list(ScanLog.objects.order_by('id').values_list('timestamp', flat=True)), [first, second])
+        self.assertEqual(PingLog.objects.filter(timestamp=first).count(), 2)
+
+        gone = DeviceStatus.objects.get(mac_address=make_devices(2)[1]["mac_address"])
+        self.assertFalse(gone.is_up)
+        went_down = DeviceStatusTransition.objects.get(mac_address=gone.mac_address, is_up=False)
+        self.assertEqual(went_down.timestamp, second)
+        self.assertEqual(DeviceStatus.objects.get(mac_address=make_devices(1)[0]["mac_address"]).last_seen, second)
+
+    def test_resent_keys_are_skipped(self):
+        self.assertEqual(self.post([{"key": "a", "devices": make_devices(2)}]).status_code, 200)
+        response = self.post([
+            {"key": "a", "devices": make_devices(2)},
+            {"key": "b", "devices": make_devices(1)},
+            {"key": "b", "devices": make_devices(1)},
+        ])
+        self.assertEqual([result["status"] for result in response.data["results"]],
+                         ["duplicate", "applied", "duplicate"])
+        self.assertEqual(ScanLog.objects.count(), 2)
+        self.assertEqual(ScanReportKey.objects.count(), 2)
+
+    def test_invalid_reports_are_rejected_alone(self):
+        response = self.post([
+            {"key": "a", "devices": "nope"},
+            {"key": "b", "devices": make_devices(1), "scope": {"cidrs": ["bad"]}},
+            {"key": "c", "devices": make_devices(1), "scanned_at": "yesterday"},
+            {"key": "d", "devices": make_devices(1)},
+            {"key": "e", "devices": [{"ip_address": "10.0.0.2"}]},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result["status"] for result in response.data["results"]],
+                         ["rejected", "rejected", "rejected", "applied", "rejected"])
+        self.assertEqual(ScanLog.objects.count(), 1)
+        self.assertEqual(self.post([{"devices": []}]).status_code, 400)
+        self.assertEqual(self.client.post('/api/scans/batch/', {"reports": {}}, format='json').status_code, 400)
+
+    def test_failing_report_is_rejected_alone(self):
+        def fail_first(devices, *args):
+            if not devices:
+                DeviceStatus.objects.create(mac_address="bad", ip_address="10.9.9.9", last_seen=timezone.now())
+                raise ValueError("boom")
+            return ingest_scan(devices, *args)
+
+        with mock.patch('api.batch.ingest_scan', fail_first), self.assertLogs('api.batch', 'ERROR'):
+            response = self.post([{"key": "a", "devices": []}, {"key": "b", "devices": make_devices(1)}])
+        self.assertEqual([result["status"] for result in response.data["results"]], ["rejected", "applied"])
+        self.assertEqual(list(ScanReportKey.objects.values_list('key', flat=True)), ["b"])
+        # The failed report's writes were rolled back with its savepoint
+        self.assertFalse(DeviceStatus.objects.filter(mac_address="bad").exists())
+
+    def test_late_report_does_not_override_newer_state(self):
+        devices = make_devices(3)
+        self.client.post('/api/scans/', {"devices": devices[:2]}, format='json')
+        self.client.post('/api/scans/', {"devices": devices[:1]}, format='json')
+        before = {device.mac_address: device for device in DeviceStatus.objects.all()}
+
+        # Scanned before both reports: device 0 is missing and devices 1 and 2 are up
+        scanned_at = timezone.now() - timedelta(minutes=5)
+        response = self.post([{"key": "late", "devices": devices[1:], "scanned_at": scanned_at.isoformat()}])
+        self.assertEqual(response.data["results"][0]["status"], "applied")
+        self.assertEqual(PingLog.objects.filter(timestamp=scanned_at).count(), 2)
+
+        statuses = {device.mac_address: (device.is_up, device.last_seen) for device in DeviceStatus.objects.all()}
+        self.assertEqual(statuses[devices[0]["mac_address"]], (True, before[devices[0]["mac_address"]].last_seen))
+        self.assertFalse(statuses[devices[1]["mac_address"]][0])
+        # A device no newer report covered is still updated
+        self.assertEqual(statuses[devices[2]["mac_address"]], (True, scanned_at))
+
+    def test_future_scan_time_is_clamped_and_old_keys_are_pruned(self):
+        ScanReportKey.objects.create(key="old", received=timezone.now() - timedelta(days=30))
+        later = timezone.now() + timedelta(hours=1)
+        self.post([{"key": "a", "devices": make_devices(1), "scanned_at": later.isoformat()}])
+        self.assertLessEqual(ScanLog.objects.get().timestamp, timezone.now())
+        self.assertEqual(list(ScanReportKey.objects.values_list('key', flat=True)), ["a"])
+
+
+def fake_device_response(ip_address, endpoint, payload, timeout=5, session=None):
+    if ip_address.endswith('.1'):
+        return {"ip": ip_address, "success": False, "status_code": 500, "error": "500 Server Error"}
+    if ip_address.endswith('.2'):
+        time.sleep(1)
+    return {"ip": ip_address, "success": True, "status_code": 200, "response": {"applied": payload}}
+
+
+@mock.patch('api.fleet.send_request_to_device', fake_device_response)
+class FleetCommandTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.post('/api/scans/', {"devices": make_devices(6)}, format='json')
+        DeviceStatus.objects.filter(ip_address='10.0.0.5').update(is_up=False)
+
+    def send(self, body):
+        response = self.client.post('/api/devices/commands/', body, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        return [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+
+    def test_streams_results_of_up_target_devices(self):
+        lines = self.send({
+            "endpoint": "/settings", "payload": {"ir": "on"},
+            "targets": {"mac_addresses": ["00:00:00:00:00:00", "00:00:00:00:00:01", "00:00:00:00:00:05"]},
+        })
+        job = FleetCommand.objects.get()
+        self.assertEqual(lines[0], {"job": job.pk, "device_count": 2})
+        results = {line['mac_address']: line for line in lines[1:-1]}
+        self.assertEqual(set(results), {"00:00:00:00:00:00", "00:00:00:00:00:01"})
+        self.assertEqual(results["00:00:00:00:00:00"]["response"], {"applied": {"ir": "on"}})
+        self.assertFalse(results["00:00:00:00:00:01"]["success"])
+        self.assertEqual(results["00:00:00:00:00:01"]["status_code"], 500)
+        self.assertEqual(lines[-1], {"job": job.pk, "status": "done", "succeeded": 1, "failed": 1})
+        self.assertEqual(FleetCommandResult.objects.filter(command=job).count(), 2)
+
+    async def test_results_stream_under_asgi(self):
+        response = await self.async_client.post(
+            '/api/devices/commands/', {"endpoint": "/settings", "targets": {"location": "loc-0"}},
+            content_type='application/json',
+        )
+        # Lines are sent as devices answer instead of after the whole fan-out
+        self.assertTrue(response.is_async)
+        lines = [json.loads(line) async for line in response.streaming_content]
+        self.assertEqual(lines[-1]["status"], "done")
+        self.assertEqual(len(lines), lines[0]["device_count"] + 2)
+
+    def test_devices_pending_at_deadline_fail(self):
+        lines = self.send({"endpoint": "/settings", "targets": {"location": "loc-2"}, "deadline": 0.3})
+        results = {line['ip_address']: line for line in lines[1:-1]}
+        self.assertEqual(set(results), {'10.0.0.2'})
+        self.assertEqual(results['10.0.0.2']['error'], 'Deadline exceeded')
+        self.assertEqual(lines[-1]['failed'], 1)
+
+    def test_background_job_can_be_polled(self):
+        with mock.patch('api.views.start_fleet_command') as start:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post('/api/devices/commands/', {
+                    "endpoint": "/settings", "targets": {"version": "1.0"}, "background": True,
+                }, format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['status'], 'pending')
+        self.assertEqual(response.data['device_count'], 5)
+        job = FleetCommand.objects.get(pk=response.data['id'])
+        start.assert_called_once_with(job, 32, 30)
+
+        list(run_fleet_command(job, deadline=0.3))
+        response = self.client.get(f'/api/devices/commands/{job.pk}/')
+        self.assertEqual(response.data['status'], 'done')
+        self.assertEqual((response.data['succeeded'], response.data['failed']), (3, 2))
+        self.assertEqual(len(response.data['results']), 5)
+
+    def test_rejects_untargeted_commands(self):
+        response = self.client.post('/api/devices/commands/', {"endpoint": "/settings"}, format='json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/devices/commands/', {"endpoint": "settings", "targets": {"location": "x"}}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(FleetCommand.objects.exists())
+
+
+class StreamIdTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def stream_ids(self):
+        return dict(DeviceStatus.objects.values_list('mac_address', 'stream_id'))
+
+    def test_new_devices_get_ids_from_base(self):
+        self.client.post('/api/scans/', {"devices": make_devices(3)}, format='json')
+        self.assertEqual(sorted(self.stream_ids().values()), [ID_BASE, ID_BASE + 1, ID_BASE + 2])
+
+        # Going down and coming back keeps the ID
+        before = self.stream_ids()
+        self.client.post('/api/scans/', {"devices": make_devices(1)}, format='json')
+        self.client.post('/api/scans/', {"devices": make_devices(3)}, format='json')
+        self.assertEqual(self.stream_ids(), before)
+
+    def test_ids_of_removed_devices_are_reused(self):
+        self.client.post('/api/scans/', {"devices": make_devices(3)}, format='json')
+        DeviceStatus.objects.filter(stream_id=ID_BASE + 1).delete()
+        self.client.post('/api/scans/', {"devices": make_devices(2, start=3)}, format='json')
+        self.assertEqual(sorted(self.stream_ids().values()), [ID_BASE + i for i in range(4)])
+
+    def test_allocation_retries_after_a_conflict(self):
+        self.client.post('/api/scans/', {"devices": make_devices(1)}, format='json')
+        DeviceStatus.objects.create(mac_address="aa:aa:aa:aa:aa:aa", ip_address="10.9.9.9", last_seen=timezone.now())
+        # The first attempt picks an ID another allocator already took
+        with mock.patch('api.streams.free_stream_ids', side_effect=[[ID_BASE], [ID_BASE + 1]]):
+            assigned = assign_stream_ids()
+        self.assertEqual(assigned, {"aa:aa:aa:aa:aa:aa": ID_BASE + 1})
+        self.assertEqual(free_stream_ids({ID_BASE, ID_BASE + 2}, 2), [ID_BASE + 1, ID_BASE + 3])
+
+    def test_janus_config_has_an_etag(self):
+        self.client.post('/api/scans/', {"devices": make_devices(2)}, format='json')
+        response = self.client.get('/api/streams/config/')
+        self.assertEqual(response.status_code, 200)
+        config = response.content.decode()
+        self.assertIn(f"stream-{ID_BASE}: {{", config)
+        self.assertIn(f"videoport = {ID_BASE + 1}", config)
+        self.assertIn('description = "loc-1"', config)
+
+        etag = response['ETag']
+        response = self.client.get('/api/streams/config/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.client.post('/api/scans/', {"devices": make_devices(3)}, format='json')
+        response = self.client.get('/api/streams/config/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+@override_settings(SCAN_INGEST_MODE='queue')
+class QueuedIngestTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        # Drained on the test thread instead of by the writer thread
+        self.queue = IngestQueue(maxsize=3)
+        self.queue.autostart = False
+        patcher = mock.patch('api.views.ingest_queue', self.queue)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post_scan(self, body):
+        return self.client.post('/api/scans/', body, format='json')
+
+    def test_reports_are_applied_by_the_writer(self):
+        response = self.post_scan({"devices": make_devices(2)})
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['queue_depth'], 1)
+        self.assertFalse(ScanLog.objects.exists())
+
+        self.queue.drain()
+        self.assertEqual(ScanLog.objects.count(), 1)
+        self.assertEqual(DeviceStatus.objects.filter(is_up=True).count(), 2)
+
+    def test_consecutive_reports_of_a_scope_are_coalesced(self):
+        self.post_scan({"devices": make_devices(3)})
+        self.post_scan({"devices": make_devices(1)})
+        self.post_scan({"devices": make_devices(1, start=5), "scope": {"agent_id": "a", "cidrs": ["10.0.0.0/24"]}})
+        stats = self.client.get('/api/scans/queue/').data
+        self.assertEqual((stats['mode'], stats['depth']), ('queue', 3))
+        self.assertGreaterEqual(stats['lag_seconds'], 0)
+
+        self.queue.drain()
+        # The first unscoped report was superseded by the second, but its scan is still logged
+        self.assertEqual(ScanLog.objects.count(), 3)
+        self.assertEqual(PingLog.objects.count(), 5)
+        self.assertEqual(DeviceStatus.objects.count(), 4)
+        # The scoped report marks down the device of its subnet it did not find
+        self.assertEqual(list(DeviceStatus.objects.filter(is_up=True).values_list('mac_address', flat=True)),
+                         [make_devices(1, start=5)[0]["mac_address"]])
+        stats = self.client.get('/api/scans/queue/').data
+        self.assertEqual((stats['depth'], stats['applied'], stats['coalesced'], stats['failed']), (0, 3, 1, 0))
+        self.assertEqual(stats['lag_seconds'], 0)
+
+    def test_coalesced_reports_keep_their_flaps_and_receive_times(self):
+        self.post_scan({"devices": make_devices(2)})
+        received = timezone.now()
+        self.post_scan({"devices": make_devices(1)})
+        self.post_scan({"devices": make_devices(2)})
+        self.queue.drain()
+
+        scans = list(ScanLog.objects.order_by('id').values_list('timestamp', flat=True))
+        self.assertEqual(len(scans), 3)
+        self.assertLessEqual(scans[1], received + timedelta(seconds=1))
+        self.assertEqual(scans, sorted(scans))
+        mac_address = make_devices(2)[1]["mac_address"]
+        self.assertEqual(list(DeviceStatusTransition.objects.filter(mac_address=mac_address).order_by('id')
+                              .values_list('is_up', 'timestamp')),
+                         [(True, scans[0]), (False, scans[1]), (True, scans[2])])
+        device = DeviceStatus.objects.get(mac_address=mac_address)
+        self.assertEqual((device.is_up, device.last_seen, device.initial_uptime), (True, scans[2], scans[2]))
+        self.assertEqual(PingLog.objects.filter(mac_address=mac_address).count(), 2)
+        self.assertEqual(self.client.get('/api/devices/summary/').data["last_hour"], {"added": 2, "lost": 1})
+
+    def test_coalesced_reports_end_as_if_applied_one_by_one(self):
+        reports = [
+            (make_devices(4), [], timezone.now() - timedelta(minutes=3)),
+            (make_devices(2, start=1, location="moved"), [], timezone.now() - timedelta(minutes=2)),
+            (make_devices(3, start=2), [], timezone.now() - timedelta(minutes=1)),
+        ]
+        scope = ("a", ["10.0.0.0/24"])
+
+        def outcome():
+            return (
+                sorted(DeviceStatus.objects.values_list(
+                    'mac_address', 'ip_address', 'location', 'is_up', 'last_seen', 'initial_uptime', 'is_stale')),
+                sorted(DeviceStatusTransition.objects.values_list('mac_address', 'is_up', 'timestamp')),
+                sorted(PingLog.objects.values_list('mac_address', 'location', 'timestamp')),
+                sorted(FleetSummaryCount.objects.values_list('dimension', 'value', 'up', 'down')),
+            )
+
+        with transaction.atomic():
+            for devices, probes, scanned_at in reports:
+                ingest_scan(devices, *scope, probes, scanned_at)
+            expected = outcome()
+            transaction.set_rollback(True)
+        with CaptureQueriesContext(connection) as ctx:
+            ingest_scans(reports, *scope)
+        # One upsert of the final device states for the three reports
+        upserts = [query for query in ctx.captured_queries if query["sql"].startswith('INSERT INTO "api_devicestatus"')]
+        self.assertEqual(len(upserts), 1)
+        self.assertEqual(outcome(), expected)
+
+    def test_full_queue_and_malformed_reports_are_refused(self):
+        for _ in range(3):
+            self.assertEqual(self.post_scan({"devices": make_devices(1)}).status_code, 202)
+        response = self.post_scan({"devices": make_devices(1)})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '5')
+        self.assertEqual(self.post_scan({"devices": "none"}).status_code, 400)
+
+
+class DeviceStatusQueryTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.post('/api/scans/', {"devices": make_devices(300)}, format='json')
+        DeviceStatus.objects.filter(ip_address__in=['10.0.0.7', '10.0.1.7']).update(is_up=False)
+        now = timezone.now()
+        for i, device in enumerate(DeviceStatus.objects.order_by('id')[:10]):
+            DeviceStatus.objects.filter(pk=device.pk).update(last_seen=now - timedelta(minutes=i))
+
+    def query(self, **params):
+        response = self.client.get('/api/devices/statuses/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def macs(self, **params):
+        return [device['mac_address'] for device in self.query(limit=1000, **params)['results']]
+
+    def test_without_params_returns_the_full_list(self):
+        response = self.client.get('/api/devices/statuses/')
+        self.assertEqual(len(response.data), 300)
+
+    def test_filters(self):
+        self.assertEqual(len(self.macs(is_up='false')), 2)
+        self.assertEqual(len(self.macs(location=['loc-0', 'loc-1'])), 200)
+        self.assertEqual(len(self.macs(ip='10.0.1.0/24')), 44)
+        self.assertEqual(len(self.macs(ip='10.0.0.0/23')), 300)
+        self.assertEqual(len(self.macs(ip='10.0.0.128/25')), 128)
+        self.assertEqual(self.macs(ip='10.0.1.7/32'), ['00:00:00:00:01:07'])
+        self.assertEqual(len(self.macs(ip='10.0.1.')), 44)
+        self.assertEqual(len(self.macs(is_up='false', ip='10.0.0.0/24')), 1)
+        since = (timezone.now() - timedelta(minutes=4, seconds=30)).isoformat()
+        self.assertEqual(len(self.macs(last_seen_until=since)), 5)
+
+    def test_keyset_pages_follow_the_ordering(self):
+        seen = []
+        params = {'ordering': '-last_seen', 'limit': 70}
+        while True:
+            data = self.query(**params)
+            seen += [(device['last_seen'], device['mac_address']) for device in data['results']]
+            if not data['next_cursor']:
+                break
+            params['cursor'] = data['next_cursor']
+        self.assertEqual(len(seen), 300)
+        self.assertEqual(seen, sorted(seen, reverse=True))
+
+    def test_sparse_fieldset(self):
+        data = self.query(fields='mac_address,is_up', is_up='false', ordering='ip_address', limit=1)
+        self.assertEqual(data['results'], [{'mac_address': '00:00:00:00:00:07', 'is_up': False}])
+        data = self.query(cursor=data['next_cursor'], fields='mac_address,is_up', is_up='false', ordering='ip_address')
+        self.assertEqual(data['results'], [{'mac_address': '00:00:00:00:01:07', 'is_up': False}])
+
+    def test_invalid_params(self):
+        for params in ({'ordering': 'stream_id'}, {'fields': 'mac_address,secret'}, {'ip': '10.0.0.0/33'},
+                       {'is_up': 'maybe'}, {'last_seen_since': 'yesterday'}):
+            self.assertEqual(self.client.get('/api/devices/statuses/', params).status_code, 400)
+
+
+class FastSerializationTests(StatusVersionFileMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        for size in (5, 3):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post('/api/scans/', {"devices": make_devices(size, location="h\u00e9l\u2028")}, format='json')
+        DeviceStatus.objects.filter(pk=DeviceStatus.objects.first().pk).update(stream_id=None)
+
+    def test_json_is_byte_compatible_with_the_serializers(self):
+        response = self.client.get('/api/devices/statuses/')
+        expected = JSONRenderer().render(DeviceStatusSerializer(DeviceStatus.objects.all(), many=True).data)
+        self.assertEqual(response.content, expected)
+
+        scans = ScanLog.objects.order_by('-timestamp', '-id').prefetch_related('pings')
+        response = self.client.get('/api/scans/reports/')
+        expected = JSONRenderer().render({"results": ScanLogSerializer(scans, many=True).data, "next_cursor": None})
+        self.assertEqual(response.content, expected)
+
+        response = self.client.get('/api/scans/reports/', {'pings': 'false'})
+        expected = JSONRenderer().render({
+            "results": ScanTimelineSerializer(scans.annotate(device_count=Count('pings')), many=True).data,
+            "next_cursor": None,
+        })
+        self.assertEqual(response.content, expected)
+
+    def test_columnar_json(self):
+        response = self.client.get('/api/devices/statuses/', HTTP_ACCEPT='application/vnd.ubivision.columnar+json')
+        self.assertEqual(response['Content-Type'], 'application/vnd.ubivision.columnar+json')
+        data = json.loads(response.content)
+        self.assertEqual(data['fields'][:2], ['mac_address', 'ip_address'])
+        self.assertEqual(data['columns'][0], [device['mac_address'] for device in make_devices(5)])
+        self.assertNotEqual(response['ETag'], self.client.get('/api/devices/statuses/')['ETag'])
+        self.assertIn('Accept', response['Vary'])
+
+        response = self.client.get('/api/scans/reports/', {'pings': 'false', 'format': 'columnar'})
+        data = json.loads(response.content)
+        self.assertEqual(data['results']['fields'], ['id', 'timestamp', 'device_count'])
+        self.assertEqual(data['results']['columns'][2], [3, 5])
+
+    @skipUnless(msgpack, "msgpack is not installed")
+    def test_messagepack(self):
+        response = self.client.get('/api/devices/statuses/', {'is_up': 'true'}, HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        data = msgpack.unpackb(response.content)
+        self.assertEqual(len(data['results']), 3)
+        self.assertEqual(data['results'][0], json.loads(self.client.get('/api/devices/statuses/', {'is_up': 'true'}).content)['results'][0])
+
+
+def scrape(client):
+    """Fetch /api/metrics/ and return {series: value} for every sample line."""
+    response = client.get('/api/metrics/')
+    samples = {}
+    for line in response.content.decode().splitlines():
+        if line and not line.startswith('#'):
+            series, value = line.rsplit(' ', 1)
+            samples[series] = float(value)
+    return response, samples
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_exposes_request_ingest_and_fleet_metrics(self):
+        _, before = scrape(self.client)
+        self.client.post('/api/scans/', {"devices": make_devices(4)}, format='json')
+        self.client.post('/api/scans/', {"devices": make_devices(3)}, format='json')
+        with CaptureQueriesContext(connection) as ctx:
+            response, after = scrape(self.client)
+        # The ping log is never counted row by row
+        self.assertFalse(any('COUNT(*)' in query["sql"] and '"api_pinglog"' in query["sql"]
+                             for query in ctx.captured_queries))
+
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        requests_series = 'ubivision_http_requests_total{view="create_scan",method="POST",status="201"}'
+        self.assertEqual(after[requests_series] - before.get(requests_series, 0), 2)
+        count_series = 'ubivision_ingest_batch_devices_count{kind="full"}'
+        self.assertEqual(after[count_series] - before.get(count_series, 0), 2)
+        sum_series = 'ubivision_ingest_batch_devices_sum{kind="full"}'
+        self.assertEqual(after[sum_series] - before.get(sum_series, 0), 7)
+        self.assertGreater(after['ubivision_http_request_queries_sum{view="create_scan"}'], 0)
+
+        self.assertEqual(after['ubivision_table_rows{table="pinglog"}'], 7)
+        self.assertEqual(after['ubivision_table_rows{table="devicestatus"}'], 4)
+        self.assertEqual(after['ubivision_devices{location="loc-0",state="up"}'], 1)
+        self.assertEqual(after['ubivision_devices{location="loc-0",state="down"}'], 1)
+        self.assertEqual(after['ubivision_ingest_queue_depth'], 0)
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = Histogram('test_seconds', 'Test histogram.', (0.1, 1), ('view',))
+        for value in (0.05, 0.5, 0.5, 5):
+            histogram.observe(value, 'a"b')
+        self.assertEqual(histogram.render()[2:], [
+            'test_seconds_bucket{view="a\\"b",le="0.1"} 1',
+            'test_seconds_bucket{view="a\\"b",le="1"} 3',
+            'test_seconds_bucket{view="a\\"b",le="+Inf"} 4',
+            'test_seconds_sum{view="a\\"b"} 6.05',
+            'test_seconds_count{view="a\\"b"} 4',
+        ])
+
+
+class AsyncRequestPathTests(StatusVersionFileMixin, TestCase):
+    """The async views through Django's async handler and middleware, as under ASGI."""
+
+    async def test_ingest_and_reads(self):
+        response = await self.async_client.post(
+            '/api/scans/', {"devices": make_devices(2)}, content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(await PingLog.objects.acount(), 2)
+
+        response = await self.async_client.get('/api/devices/statuses/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 2)
+        self.assertEqual(response['X-Frame-Options'], 'DENY')
+        response = await self.async_client.get('/api/devices/statuses/', headers={'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+        response = await self.async_client.get('/api/devices/statuses/', {"is_up": "true", "limit": 1})
+        self.assertEqual(len(response.json()["results"]), 1)
+        self.assertIsNotNone(response.json()["next_cursor"])
+        response = await self.async_client.get('/api/scans/reports/')
+        self.assertEqual([len(scan["pings"]) for scan in response.json()["results"]], [2])
+        response = await self.async_client.get('/api/scans/reports/', {"cursor": "bm90IGEgY3Vyc29y"})
+        self.assertEqual(response.status_code, 400)
+
+    async def test_invalid_report_is_rejected(self):
+        response = await self.async_client.post('/api/scans/', {"devices": "x"}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        response = await self.async_client.post('/api/scans/', "{", content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(await PingLog.objects.acount(), 0)
+
+    async def test_browsable_api_renders_off_the_event_loop(self):
+        # The browsable API reads request.user, which loads the session
+        user = await sync_to_async(User.objects.create_user)("viewer", password="pw")
+        client = APIClient()
+        await sync_to_async(client.force_login)(user)
+        self.async_client.cookies = client.cookies
+        response = await self.async_client.post(
+            '/api/scans/', {"devices": make_devices(1)}, content_type='application/json',
+            headers={'Accept': 'text/html'},
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertIn(b"viewer", response.content)
+
+    async def test_queries_in_threads_are_measured(self):
+        _, before = await sync_to_async(scrape)(APIClient())
+        await self.async_client.post('/api/scans/', {"devices": make_devices(3)}, content_type='application/json')
+        _, after = await sync_to_async(scrape)(APIClient())
+        series = 'ubivision_http_request_queries_sum{view="create_scan"}'
+        self.assertGreater(after[series] - before.get(series, 0), 0)
+
+
+class LatencyTelemetryTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.devices = make_devices(3)
+        self.client.post('/api/scans/', {"devices": self.devices}, format='json')
+        self.mac_address = self.devices[0]["mac_address"]
+        self.hour = timezone.now().replace(minute=0, second=0, microsecond=0) - timedelta(hours=3)
+
+    def record(self, minute, probes):
+        record_probes(normalize_probes(probes), self.hour + timedelta(minutes=minute))
+
+    def report(self, **params):
+        response = self.client.get('/api/devices/latency/', {
+            "since": self.hour.isoformat(), "until": (self.hour + timedelta(hours=2)).isoformat(), **params,
+        })
+        self.assertEqual(response.status_code, 200)
+        return response.data["results"]
+
+    def test_scan_probes_are_appended_to_hourly_rows(self):
+        probes = [
+            {"mac_address": self.mac_address, "rtt_ms": 12.5},
+            {"mac_address": self.devices[1]["mac_address"], "error": "timeout"},
+        ]
+        for _ in range(2):
+            response = self.client.post('/api/scans/', {"devices": self.devices, "probes": probes}, format='json')
+            self.assertEqual(response.status_code, 201)
+        rows = LatencySamples.objects.order_by('mac_address')
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(len(rows[0].samples), 2 * SAMPLE.size)
+        self.assertEqual([sample[1:] for sample in SAMPLE.iter_unpack(rows[0].samples)], [(0, 12.5), (0, 12.5)])
+        self.assertEqual(SAMPLE.unpack(rows[1].samples[:SAMPLE.size])[1:], (1, 0.0))
+
+        for bad in ({"mac_address": self.mac_address, "error": "melted"}, {"mac_address": self.mac_address}, "x"):
+            response = self.client.post('/api/scans/', {"devices": self.devices, "probes": [bad]}, format='json')
+            self.assertEqual(response.status_code, 400)
+
+    def test_delta_reports_carry_probes(self):
+        response = self.client.post('/api/scans/delta/', {
+            "full": True, "seq": 1, "devices": self.devices,
+            "probes": [{"mac_address": self.mac_address, "rtt_ms": 3}],
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(LatencySamples.objects.get().samples), SAMPLE.size)
+
+    def test_percentiles_trend_and_failures(self):
+        for rtt in range(1, 101):
+            self.record(rtt % 2, [{"mac_address": self.mac_address, "rtt_ms": rtt}])
+        self.record(1, [{"mac_address": self.mac_address, "error": "timeout"}])
+
+        result = self.report(mac_address=self.mac_address, resolution="minute")[0]
+        self.assertEqual(result["samples"], 100)
+        self.assertEqual(result["failures"], {"timeout": 1})
+        self.assertAlmostEqual(result["failure_rate"], 1 / 101)
+        self.assertEqual(result["mean_ms"], 50.5)
+        self.assertEqual(result["max_ms"], 100)
+        for key, exact in (("p50_ms", 50), ("p90_ms", 90), ("p99_ms", 99)):
+            self.assertGreaterEqual(result[key], exact)
+            self.assertLessEqual(result[key], exact * 1.1)
+        self.assertEqual([point["samples"] for point in result["trend"]], [50, 50])
+        self.assertEqual(result["trend"][1]["failures"], {"timeout": 1})
+
+        by_location = self.report(group_by="location")
+        self.assertEqual([row["location"] for row in by_location], ["loc-0", "loc-1", "loc-2"])
+        self.assertEqual(by_location[0]["samples"], 100)
+        self.assertIsNone(by_location[1]["p50_ms"])
+
+    def test_rollups_give_the_same_report_as_raw_samples(self):
+        for minute in range(0, 90, 7):
+            self.record(minute, [
+                {"mac_address": self.mac_address, "rtt_ms": 5 + minute},
+                {"mac_address": self.devices[1]["mac_address"], "error": "refused"},
+            ])
+        raw_minutes = self.report(resolution="minute")
+        raw_hours = self.report(resolution="hour")
+
+        rolled_up, _, _ = rollup_latency()
+        self.assertEqual(rolled_up, 4)
+        self.assertFalse(LatencySamples.objects.filter(rolled_up=False).exists())
+        self.assertEqual(LatencyRollup.objects.filter(resolution='hour').count(), 4)
+        with self.assertNumQueries(3):
+            self.assertEqual(self.report(resolution="minute"), raw_minutes)
+        self.assertEqual(self.report(resolution="hour"), raw_hours)
+        self.assertEqual(len(raw_hours[0]["trend"]), 2)
+
+        # Past their retention, raw samples go and minute rollups follow
+        self.assertEqual(rollup_latency(raw_hours=1, minute_days=14)[1], 4)
+        self.assertEqual(rollup_latency(now=timezone.now() + timedelta(days=15))[2], 26)
+        self.assertEqual(self.report(resolution="hour"), raw_hours)
+
+    def test_late_samples_of_a_rolled_up_hour_are_merged_into_its_rollups(self):
+        self.record(5, [{"mac_address": self.mac_address, "rtt_ms": 10}])
+        rollup_latency()
+        # Delivered late, after the hour was rolled up and its raw samples deleted
+        rollup_latency(raw_hours=1)
+        self.record(5, [{"mac_address": self.mac_address, "rtt_ms": 30}])
+        self.record(40, [{"mac_address": self.mac_address, "error": "timeout"}])
+        self.assertFalse(LatencySamples.objects.exists())
+
+        result = self.report(mac_address=self.mac_address, resolution="minute")[0]
+        self.assertEqual((result["samples"], result["mean_ms"], result["failures"]), (2, 20, {"timeout": 1}))
+        self.assertEqual([point["samples"] for point in result["trend"]], [2, 0])
+        hourly = self.report(mac_address=self.mac_address, resolution="hour")[0]
+        self.assertEqual((hourly["samples"], hourly["max_ms"]), (2, 30))
+
+
+def ndjson(*lines):
+    return "".join(json.dumps(line) + "\n" for line in lines)
+
+
+class ScanStreamTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.post('/api/scans/', {"devices": make_devices(3)}, format='json')
+        self.stream_id = self.client.post('/api/scans/streams/', {}, format='json').data["stream_id"]
+
+    def upload(self, *lines):
+        return self.client.post(f'/api/scans/streams/{self.stream_id}/', ndjson(*lines),
+                                content_type='application/x-ndjson')
+
+    def is_up(self):
+        return dict(DeviceStatus.objects.values_list('mac_address', 'is_up'))
+
+    def test_records_show_up_before_the_scan_completes(self):
+        devices = make_devices(4)
+        response = self.upload(devices[3], {**devices[0], "location": "moved"})
+        self.assertEqual(response.data, {"applied": 2, "complete": False})
+        self.assertEqual(list(self.is_up().values()), [True] * 4)
+        self.assertEqual(DeviceStatus.objects.get(mac_address=devices[0]["mac_address"]).location, "moved")
+
+        response = self.upload(devices[1], {"type": "probe", "mac_address": devices[1]["mac_address"], "rtt_ms": 4},
+                               {"type": "complete"})
+        self.assertEqual(response.data, {"applied": 1, "complete": True})
+        self.assertEqual(self.is_up()[devices[2]["mac_address"]], False)
+        self.assertEqual(sum(self.is_up().values()), 3)
+        scan = ScanStream.objects.get().scan
+        self.assertEqual((scan.kind, scan.pings.count()), (ScanLog.STREAM, 3))
+        self.assertEqual(ScanStream.objects.get().received, 3)
+        self.assertEqual(LatencySamples.objects.get().mac_address, devices[1]["mac_address"])
+
+        self.assertEqual(self.upload(devices[2]).status_code, 409)
+
+    def test_chunks_are_applied_in_micro_batches(self):
+        with mock.patch('api.scan_stream.STREAM_BATCH_SIZE', 2), \
+                mock.patch('api.scan_stream.apply_stream_batch', wraps=apply_stream_batch) as apply_batch:
+            response = self.upload(*make_devices(5, start=10))
+        self.assertEqual(response.data["applied"], 5)
+        self.assertEqual([len(call.args[1]) for call in apply_batch.call_args_list], [2, 2, 1])
+
+    def test_malformed_lines(self):
+        response = self.client.post(f'/api/scans/streams/{self.stream_id}/', '{"mac_address": "x"\n',
+                                    content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.upload({"type": "reboot"}).status_code, 400)
+        self.assertEqual(self.upload({"ssid": "cam"}).status_code, 400)
+        self.assertEqual(self.upload({"type": "complete"}, make_devices(1)[0]).status_code, 400)
+        self.assertEqual(self.client.post('/api/scans/streams/999/', ndjson({"type": "complete"}),
+                                          content_type='application/x-ndjson').status_code, 404)
+
+
+class FleetSummaryTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def post_scan(self, devices):
+        self.assertEqual(self.client.post('/api/scans/', {"devices": devices}, format='json').status_code, 201)
+
+    def summary(self):
+        response = self.client.get('/api/devices/summary/')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_summary_follows_scans_and_manual_updates(self):
+        devices = make_devices(6)
+        self.post_scan(devices)
+        self.post_scan([dict(devices[0], version="2.0")] + devices[1:4])
+        self.client.patch(f'/api/devices/{devices[1]["mac_address"]}/status/', {"location": "moved"}, format='json')
+        self.client.patch(f'/api/devices/{devices[4]["mac_address"]}/status/', {"is_up": True}, format='json')
+
+        summary = self.summary()
+        self.assertEqual((summary["devices"], summary["up"], summary["down"]), (6, 5, 1))
+        self.assertEqual(summary["locations"], [
+            {"location": "loc-0", "up": 2, "down": 0},
+            {"location": "loc-1", "up": 1, "down": 0},
+            {"location": "loc-2", "up": 1, "down": 1},
+            {"location": "moved", "up": 1, "down": 0},
+        ])
+        self.assertEqual(summary["versions"], [
+            {"version": "1.0", "up": 4, "down": 1}, {"version": "2.0", "up": 1, "down": 0},
+        ])
+        self.assertEqual(summary["last_hour"], {"added": 6, "lost": 2})
+        self.assertEqual(check_fleet_summary(), [])
+
+    def test_delta_and_streamed_scans_keep_the_summary_consistent(self):
+        devices = make_devices(4)
+        self.client.post('/api/scans/delta/', {"full": True, "seq": 1, "devices": devices}, format='json')
+        state = [dict(devices[0], location="moved")] + devices[1:3]
+        self.client.post('/api/scans/delta/', {
+            "seq": 2, "digest": state_digest(device_state([normalize_device(device) for device in state])),
+            "added": [], "changed": state[:1], "removed": [devices[3]["mac_address"]],
+        }, format='json')
+        stream_id = self.client.post('/api/scans/streams/', {}, format='json').data["stream_id"]
+        self.client.post(f'/api/scans/streams/{stream_id}/', ndjson(*make_devices(2, start=1), {"type": "complete"}),
+                         content_type='application/x-ndjson')
+
+        self.assertEqual(check_fleet_summary(), [])
+        summary = self.summary()
+        self.assertEqual((summary["up"], summary["down"]), (2, 2))
+        self.assertEqual(summary["last_hour"], {"added": 4, "lost": 2})
+
+    def test_reads_do_not_depend_on_fleet_size(self):
+        for size in (10, 200):
+            self.post_scan(make_devices(size))
+            DeviceStatus.objects.update(location=F('mac_address'))
+            call_command('rebuild_fleet_summary', stdout=io.StringIO())
+            with self.assertNumQueries(4):
+                summary = self.summary()
+            self.assertEqual(summary["up"], size)
+            self.assertEqual(len(summary["locations"]), min(size, 100))
+            self.assertEqual(summary["locations_truncated"], size > 100)
+
+        response = self.client.get('/api/devices/summary/', {"limit": 5})
+        self.assertEqual([row["location"] for row in response.data["locations"]],
+                         sorted(DeviceStatus.objects.values_list('mac_address', flat=True))[:5])
+        self.assertEqual(self.client.get('/api/devices/summary/', {"limit": "x"}).status_code, 400)
+
+    def test_old_changes_leave_the_window(self):
+        self.post_scan(make_devices(2))
+        FleetChangeMinute.objects.update(minute=timezone.now() - timedelta(hours=2))
+        self.assertEqual(self.summary()["last_hour"], {"added": 0, "lost": 0})
+
+    def test_check_and_rebuild_command(self):
+        self.post_scan(make_devices(3))
+        DeviceStatus.objects.filter(mac_address=make_devices(1)[0]["mac_address"]).update(version="2.0")
+        with self.assertRaises(CommandError):
+            call_command('rebuild_fleet_summary', check=True, stdout=io.StringIO(), stderr=io.StringIO())
+
+        call_command('rebuild_fleet_summary', stdout=io.StringIO())
+        call_command('rebuild_fleet_summary', check=True, stdout=io.StringIO())
+        self.assertEqual(self.summary()["versions"], [
+            {"version": "1.0", "up": 2, "down": 0}, {"version": "2.0", "up": 1, "down": 0},
+        ])
+        self.assertEqual(self.summary()["last_hour"], {"added": 3, "lost": 0})
+
+
+class HistoryExportTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        for devices in (make_devices(3), make_devices(2), make_devices(3, start=1)):
+            self.client.post('/api/scans/', {"devices": devices}, format='json')
+
+    def export(self, **params):
+        response = self.client.get('/api/scans/export/', params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def test_pings_as_csv(self):
+        rows = list(csv.reader(io.StringIO(self.export().decode())))
+        self.assertEqual(rows[0], EXPORT_FIELDS['pings'])
+        self.assertEqual([int(row[0]) for row in rows[1:]],
+                         list(PingLog.objects.order_by('timestamp', 'id').values_list('id', flat=True)))
+
+        mac_address = make_devices(1)[0]["mac_address"]
+        rows = list(csv.DictReader(io.StringIO(self.export(mac_address=mac_address).decode())))
+        self.assertEqual([row["mac_address"] for row in rows], [mac_address] * 2)
+
+    def test_scans_as_ndjson(self):
+        lines = [json.loads(line) for line in self.export(rows='scans', output='ndjson', location='loc-1').splitlines()]
+        self.assertEqual([(line["kind"], line["device_count"]) for line in lines], [(ScanLog.FULL, 1)] * 3)
+        self.assertEqual([line["id"] for line in lines], list(ScanLog.objects.order_by('id').values_list('id', flat=True)))
+
+    def test_chunked_gzip_and_resumed_exports(self):
+        with mock.patch('api.export.EXPORT_CHUNK_SIZE', 3):
+            full = self.export(output='ndjson')
+            lines = full.splitlines()
+            self.assertEqual(len(lines), 8)
+            last = json.loads(lines[3])
+            rest = self.export(output='ndjson', after=f"{last['timestamp']},{last['id']}")
+            self.assertEqual(rest.splitlines(), lines[4:])
+            self.assertEqual(gzip.decompress(self.export(output='ndjson', gzip='true')), full)
+
+    def test_invalid_params(self):
+        for params in ({"rows": "devices"}, {"output": "xml"}, {"after": "yesterday"}, {"after": "2026-01-01T00:00:00Z,x"},
+                       {"since": "soon"}, {"gzip": "maybe"}):
+            self.assertEqual(self.client.get('/api/scans/export/', params).status_code, 400)
+
+    def test_interrupted_command_resumes_into_the_same_file(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = os.path.join(tmp.name, "pings.csv.gz")
+        calls = []
+
+        def interrupt_second_rows(data):
+            calls.append(data)
+            if len(calls) == 3:  # The header, then a chunk of rows
+                raise KeyboardInterrupt
+            return gzip.compress(data)
+
+        with mock.patch('api.export.EXPORT_CHUNK_SIZE', 3):
+            with mock.patch('api.management.commands.export_history.gzip_chunk', interrupt_second_rows), \
+                    self.assertRaises(CommandError) as interrupted:
+                call_command('export_history', output=path, gzip=True, stderr=io.StringIO())
+            after = str(interrupted.exception).rsplit('--after ', 1)[1]
+            call_command('export_history', output=path, gzip=True, after=after, stderr=io.StringIO())
+        with open(path, 'rb') as f:
+            self.assertEqual(gzip.decompress(f.read()), self.export())
+
+
+class FrontendServingTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dist = Path(tmp.name)
+        (self.dist / 'js').mkdir()
+        self.script = b"console.log('ubivision');\n" * 200
+        (self.dist / 'js' / 'app.3f2a1c9e.js').write_bytes(self.script)
+        (self.dist / 'favicon.ico').write_bytes(b'\0' * 100)
+        (self.dist / 'index.html').write_bytes(b'<!DOCTYPE html><div id="app"></div>' * 50)
+        self.static_root = Path(tmp.name) / 'collected'
+        (self.static_root / 'admin' / 'css').mkdir(parents=True)
+        (self.static_root / 'admin' / 'css' / 'base.css').write_bytes(b'body { margin: 0; }\n')
+        settings_override = override_settings(FRONTEND_DIST_DIR=self.dist, STATIC_ROOT=self.static_root, DEBUG=False)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        call_command('compress_assets', stdout=io.StringIO(), stderr=io.StringIO())
+
+    def test_hashed_assets_are_precompressed_and_immutable(self):
+        self.assertTrue((self.dist / 'js' / 'app.3f2a1c9e.js.gz').exists())
+        self.assertFalse((self.dist / 'favicon.ico.gz').exists())
+
+        response = self.client.get('/static/dist/js/app.3f2a1c9e.js', HTTP_ACCEPT_ENCODING='gzip;q=1, br;q=0')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('javascript', response['Content-Type'])
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), self.script)
+
+        response = self.client.get('/static/dist/js/app.3f2a1c9e.js', HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(b''.join(response.streaming_content), self.script)
+
+    def test_unhashed_files_revalidate(self):
+        response = self.client.get('/static/dist/favicon.ico')
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        response = self.client.get('/static/dist/favicon.ico', HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+        for path in ('js/app.3f2a1c9e.js.gz', 'js/missing.js', '../index.html', 'js'):
+            self.assertEqual(self.client.get(f'/static/dist/{path}').status_code, 404)
+
+    def test_collected_static_files_are_served(self):
+        response = self.client.get('/static/admin/css/base.css')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('text/css', response['Content-Type'])
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        self.assertEqual(b''.join(response.streaming_content), b'body { margin: 0; }\n')
+        response = self.client.get('/static/admin/css/base.css', HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+        for path in ('admin/css/missing.css', '../favicon.ico', 'admin'):
+            self.assertEqual(self.client.get(f'/static/{path}').status_code, 404)
+        # The frontend build is still served from its own directory
+        self.assertEqual(self.client.get('/static/dist/favicon.ico').status_code, 200)
+
+    def test_index_is_cached_and_api_urls_stay_off_the_fallback(self):
+        response = self.client.get('/fleet/cameras', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), (self.dist / 'index.html').read_bytes())
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        response = self.client.get('/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        # A new build is picked up without a restart
+        index = self.dist / 'index.html'
+        index.write_bytes(b'<!DOCTYPE html><title>new</title>')
+        os.utime(index, (time.time() + 5, time.time() + 5))
+        self.assertEqual(self.client.get('/').content, b'<!DOCTYPE html><title>new</title>')
+
+        response = self.client.get('/api/no-such-endpoint/')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {"error": "Not found"})
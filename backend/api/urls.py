@@ -1,11 +1,30 @@
 from django.urls import path
 from .views import (
-    create_scan, get_scans, update_device_status, get_device_statuses,
+    create_scan, create_scan_batch, get_scans, update_device_status, get_device_statuses, get_device_history,
+    get_device_availability, device_status_events, get_scan_agents, create_scan_delta,
+    send_fleet_command, get_fleet_command, get_janus_config, export_history,
+    get_scan_queue, get_metrics, get_device_latency, get_device_summary, open_scan_stream, upload_scan_stream,
 )
 
 urlpatterns = [
     path('scans/', create_scan, name='create_scan'),
+    path('scans/batch/', create_scan_batch, name='create_scan_batch'),
+    path('scans/delta/', create_scan_delta, name='create_scan_delta'),
+    path('scans/streams/', open_scan_stream, name='open_scan_stream'),
+    path('scans/streams/<int:stream_id>/', upload_scan_stream, name='upload_scan_stream'),
     path('scans/reports/', get_scans, name='get_scans'),
+    path('scans/queue/', get_scan_queue, name='get_scan_queue'),
+    path('scans/export/', export_history, name='export_history'),
+    path('scans/agents/', get_scan_agents, name='get_scan_agents'),
     path('devices/statuses/', get_device_statuses, name='get_device_statuses'),
+    path('devices/statuses/events/', device_status_events, name='device_status_events'),
+    path('devices/availability/', get_device_availability, name='get_device_availability'),
+    path('devices/latency/', get_device_latency, name='get_device_latency'),
+    path('devices/summary/', get_device_summary, name='get_device_summary'),
+    path('devices/commands/', send_fleet_command, name='send_fleet_command'),
+    path('devices/commands/<int:command_id>/', get_fleet_command, name='get_fleet_command'),
     path('devices/<str:mac_address>/status/', update_device_status, name='update_device_status'),
-]
\ No newline at end of file
+    path('devices/<str:mac_address>/history/', get_device_history, name='get_device_history'),
+    path('streams/config/', get_janus_config, name='get_janus_config'),
+    path('metrics/', get_metrics, name='get_metrics'),
+]
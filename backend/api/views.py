@@ -1,91 +1,487 @@
 # backend/api/views.py
-import requests
 import json
-from rest_framework.decorators import api_view
+import math
+import time
+from datetime import timedelta
+from asgiref.sync import sync_to_async
+from rest_framework.decorators import api_view, parser_classes, renderer_classes
+from rest_framework.exceptions import ParseError
 from rest_framework.response import Response
 from rest_framework import status
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.db.models import Count, Exists, OuterRef, Q
+from django.db.models.functions import Coalesce
 from django.utils import timezone
-from .models import ScanLog, PingLog, DeviceStatus
-from .serializers import ScanLogSerializer, DeviceStatusSerializer
-import requests
+from django.utils.http import http_date, parse_http_date_safe
+from .models import ScanLog, PingLog, DeviceStatus, DeviceStatusTransition, ScanAgent, FleetCommand, ScanStream
+from .serializers import (
+    DeviceHistoryEntrySerializer, ScanAgentSerializer, FleetCommandSerializer, FleetCommandDetailSerializer,
+)
+from .pagination import InvalidQueryParam, apaginate, parse_bool, parse_limit, parse_timestamp
+from .ingest import ingest_scan, parse_scope
+from .ingest_queue import QueueFull, ingest_queue
+from .delta import ResyncRequired, apply_scan_report
+from .batch import apply_batch, parse_batch
+from .parsers import NDJSONParser
+from .scan_stream import StreamClosed, ingest_stream_chunk, open_stream
+from .events import publish_device_changes, status_event_stream
+from .archive import device_history
+from .fastpath import ascan_records, instance_records, scan_timeline_records
+from .renderers import LIST_RENDERERS
+from .device_query import DEVICE_QUERY_PARAMS, query_device_statuses
+from .availability import availability
+from .latency import RESOLUTIONS, device_latency, normalize_probes
+from .export import HistoryExport, async_chunks, gzip_chunks, parse_export_cursor
+from .summary import SUMMARY_BREAKDOWN_LIMIT, SUMMARY_BREAKDOWN_MAX, SummaryDelta, fleet_summary
+from .fleet import (
+    FLEET_DEFAULT_CONCURRENCY, FLEET_DEFAULT_DEADLINE_SECONDS, FLEET_MAX_CONCURRENCY, FLEET_MAX_DEADLINE_SECONDS,
+    create_fleet_command, parse_bounded_int, run_fleet_command, send_request_to_device, start_fleet_command,
+)
+from .streams import render_janus_config
+from .metrics import render_metrics
+from .async_api import async_api_view
+from .snapshot import (
+    aget_status_snapshot, publish_status_change, read_status_version, status_version_etag, status_version_modified,
+)
 import logging
 
 logger = logging.getLogger(__name__)
-ID_BASE = 6000
-ARCHIVE_HOURS = 24
-ARCHIVE_SEGMENT_LENGTH = 20
+AVAILABILITY_DEFAULT_DAYS = 7
+LATENCY_DEFAULT_HOURS = 24
+# Longest window reported per minute when no resolution is requested
+LATENCY_MINUTE_WINDOW = timedelta(hours=6)
+
+
+@async_api_view(['GET'])
+@renderer_classes(LIST_RENDERERS)
+async def get_scans(request):
+    """
+    Retrieve one page of scan reports, newest first, including pings for each scan.
+
+    Query params: `since`/`until` (ISO 8601), `mac_address`, `limit`, `cursor` (from the
+    previous page's `next_cursor`) and `pings=false` to get only the scan timeline.
+
+    Scans older than the archive window are listed without pings (and a device_count of
+    0), as archive.archive_pings compacts them into per-device PingSegments that do not
+    map back to scans; `mac_address` only matches scans whose pings are still raw. Delta
+    scans are listed the same way, with the device_count they reported, as their devices
+    are recorded in per-device segments too. The device history endpoint reads a device's
+    pings across all of them.
+    """
+    params = request.query_params
+    try:
+        since = parse_timestamp('since', params.get('since'))
+        until = parse_timestamp('until', params.get('until'))
+        limit = parse_limit(params.get('limit'))
+        include_pings = parse_bool('pings', params.get('pings'), default=True)
+    except InvalidQueryParam as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    mac_address = params.get('mac_address')
+
+    scans = ScanLog.objects.all()
+    if since:
+        scans = scans.filter(timestamp__gte=since)
+    if until:
+        scans = scans.filter(timestamp__lt=until)
+
+    pings = PingLog.objects.all()
+    if mac_address:
+        pings = pings.filter(mac_address=mac_address)
+        scans = scans.filter(Exists(pings.filter(scan=OuterRef('pk'))))
+
+    if not include_pings and mac_address:
+        scans = scans.annotate(device_count=Count('pings', filter=Q(pings__mac_address=mac_address)))
+    elif not include_pings:
+        scans = scans.annotate(device_count=Coalesce('reported_devices', Count('pings')))
+
+    try:
+        page, next_cursor = await apaginate(scans, ['-timestamp', '-id'], params.get('cursor'), limit)
+    except InvalidQueryParam as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    # Same output as ScanLogSerializer/ScanTimelineSerializer; the pings of the whole
+    # page come from one values_list() query instead of one serializer per ping
+    results = await ascan_records(page, pings) if include_pings else scan_timeline_records(page)
+    return Response({"results": results, "next_cursor": next_cursor})
 
 
 @api_view(['GET'])
-def get_scans(request):
-    """Retrieve all scan reports, including pings for each scan."""
-    scans = ScanLog.objects.all().order_by('-timestamp')
-    serializer = ScanLogSerializer(scans, many=True)
-    return Response(serializer.data)
+def export_history(request):
+    """
+    Stream ping (`rows=pings`, default), scan (`rows=scans`) or ping segment
+    (`rows=segments`: archived pings and delta scans) history, oldest first, as CSV
+    (`output=csv`, default) or NDJSON (`output=ndjson`), gzipped on the fly with
+    `gzip=true`.
+
+    Query params: `since`/`until` (ISO 8601), `mac_address`, `location` (not for
+    segments), and `after`, "<timestamp>,<id>" of the last row received (its first_seen
+    for segments), to resume an interrupted export.
+    """
+    params = request.query_params
+    try:
+        export = HistoryExport(
+            rows=params.get('rows') or 'pings',
+            output_format=params.get('output') or 'csv',
+            since=parse_timestamp('since', params.get('since')),
+            until=parse_timestamp('until', params.get('until')),
+            mac_address=params.get('mac_address'),
+            location=params.get('location'),
+            after=parse_export_cursor(params.get('after')),
+        )
+        compress = parse_bool('gzip', params.get('gzip'), default=False)
+    except InvalidQueryParam as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    chunks, content_type, filename = export.chunks(), export.content_type, export.filename
+    if compress:
+        chunks, content_type, filename = gzip_chunks(chunks), 'application/gzip', filename + '.gz'
+    if isinstance(request._request, ASGIRequest):
+        chunks = async_chunks(chunks)
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@async_api_view(['POST'])
+async def create_scan(request):
+    """
+    Create a new scan report, logging each device found and updating the status table.
+
+    An optional `scope` of {"agent_id": ..., "cidrs": [...]} limits down-marking to
+    devices whose last IP is inside the given subnets. Optional `probes` carry the RTT
+    or failure reason of each device's /status probe (see latency.normalize_probes).
+
+    Parsing the body and the ingest transaction run in a thread; in queue mode the report
+    is enqueued from the event loop.
+    """
+    # Parsed in a thread: a report of a large fleet takes milliseconds to decode
+    data = await sync_to_async(lambda: request.data)()
+    devices = data.get('devices', [])
+    if not isinstance(devices, list) or not all(isinstance(device, dict) for device in devices):
+        return Response({"error": "devices must be a list of objects"}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        scope = data.get('scope')
+        # Looking up a registered agent's subnets is a query
+        agent_id, cidrs = await sync_to_async(parse_scope)(scope) if scope is not None else (None, None)
+        probes = normalize_probes(data.get('probes'))
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    if settings.SCAN_INGEST_MODE == 'queue':
+        # Applied later by the single writer thread, see ingest_queue.IngestQueue
+        try:
+            depth = ingest_queue.enqueue(devices, agent_id, cidrs, probes)
+        except QueueFull:
+            return Response(
+                {"error": "Scan ingest queue is full"}, status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={'Retry-After': '5'},
+            )
+        return Response({"message": "Scan queued", "queue_depth": depth}, status=status.HTTP_202_ACCEPTED)
+
+    await sync_to_async(ingest_scan)(devices, agent_id, cidrs, probes)
+    return Response({"message": "Scan created and statuses updated successfully"}, status=status.HTTP_201_CREATED)
 
 
 @api_view(['POST'])
-def create_scan(request):
-    """Create a new scan report, logging each device found and updating the status table."""
-    devices = request.data.get('devices', [])
-    scan = ScanLog.objects.create()
-
-    # Track MAC addresses that are part of the scan
-    scanned_mac_addresses = set()
-
-    found_db_devices = []
-    # Process each device in the scan
-    for device in devices:
-        mac_address = device.get('mac_address') or device.get('mac')
-        ip_address = device.get('ip_address') or device.get('ip')
-        location = device.get('location', '')  # Default to empty if location is not provided
-        version = device.get('version', '')  # Default to empty if version is not provided
-
-        scanned_mac_addresses.add(mac_address)
-
-        # Create PingLog entries for each device in the scan
-        PingLog.objects.create(scan=scan, mac_address=mac_address, ip_address=ip_address, location=location, version=version)
-
-        # Update DeviceStatus table: mark as up if found in scan
-        device_status, created = DeviceStatus.objects.get_or_create(
-            mac_address=mac_address,
-            defaults={
-                'ip_address': ip_address,
-                'location': location,
-                'version': version,
-                'is_up': True,
-                'initial_uptime': timezone.now(),
-                'last_seen': timezone.now(),
-            },
-        )
-        found_db_devices.append(device_status)
-
-        if not created:
-            # Update existing device status
-            device_status.ip_address = ip_address
-            device_status.location = location
-            device_status.version = version
-            # Only update last_seen if the device is being marked as up
-            if not device_status.is_up:
-                device_status.initial_uptime = timezone.now()
-            device_status.is_up = True
-            device_status.last_seen = timezone.now()
-            device_status.save()
-
-    # Set to "down" any devices not seen in this scan that were previously "up" without updating last_seen
-    DeviceStatus.objects.filter(is_up=True).exclude(mac_address__in=scanned_mac_addresses).update(
-        is_up=False, initial_uptime=None
+def create_scan_batch(request):
+    """
+    Apply a batch of scan reports, oldest first, in one transaction (see batch.apply_batch).
+
+    Each report carries an idempotency `key` and the `scanned_at` time of its scan, so a
+    scanner can resend a batch whose answer it lost. Answers 200 with the outcome of each
+    report. Applied in the request in both ingest modes, as the outcome is only known
+    once the transaction commits.
+    """
+    try:
+        reports = parse_batch(request.data)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({"results": apply_batch(reports)}, status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+def open_scan_stream(request):
+    """
+    Open a streamed scan and return its `stream_id`; records are then uploaded to
+    upload_scan_stream as they are found. Takes the same optional `scope` as create_scan.
+    """
+    try:
+        agent_id, cidrs = parse_scope(request.data.get('scope'))
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    stream = open_stream(agent_id, cidrs)
+    return Response({"stream_id": stream.pk}, status=status.HTTP_201_CREATED)
+
+
+@api_view(['POST'])
+@parser_classes([NDJSONParser])
+def upload_scan_stream(request, stream_id):
+    """
+    Apply an NDJSON chunk of device records to an open scan stream, upserting them in
+    micro-batches while the body is read (see scan_stream.ingest_stream_chunk).
+
+    A final {"type": "complete"} line marks the devices the scan did not see as down.
+    Answers 409 once the stream is complete.
+    """
+    stream = ScanStream.objects.select_related('scan').filter(pk=stream_id).first()
+    if stream is None:
+        return Response({"error": "Scan stream not found"}, status=status.HTTP_404_NOT_FOUND)
+    try:
+        applied, completed = ingest_stream_chunk(stream, request.data)
+    except StreamClosed:
+        return Response({"error": "Scan stream is already complete"}, status=status.HTTP_409_CONFLICT)
+    except ParseError as e:
+        return Response({"error": e.detail}, status=status.HTTP_400_BAD_REQUEST)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({"applied": applied, "complete": completed}, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+def get_scan_queue(request):
+    """Report the ingest mode, queued reports, lag of the oldest one and writer counters."""
+    return Response(ingest_queue.stats(), status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+def get_device_history(request, mac_address):
+    """
+    Retrieve one page of a device's ping history, newest first, reading both the raw
+    pings and the segments they were archived into.
+
+    Query params: `since`/`until` (ISO 8601), `limit` and `cursor`.
+    """
+    params = request.query_params
+    try:
+        since = parse_timestamp('since', params.get('since'))
+        until = parse_timestamp('until', params.get('until'))
+        limit = parse_limit(params.get('limit'))
+        entries, next_cursor = device_history(mac_address, since, until, params.get('cursor'), limit)
+    except (InvalidQueryParam, ValidationError) as e:
+        message = str(e) if isinstance(e, InvalidQueryParam) else "Invalid cursor"
+        return Response({"error": message}, status=status.HTTP_400_BAD_REQUEST)
+
+    serializer = DeviceHistoryEntrySerializer(entries, many=True)
+    return Response({"results": serializer.data, "next_cursor": next_cursor})
+
+
+@api_view(['GET'])
+def get_device_availability(request):
+    """
+    Report uptime %, outage count, MTBF and longest outage per device over a time window.
+
+    Query params: `since`/`until` (ISO 8601, default the last 7 days), `mac_address`,
+    `location` and `group_by=location` to aggregate per location instead of per device.
+    """
+    params = request.query_params
+    try:
+        until = parse_timestamp('until', params.get('until'))
+        since = parse_timestamp('since', params.get('since'))
+    except InvalidQueryParam as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    group_by = params.get('group_by')
+    if group_by not in (None, '', 'location'):
+        return Response({"error": "group_by must be 'location'"}, status=status.HTTP_400_BAD_REQUEST)
+
+    # Never extrapolate the current state into the future
+    until = min(until or timezone.now(), timezone.now())
+    since = since or until - timedelta(days=AVAILABILITY_DEFAULT_DAYS)
+    if since >= until:
+        return Response({"error": "since must be before until"}, status=status.HTTP_400_BAD_REQUEST)
+
+    results = availability(
+        since, until,
+        mac_address=params.get('mac_address'),
+        location=params.get('location'),
+        group_by_location=group_by == 'location',
     )
+    return Response({"since": since, "until": until, "results": results}, status=status.HTTP_200_OK)
 
-    return Response({"message": "Scan created and statuses updated successfully"}, status=status.HTTP_201_CREATED)
+
+@api_view(['GET'])
+def get_device_latency(request):
+    """
+    Report /status RTT percentiles (p50/p90/p99), mean, max and failures by reason per
+    device over a time window, with a per-minute or per-hour trend.
+
+    Query params: `since`/`until` (ISO 8601, default the last 24 hours), `mac_address`,
+    `location`, `group_by=location` to merge devices per location, and `resolution`
+    (`minute` or `hour`; minute for windows up to 6 hours by default).
+    """
+    params = request.query_params
+    try:
+        until = parse_timestamp('until', params.get('until'))
+        since = parse_timestamp('since', params.get('since'))
+    except InvalidQueryParam as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    group_by = params.get('group_by')
+    if group_by not in (None, '', 'location'):
+        return Response({"error": "group_by must be 'location'"}, status=status.HTTP_400_BAD_REQUEST)
+
+    until = until or timezone.now()
+    since = since or until - timedelta(hours=LATENCY_DEFAULT_HOURS)
+    if since >= until:
+        return Response({"error": "since must be before until"}, status=status.HTTP_400_BAD_REQUEST)
+    resolution = params.get('resolution') or ('minute' if until - since <= LATENCY_MINUTE_WINDOW else 'hour')
+    if resolution not in RESOLUTIONS:
+        return Response({"error": "resolution must be 'minute' or 'hour'"}, status=status.HTTP_400_BAD_REQUEST)
+
+    results = device_latency(
+        since, until, resolution,
+        mac_address=params.get('mac_address'),
+        location=params.get('location'),
+        group_by_location=group_by == 'location',
+    )
+    return Response(
+        {"since": since, "until": until, "resolution": resolution, "results": results}, status=status.HTTP_200_OK,
+    )
 
 
 @api_view(['GET'])
-def get_device_statuses(request):
-    """Retrieve the full list of device statuses."""
-    statuses = DeviceStatus.objects.all()
-    serializer = DeviceStatusSerializer(statuses, many=True)
-    return Response(serializer.data, status=status.HTTP_200_OK)
+def get_device_summary(request):
+    """
+    Retrieve the fleet's headline numbers: devices up and down overall, per location and
+    per firmware version, and devices added or lost over the last hour.
+
+    Read from the summary rows ingest keeps current, not from the device list. Query
+    params: `limit`, the locations and versions listed (default 100, in name order);
+    `locations_truncated`/`versions_truncated` tell whether more exist.
+    """
+    try:
+        limit = parse_limit(request.query_params.get('limit'), SUMMARY_BREAKDOWN_LIMIT, SUMMARY_BREAKDOWN_MAX)
+    except InvalidQueryParam as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(fleet_summary(limit), status=status.HTTP_200_OK)
+
+
+def status_version_etag_for(token, renderer_format):
+    """ETag of the status snapshot at `token` in the negotiated representation."""
+    etag = status_version_etag(token)
+    return etag if renderer_format == 'json' else f'{etag[:-1]}-{renderer_format}"'
+
+
+def status_version_headers(token, renderer_format='json'):
+    """
+    Validator headers describing the status snapshot at `token`.
+
+    Last-Modified has whole seconds, so it is the change time rounded up, and left out
+    until that second is over: a copy served earlier could miss a change later in the
+    same second.
+    """
+    headers = {'ETag': status_version_etag_for(token, renderer_format), 'Vary': 'Accept'}
+    modified = status_version_modified(token)
+    if modified is not None and math.ceil(modified) <= time.time():
+        headers['Last-Modified'] = http_date(math.ceil(modified))
+    return headers
+
+
+@api_view(['POST'])
+def create_scan_delta(request):
+    """
+    Apply a full or delta report of the delta scan protocol (see delta.apply_scan_report).
+
+    Answers 200 with the acknowledged `seq` and `digest`, or 409 when the scanner must
+    resend its whole state as a full report.
+    """
+    try:
+        agent_id, cidrs = parse_scope(request.data.get('scope'))
+        seq, digest = apply_scan_report(request.data, agent_id, cidrs)
+    except ResyncRequired as e:
+        return Response(
+            {"error": "Resync required", "reason": e.reason, "expected_seq": e.expected_seq},
+            status=status.HTTP_409_CONFLICT,
+        )
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({"seq": seq, "digest": digest}, status=status.HTTP_200_OK)
+
+
+@async_api_view(['GET'])
+@renderer_classes(LIST_RENDERERS)
+async def get_device_statuses(request):
+    """
+    Retrieve the full list of device statuses.
+
+    Served from the per-process status snapshot; polls carrying a matching If-None-Match
+    or a current If-Modified-Since get a 304 without touching the database, answered
+    from the event loop under ASGI.
+
+    With any query parameter the statuses are queried instead and one page is returned
+    as {results, next_cursor}. Filters: `is_up`, `is_stale`, `location` and `version`
+    (repeat to match several values), `ip` (IPv4 CIDR or address prefix) and
+    `last_seen_since`/`last_seen_until`. Also `ordering` (a field, optionally prefixed
+    with '-'), `fields` (comma-separated sparse fieldset), `limit` and `cursor`.
+    """
+    if DEVICE_QUERY_PARAMS.intersection(request.query_params):
+        params = request.query_params
+        try:
+            limit = parse_limit(params.get('limit'))
+            devices, ordering, fields = query_device_statuses(params)
+            page, next_cursor = await apaginate(devices, ordering, params.get('cursor'), limit)
+        except InvalidQueryParam as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"results": instance_records(page, fields), "next_cursor": next_cursor})
+
+    renderer_format = request.accepted_renderer.format
+    token = read_status_version()
+    etag = status_version_etag_for(token, renderer_format)
+    modified = status_version_modified(token)
+    headers = status_version_headers(token, renderer_format)
+
+    # If-Modified-Since only counts without If-None-Match (RFC 9110 13.1.3)
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match is not None:
+        not_modified = etag in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*'
+    else:
+        since = parse_http_date_safe(request.headers.get('If-Modified-Since') or '')
+        not_modified = since is not None and modified is not None and math.ceil(modified) <= since
+    if not_modified:
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    token, data = await aget_status_snapshot()
+    return Response(data, status=status.HTTP_200_OK, headers=status_version_headers(token, renderer_format))
+
+
+@api_view(['GET'])
+def get_janus_config(request):
+    """
+    Render the Janus streaming mountpoint config for every device with a stream ID.
+
+    The ETag is a hash of the config, so the Janus updater can send If-None-Match and
+    only reload Janus when it gets a 200.
+    """
+    config, etag = render_janus_config()
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match is not None and etag in [tag.strip() for tag in if_none_match.split(',')]:
+        return HttpResponse(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+    return HttpResponse(config, content_type='text/plain; charset=utf-8', headers={'ETag': etag})
+
+
+@api_view(['GET'])
+def get_metrics(request):
+    """Expose request, query and ingest metrics plus fleet gauges in the Prometheus text format."""
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+async def device_status_events(request):
+    """
+    Push DeviceStatus changes as Server-Sent Events (requires running under ASGI).
+
+    Reconnecting clients send Last-Event-ID (or `last_event_id`) to resume where they
+    left off; see events.status_event_stream for the event format.
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({"error": "Status events require the ASGI server"}, status=status.HTTP_501_NOT_IMPLEMENTED)
+    last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+    response = StreamingHttpResponse(status_event_stream(last_event_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Keep reverse proxies from buffering the stream
+    return response
 
 
 @api_view(['PATCH'])
@@ -100,12 +496,17 @@ def update_device_status(request, mac_address):
     location = request.data.get('location')
     version = request.data.get('version')
 
+    now = timezone.now()
+    before = (device.is_up, device.last_seen, device.initial_uptime, device.location, device.version)
+    transition = None
     # Update the status and location if provided
     if is_up is not None:
+        if bool(is_up) != device.is_up:
+            transition = DeviceStatusTransition(mac_address=mac_address, is_up=bool(is_up), timestamp=now)
         device.is_up = is_up
-        device.last_seen = timezone.now()
+        device.last_seen = now
         if is_up:
-            device.initial_uptime = timezone.now() if not device.initial_uptime else device.initial_uptime
+            device.initial_uptime = now if not device.initial_uptime else device.initial_uptime
 
     if location is not None:
         device.location = location
@@ -113,15 +514,75 @@ def update_device_status(request, mac_address):
     if version is not None:
         device.version = version
 
-    device.save()
+    with transaction.atomic():
+        device.save()
+        if transition:
+            transition.save()
+        summary = SummaryDelta()
+        summary.move((before[0], before[3], before[4]), (bool(device.is_up), device.location, device.version))
+        summary.apply(now)
+        if (device.is_up, device.last_seen, device.initial_uptime, device.location, device.version) != before:
+            publish_status_change()
+        if (device.is_up, device.location, device.version) != (before[0], before[3], before[4]):
+            publish_device_changes([mac_address])
     return Response({"message": "Device status updated"}, status=status.HTTP_200_OK)
 
-def send_request_to_device(ip_address, endpoint, payload):
-    url = f"http://{ip_address}{endpoint}"
+@api_view(['GET'])
+def get_scan_agents(request):
+    """Retrieve the scanner agents with their scope, last report time and stale flag."""
+    agents = ScanAgent.objects.all().order_by('agent_id')
+    serializer = ScanAgentSerializer(agents, many=True)
+    return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+def send_fleet_command(request):
+    """
+    POST a JSON `payload` to `endpoint` on every up device matched by `targets`
+    (`mac_addresses`, `location` and/or `version`).
 
+    Requests fan out concurrently (`concurrency`, default 32) within an overall
+    `deadline` in seconds (default 30). The response streams NDJSON: a line with the job
+    id, one line per device as its request completes, then a summary line. With
+    `"background": true` the command runs on the server instead and the answer is 202
+    with the job to poll at /api/devices/commands/<id>/.
+    """
     try:
-        response = requests.post(url, data=json.dumps(payload), timeout=5)
-        response.raise_for_status()  # Raise an exception for HTTP errors
-        return {"ip": ip_address, "success": True, "response": response.json()}
-    except requests.RequestException as e:
-        return {"ip": ip_address, "success": False, "error": str(e)}
\ No newline at end of file
+        concurrency = parse_bounded_int(
+            'concurrency', request.data.get('concurrency'), FLEET_DEFAULT_CONCURRENCY, FLEET_MAX_CONCURRENCY,
+        )
+        deadline = parse_bounded_int(
+            'deadline', request.data.get('deadline'), FLEET_DEFAULT_DEADLINE_SECONDS, FLEET_MAX_DEADLINE_SECONDS,
+        )
+        command = create_fleet_command(
+            request.data.get('endpoint'), request.data.get('payload', {}), request.data.get('targets'),
+        )
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    if request.data.get('background'):
+        transaction.on_commit(lambda: start_fleet_command(command, concurrency, deadline))
+        return Response(FleetCommandSerializer(command).data, status=status.HTTP_202_ACCEPTED)
+
+    def lines():
+        yield json.dumps({"job": command.pk, "device_count": command.device_count}) + "\n"
+        for result in run_fleet_command(command, concurrency, deadline):
+            yield json.dumps(result) + "\n"
+        yield json.dumps({
+            "job": command.pk, "status": command.status, "succeeded": command.succeeded, "failed": command.failed,
+        }) + "\n"
+
+    chunks = lines()
+    if isinstance(request._request, ASGIRequest):
+        # Otherwise Django reads every line before sending the first one under ASGI
+        chunks = async_chunks(chunks)
+    return StreamingHttpResponse(chunks, content_type='application/x-ndjson')
+
+
+@api_view(['GET'])
+def get_fleet_command(request, command_id):
+    """Retrieve a fleet command job with the results received so far."""
+    command = FleetCommand.objects.filter(pk=command_id).prefetch_related('results').first()
+    if command is None:
+        return Response({"error": "Command not found"}, status=status.HTTP_404_NOT_FOUND)
+    return Response(FleetCommandDetailSerializer(command).data, status=status.HTTP_200_OK)
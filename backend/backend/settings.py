@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 from pathlib import Path
 import logging
+import os
 logging.basicConfig(level=logging.INFO)
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -24,8 +25,13 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # SECURITY WARNING: keep the secret key used in production secret!
 SECRET_KEY = 'django-insecure-=tac9fw81&4hk9pm(ypzq!+b)^d#du$452n#a5ezljuev&hhy-'
 
+# "development" runs with DEBUG and reloads the browser when the frontend build changes.
+# "production" turns both off and serves the built frontend through backend.views with
+# precompressed, long-cached assets and an in-memory index.html.
+SERVING_PROFILE = os.environ.get('SERVING_PROFILE', 'development')
+
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = SERVING_PROFILE != 'production'
 
 ALLOWED_HOSTS = ["*"]
 
@@ -40,24 +46,29 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
-    "django_browser_reload",
     'rest_framework',
     'corsheaders',
     'api',
 ]
 
+# Django's middleware, swapped for the api.middleware versions that run their hooks on
+# the event loop under ASGI when they do not block
 MIDDLEWARE = [
-    'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
-    'django.middleware.common.CommonMiddleware',
-    'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
-    'django.contrib.messages.middleware.MessageMiddleware',
-    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.metrics.MetricsMiddleware',
+    'api.middleware.SecurityMiddleware',
+    'api.middleware.SessionMiddleware',
+    'api.middleware.CommonMiddleware',
+    'api.middleware.CsrfViewMiddleware',
+    'api.middleware.AuthenticationMiddleware',
+    'api.middleware.MessageMiddleware',
+    'api.middleware.XFrameOptionsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
-    "django_browser_reload.middleware.BrowserReloadMiddleware",
 ]
 
+if DEBUG:
+    INSTALLED_APPS.append("django_browser_reload")
+    MIDDLEWARE.append("django_browser_reload.middleware.BrowserReloadMiddleware")
+
 ROOT_URLCONF = 'backend.urls'
 
 TEMPLATES = [
@@ -82,13 +93,33 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# "sync" applies scan reports inside the POST /api/scans/ request. "queue" answers 202 and
+# applies them on a single background writer (api/ingest_queue.py), with the SQLite
+# database in WAL mode so dashboard reads are not blocked by the writer.
+SCAN_INGEST_MODE = os.environ.get('SCAN_INGEST_MODE', 'sync')
+# Reports waiting for the writer before POST /api/scans/ answers 503
+SCAN_INGEST_QUEUE_SIZE = 1000
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Seconds a connection waits for the write lock before "database is locked"
+        'OPTIONS': {'timeout': 20 if SCAN_INGEST_MODE == 'queue' else 5},
     }
 }
 
+# Shared counter bumped whenever DeviceStatus changes, used to invalidate the
+# per-process status snapshot cache across workers
+STATUS_VERSION_FILE = BASE_DIR / 'status_version'
+
+# Devices covered by a scanner agent that has not reported for this long are flagged stale
+SCAN_AGENT_STALE_SECONDS = 60
+
+# Days the keys of reports applied through POST /api/scans/batch/ are kept to skip resends;
+# longer than a scanner keeps a report in its spool
+SCAN_REPORT_KEY_DAYS = 7
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -127,6 +158,8 @@ USE_TZ = True
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [BASE_DIR / 'static']
 STATIC_ROOT = BASE_DIR / 'staticfiles'
+# Output directory of the Vue build (vue-frontend/vue.config.js), served at /static/dist/
+FRONTEND_DIST_DIR = BASE_DIR / 'static' / 'dist'
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
@@ -14,6 +14,7 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include, re_path
 from . import views
@@ -21,7 +22,15 @@ from . import views
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('api.urls')),  # Include API app URLs
+    re_path(r'^api/', views.api_not_found),  # Keep unknown API URLs off the frontend fallback
+    path('static/dist/<path:path>', views.asset, name='asset'),  # Built frontend files, with precompressed variants
     path('', views.frontend, name='frontend'),  # Serve Vue's index.html
-    path('__reload__/', include("django_browser_reload.urls")),
-    re_path(r"^(?:.*)/?$", views.frontend, name='frontend'),  # Catch all other URLs
 ]
+
+if settings.DEBUG:
+    urlpatterns.append(path('__reload__/', include("django_browser_reload.urls")))
+else:
+    # Admin and browsable API styles, gathered by `collectstatic`; runserver only serves them itself with DEBUG
+    urlpatterns.append(path('static/<path:path>', views.static_file, name='static'))
+
+urlpatterns.append(re_path(r"^(?!static/)(?:.*)/?$", views.frontend, name='frontend'))  # Catch all other URLs
@@ -1,4 +1,121 @@
+import gzip
+import hashlib
+import mimetypes
+import re
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, JsonResponse
 from django.shortcuts import render
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+# Vue CLI names built files with a content hash, e.g. js/app.3f2a1c9e.js, so they never change
+HASHED_NAME = re.compile(r'\.[0-9a-f]{8,}\.')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+# Precompressed variants written by `manage.py compress_assets`, in order of preference
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+# (mtime, body, gzipped body, etag) of the built index.html, loaded once per process
+_index_cache = None
+
+
+def accepted_encodings(request):
+    """Content codings the client accepts (those without q=0)."""
+    accepted = set()
+    for item in request.headers.get('Accept-Encoding', '').split(','):
+        coding, _, params = item.partition(';')
+        if params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def load_index():
+    global _index_cache
+    path = settings.FRONTEND_DIST_DIR / 'index.html'
+    try:
+        mtime = path.stat().st_mtime
+    except FileNotFoundError:
+        raise Http404("The frontend has not been built")
+    if _index_cache is None or _index_cache[0] != mtime:
+        body = path.read_bytes()
+        _index_cache = (mtime, body, gzip.compress(body, mtime=0), f'"{hashlib.sha1(body).hexdigest()}"')
+    return _index_cache
+
 
 def frontend(request):
-    return render(request, 'index.html')
\ No newline at end of file
+    """
+    Serve Vue's index.html for every frontend route.
+
+    In development it is rendered from the build directory on each request. Otherwise the
+    built file, which holds no template tags, is kept in memory with a gzipped copy and
+    revalidated by ETag; it is re-read when a new build replaces it.
+    """
+    if settings.DEBUG:
+        return render(request, 'index.html')
+    _, body, gzipped, etag = load_index()
+    if etag in [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]:
+        response = HttpResponseNotModified()
+    elif 'gzip' in accepted_encodings(request):
+        response = HttpResponse(gzipped, content_type='text/html; charset=utf-8')
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = HttpResponse(body, content_type='text/html; charset=utf-8')
+    response['ETag'] = etag
+    response['Cache-Control'] = 'no-cache'
+    response['Vary'] = 'Accept-Encoding'
+    return response
+
+
+def asset(request, path):
+    """
+    Serve a file of the frontend build, picking its .br or .gz variant when the client
+    accepts it. Hashed file names are cached by browsers for a year without revalidation.
+    """
+    return serve_file(request, settings.FRONTEND_DIST_DIR, path)
+
+
+def static_file(request, path):
+    """
+    Serve a file collected into STATIC_ROOT by `collectstatic`, such as the admin and
+    browsable API styles, the same way as the frontend build.
+    """
+    return serve_file(request, settings.STATIC_ROOT, path)
+
+
+def serve_file(request, root, path):
+    try:
+        full_path = Path(safe_join(root, path))
+    except SuspiciousFileOperation:
+        raise Http404()
+    if full_path.suffix in ('.br', '.gz') or not full_path.is_file():
+        raise Http404()
+
+    mtime = full_path.stat().st_mtime
+    hashed = bool(HASHED_NAME.search(full_path.name))
+    if not hashed and not was_modified_since(request.headers.get('If-Modified-Since'), mtime):
+        return HttpResponseNotModified()
+
+    served, encoding = full_path, None
+    accepted = accepted_encodings(request)
+    for coding, suffix in ENCODINGS:
+        variant = full_path.with_name(full_path.name + suffix)
+        if coding in accepted and variant.is_file():
+            served, encoding = variant, coding
+            break
+
+    content_type = mimetypes.guess_type(full_path.name)[0] or 'application/octet-stream'
+    response = FileResponse(served.open('rb'), content_type=content_type, filename=full_path.name)
+    if encoding:
+        response['Content-Encoding'] = encoding
+    response['Vary'] = 'Accept-Encoding'
+    response['Last-Modified'] = http_date(mtime)
+    response['Cache-Control'] = IMMUTABLE if hashed else 'no-cache'
+    return response
+
+
+def api_not_found(request):
+    """Unknown /api/ URLs get a JSON 404 instead of the frontend's index.html."""
+    return JsonResponse({"error": "Not found"}, status=404)
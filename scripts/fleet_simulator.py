@@ -0,0 +1,235 @@
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import sys
+import threading
+import time
+from ipaddress import ip_network
+
+import network_scanner  # Imported from this directory when run as scripts/fleet_simulator.py
+
+# Port the network scanner probes /status on
+CAMERA_PORT = 80
+
+def parse_arguments():
+    """Parse command-line arguments for configuration variables."""
+    parser = argparse.ArgumentParser(
+        description="Simulate a fleet of cameras answering /status on loopback addresses, and benchmark the "
+                    "network scanner against it.")
+
+    parser.add_argument("--count", type=int, default=100,
+                        help="Number of fake cameras")
+    parser.add_argument("--network_cidr", type=str, default="127.20.0.0/16",
+                        help="Loopback CIDR the cameras get consecutive addresses from")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="Mean delay in seconds before a camera answers")
+    parser.add_argument("--jitter", type=float, default=0.0,
+                        help="Random extra delay in seconds, uniform in [0, jitter]")
+    parser.add_argument("--flaky", type=float, default=0.0,
+                        help="Probability that a camera answers a request with a 503 or drops the connection")
+    parser.add_argument("--churn", type=float, default=0.0,
+                        help="Fraction of cameras that go offline or come back every --churn_interval seconds")
+    parser.add_argument("--churn_interval", type=float, default=10,
+                        help="Seconds between churn steps")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="Random seed, for repeatable fleets")
+    parser.add_argument("--bench", action="store_true",
+                        help="Sweep the fleet with the scanner's probe engines and report timings instead of serving")
+    parser.add_argument("--engines", nargs="+", choices=["threads", "asyncio"], default=["threads", "asyncio"],
+                        help="Probe engines to benchmark")
+    parser.add_argument("--rounds", type=int, default=3,
+                        help="Sweeps per engine")
+    parser.add_argument("--timeout", type=float, default=1,
+                        help="Probe timeout in seconds")
+    parser.add_argument("--workers", type=int, default=64,
+                        help="Threads of the 'threads' engine")
+    parser.add_argument("--concurrency", type=int, default=512,
+                        help="In-flight probes of the 'asyncio' engine")
+    parser.add_argument("--output", type=str, default=None,
+                        help="Write the benchmark results to this JSON file")
+    parser.add_argument("--baseline", type=str, default=None,
+                        help="Compare the benchmark results with this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed slowdown against the baseline, as a fraction")
+
+    return parser.parse_args()
+
+class FakeCamera:
+    def __init__(self, index, ip, rng):
+        self.ip = ip
+        self.mac = f"02:00:{(index >> 24) & 0xff:02x}:{(index >> 16) & 0xff:02x}:{(index >> 8) & 0xff:02x}:{index & 0xff:02x}"
+        self.ssid = f"cam-{index}"
+        self.location = f"site-{index % 10}/pole-{index}"
+        self.version = rng.choice(["1.4.2", "1.5.0", "1.5.1"])
+        self.server = None
+
+    @property
+    def online(self):
+        return self.server is not None
+
+    def status(self):
+        return {"ssid": self.ssid, "ip": self.ip, "mac": self.mac, "version": self.version, "location": self.location}
+
+class FakeFleet:
+    """
+    Fake cameras, each an HTTP server on its own loopback address answering GET /status
+    like a real camera, run on an asyncio loop in a background thread.
+
+    An offline camera closes its listening socket, so probes get a refused connection as
+    with a real device that is switched off.
+    """
+
+    def __init__(self, count, network_cidr="127.20.0.0/16", latency=0.0, jitter=0.0, flaky=0.0,
+                 churn=0.0, churn_interval=10, seed=None):
+        self.rng = random.Random(seed)
+        hosts = ip_network(network_cidr).hosts()
+        self.cameras = [FakeCamera(index, str(next(hosts)), self.rng) for index in range(count)]
+        self.latency = latency
+        self.jitter = jitter
+        self.flaky = flaky
+        self.churn = churn
+        self.churn_interval = churn_interval
+        self.requests = 0
+        self.loop = asyncio.new_event_loop()
+        self.thread = None
+
+    async def handle(self, camera, reader, writer):
+        try:
+            request = await reader.readuntil(b"\r\n\r\n")
+            self.requests += 1
+            delay = self.latency + self.rng.uniform(0, self.jitter)
+            if delay:
+                await asyncio.sleep(delay)
+            if self.flaky and self.rng.random() < self.flaky:
+                if self.rng.random() < 0.5:
+                    return  # Drop the connection without answering
+                status_line, body = "503 Service Unavailable", b""
+            elif request.split(b" ", 2)[1:2] == [b"/status"]:
+                status_line, body = "200 OK", json.dumps(camera.status()).encode()
+            else:
+                status_line, body = "404 Not Found", b""
+            writer.write(f"HTTP/1.1 {status_line}\r\nContent-Type: application/json\r\n"
+                         f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+            await writer.drain()
+        except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            writer.close()
+
+    async def bring_up(self, camera):
+        camera.server = await asyncio.start_server(
+            lambda reader, writer: self.handle(camera, reader, writer), camera.ip, CAMERA_PORT, backlog=64)
+
+    def take_down(self, camera):
+        camera.server.close()
+        camera.server = None
+
+    async def churn_loop(self):
+        while True:
+            await asyncio.sleep(self.churn_interval)
+            for camera in self.rng.sample(self.cameras, round(len(self.cameras) * self.churn)):
+                if camera.online:
+                    self.take_down(camera)
+                else:
+                    await self.bring_up(camera)
+
+    async def bring_up_all(self):
+        for camera in self.cameras:
+            await self.bring_up(camera)
+        if self.churn:
+            self.loop.create_task(self.churn_loop())
+
+    def start(self):
+        """Start serving in a background thread; returns once every camera is listening."""
+        self.thread = threading.Thread(target=self.loop.run_forever, name="fake-fleet", daemon=True)
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self.bring_up_all(), self.loop).result()
+        return self
+
+    def stop(self):
+        def close_all():
+            for camera in self.cameras:
+                if camera.online:
+                    self.take_down(camera)
+            self.loop.stop()
+        self.loop.call_soon_threadsafe(close_all)
+        self.thread.join()
+
+    def online(self):
+        """Return the MAC addresses of the cameras currently online."""
+        return {camera.mac for camera in self.cameras if camera.online}
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+def benchmark_scanner(fleet, args):
+    """Sweep the fleet's addresses with each probe engine and report duration and recall."""
+    hosts = [camera.ip for camera in fleet.cameras]
+    results = {}
+    for engine in args.engines:
+        durations = []
+        recall = []
+        for _ in range(args.rounds):
+            expected = fleet.online()
+            started = time.perf_counter()
+            if engine == "asyncio":
+                found = asyncio.run(network_scanner.scan_hosts_async(hosts, args.timeout, args.concurrency))
+            else:
+                found = network_scanner.scan_hosts(hosts, args.timeout, args.workers)
+            durations.append(time.perf_counter() - started)
+            found_macs = {device["mac_address"] for device in found}
+            recall.append(len(found_macs & expected) / len(expected) if expected else 1.0)
+        results[f"{engine}/{len(hosts)}"] = {
+            "p50_ms": round(statistics.median(durations) * 1000, 1),
+            "p99_ms": round(percentile(durations, 0.99) * 1000, 1),
+            "hosts_per_second": round(len(hosts) / statistics.median(durations), 1),
+            "recall": round(min(recall), 4),
+        }
+    return results
+
+def compare(results, baseline, tolerance):
+    """Return a line per benchmark that got slower than the baseline by more than `tolerance`."""
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if previous and result["p50_ms"] > previous["p50_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p50 {result['p50_ms']} ms, baseline {previous['p50_ms']} ms")
+    return regressions
+
+def main():
+    args = parse_arguments()
+    fleet = FakeFleet(args.count, args.network_cidr, args.latency, args.jitter, args.flaky,
+                      args.churn, args.churn_interval, args.seed).start()
+    print(f"Serving {args.count} fake cameras from {fleet.cameras[0].ip} to {fleet.cameras[-1].ip}, "
+          f"port {CAMERA_PORT}")
+
+    if not args.bench:
+        try:
+            while True:
+                time.sleep(args.churn_interval)
+                print(f"{len(fleet.online())} cameras online, {fleet.requests} requests served")
+        except KeyboardInterrupt:
+            fleet.stop()
+        return
+
+    results = benchmark_scanner(fleet, args)
+    fleet.stop()
+    for name, result in results.items():
+        print(f"{name}: p50 {result['p50_ms']} ms, p99 {result['p99_ms']} ms, "
+              f"{result['hosts_per_second']} hosts/s, recall {result['recall']}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"Regression: {line}")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
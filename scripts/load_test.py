@@ -0,0 +1,190 @@
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+from urllib.parse import urlsplit
+
+# Requests each scenario sends; the ETag of the status list is filled in before the run
+SCENARIOS = {
+    "statuses_304": ("GET", "/api/devices/statuses/", True),
+    "statuses": ("GET", "/api/devices/statuses/", False),
+    "statuses_query": ("GET", "/api/devices/statuses/?is_up=true&fields=mac_address,location,last_seen&limit=100", False),
+    "scans": ("GET", "/api/scans/reports/?limit=10&pings=false", False),
+    "create_scan": ("POST", "/api/scans/", False),
+}
+
+def parse_arguments():
+    """Parse command-line arguments for configuration variables."""
+    parser = argparse.ArgumentParser(
+        description="Load test the API with concurrent keep-alive clients and report throughput and latency "
+                    "per scenario, e.g. to compare server setups or worker counts.")
+
+    parser.add_argument("--url", type=str, default="http://127.0.0.1:8000",
+                        help="Base URL of the server under test")
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS),
+                        help="Scenarios to run, one after the other")
+    parser.add_argument("--concurrency", type=int, default=32,
+                        help="Clients sending requests back to back, each on its own connection")
+    parser.add_argument("--duration", type=float, default=10,
+                        help="Seconds each scenario runs")
+    parser.add_argument("--fleet", type=int, default=1000,
+                        help="Devices in each create_scan report; the server is seeded with one report first")
+    parser.add_argument("--output", type=str, default=None,
+                        help="Write the results to this JSON file")
+    parser.add_argument("--baseline", type=str, default=None,
+                        help="Compare the results with this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="Allowed throughput drop against the baseline, as a fraction")
+
+    return parser.parse_args()
+
+def make_fleet(size):
+    return [
+        {
+            "ssid": f"cam-{i}",
+            "mac_address": f"02:00:00:{(i >> 16) & 0xff:02x}:{(i >> 8) & 0xff:02x}:{i & 0xff:02x}",
+            "ip_address": f"10.{(i >> 16) & 0xff}.{(i >> 8) & 0xff}.{i & 0xff}",
+            "location": f"site-{i % 10}/pole-{i}",
+            "version": ("1.4.2", "1.5.0", "1.5.1")[i % 3],
+        }
+        for i in range(size)
+    ]
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+class Connection:
+    """A keep-alive HTTP/1.1 connection sending one request at a time."""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = self.writer = None
+
+    async def request(self, method, path, headers=None, body=b""):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        lines = [f"{method} {path} HTTP/1.1", f"Host: {self.host}:{self.port}", f"Content-Length: {len(body)}"]
+        lines += [f"{name}: {value}" for name, value in (headers or {}).items()]
+        self.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode() + body)
+        try:
+            head = await self.reader.readuntil(b"\r\n\r\n")
+            status_line, *header_lines = head.decode("latin-1").split("\r\n")
+            status = int(status_line.split()[1])
+            response_headers = {}
+            for line in header_lines:
+                if ":" in line:
+                    name, value = line.split(":", 1)
+                    response_headers[name.strip().lower()] = value.strip()
+            if status in (204, 304):
+                content = b""  # Never has a body, whatever Content-Length says
+            elif response_headers.get("transfer-encoding") == "chunked":
+                content = b""
+                while True:
+                    size = int((await self.reader.readuntil(b"\r\n")).split(b";")[0], 16)
+                    content += await self.reader.readexactly(size + 2)
+                    if not size:
+                        break
+            else:
+                content = await self.reader.readexactly(int(response_headers.get("content-length", 0)))
+            if response_headers.get("connection") == "close":
+                self.close()
+            return status, response_headers, content
+        except (OSError, asyncio.IncompleteReadError, ValueError):
+            self.close()
+            raise
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+async def run_scenario(name, url, concurrency, duration, fleet):
+    """Send the scenario's request from `concurrency` clients for `duration` seconds."""
+    method, path, conditional = SCENARIOS[name]
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+    headers = {}
+    body = b""
+    if method == "POST":
+        headers["Content-Type"] = "application/json"
+        body = json.dumps({"devices": fleet}).encode()
+    if conditional:
+        status, response_headers, _ = await Connection(host, port).request("GET", path)
+        headers["If-None-Match"] = response_headers.get("etag", '"none"')
+
+    durations = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def client():
+        nonlocal errors
+        connection = Connection(host, port)
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                status, _, _ = await connection.request(method, path, headers, body)
+            except (OSError, asyncio.IncompleteReadError, ValueError):
+                errors += 1
+                continue
+            if status >= 400:
+                errors += 1
+            else:
+                durations.append(time.perf_counter() - started)
+        connection.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": len(durations),
+        "errors": errors,
+        "rps": round(len(durations) / elapsed, 1),
+        "p50_ms": round(statistics.median(durations) * 1000, 2) if durations else None,
+        "p99_ms": round(percentile(durations, 0.99) * 1000, 2) if durations else None,
+    }
+
+async def run(args):
+    fleet = make_fleet(args.fleet)
+    parts = urlsplit(args.url)
+    # Seed the server so the read scenarios have devices and scans to return
+    status, _, _ = await Connection(parts.hostname, parts.port or 80).request(
+        "POST", "/api/scans/", {"Content-Type": "application/json"}, json.dumps({"devices": fleet}).encode())
+    if status >= 400:
+        sys.exit(f"Seeding the server failed with {status}")
+    results = {}
+    for name in args.scenarios:
+        results[f"{name}/{args.concurrency}"] = await run_scenario(name, args.url, args.concurrency, args.duration, fleet)
+    return results
+
+def compare(results, baseline, tolerance):
+    """Return a line per scenario whose throughput dropped below the baseline by more than `tolerance`."""
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if previous and result["rps"] < previous["rps"] * (1 - tolerance):
+            regressions.append(f"{name}: {result['rps']} req/s, baseline {previous['rps']} req/s")
+    return regressions
+
+def main():
+    args = parse_arguments()
+    results = asyncio.run(run(args))
+    for name, result in results.items():
+        print(f"{name}: {result['rps']} req/s, p50 {result['p50_ms']} ms, p99 {result['p99_ms']} ms, "
+              f"{result['errors']} errors")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"Regression: {line}")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,32 @@
 import requests
 import json
 import time
-from ipaddress import ip_network
+import asyncio
+import hashlib
+import os
+import queue
+import threading
+import uuid
+from bisect import bisect_left
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from ipaddress import ip_address, ip_network
+from itertools import islice
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import argparse
 
+# Largest /status response body the asyncio engine will read
+MAX_STATUS_BYTES = 64 * 1024
+STATUS_PORT = 80  # Port of the devices' HTTP /status endpoint
+ARP_TABLE = "/proc/net/arp"
+ARP_FLAG_COMPLETE = 0x2
+# Upper bounds of the report POST latency histogram, in seconds
+REPORT_LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+# Longest wait in seconds between attempts to deliver spooled reports while the API is down
+SPOOL_MAX_BACKOFF = 60
+# Hosts read and filtered at a time by the prefilter stages, to bound memory on large CIDRs
+PREFILTER_CHUNK = 4096
+
 def parse_arguments():
     """Parse command-line arguments for configuration variables."""
     parser = argparse.ArgumentParser(description="Network Scanner for detecting devices on a local network.")
@@ -19,59 +41,901 @@ def parse_arguments():
                         help="Timeout for each device check in seconds")
     parser.add_argument("--workers", type=int, default=20,
                         help="Number of parallel threads for network scanning")
+    parser.add_argument("--engine", choices=["threads", "asyncio"], default="threads",
+                        help="Probe engine: a thread pool of --workers, or asyncio with --concurrency probes in flight")
+    parser.add_argument("--concurrency", type=int, default=512,
+                        help="Maximum number of in-flight probes for the asyncio engine")
+    parser.add_argument("--scan_deadline", type=float, default=0,
+                        help="Stop the asyncio engine's sweep after this many seconds (0 for no deadline)")
+    parser.add_argument("--prefilter", nargs="*", choices=["arp", "tcp"], default=[],
+                        help="Cheap checks run before the HTTP probe: 'arp' passes hosts found in the kernel "
+                             "neighbour table, 'tcp' passes hosts accepting a TCP connection on port 80. With both, "
+                             "hosts missing from the neighbour table are TCP-checked instead of dropped")
+    parser.add_argument("--prefilter_timeout", type=float, default=0.3,
+                        help="Deadline in seconds for each TCP pre-filter connection attempt")
+    parser.add_argument("--delta", action="store_true",
+                        help="Send only added/changed/removed devices to the delta endpoint, with a full report "
+                             "whenever the server asks for a resync")
+    parser.add_argument("--delta_endpoint", type=str, default=None,
+                        help="Endpoint of the delta scan protocol (defaults to <api_endpoint>delta/)")
+    parser.add_argument("--agent_id", type=str, default=None,
+                        help="Report scans scoped to --network_cidr under this agent id, so several scanners "
+                             "can cover different subnets without marking each other's devices down")
+    parser.add_argument("--discovery_intervals", type=int, default=1,
+                        help="Spread the discovery sweep of the CIDR over this many scan intervals, probing known "
+                             "devices every interval (1 sweeps the whole CIDR every interval)")
+    parser.add_argument("--state_file", type=str, default=None,
+                        help="JSON file used to remember known devices between runs")
+    parser.add_argument("--statuses_endpoint", type=str, default=None,
+                        help="API endpoint listing device statuses, used to seed known devices "
+                             "(e.g. http://127.0.0.1:8000/api/devices/statuses/)")
+    parser.add_argument("--stream", action="store_true",
+                        help="Upload devices to a scan stream as they are found, and mark the devices the scan "
+                             "did not see down once it completes")
+    parser.add_argument("--stream_endpoint", type=str, default=None,
+                        help="Endpoint opening scan streams (defaults to <api_endpoint>streams/)")
+    parser.add_argument("--stream_flush_interval", type=float, default=0.5,
+                        help="Seconds found devices wait at most before being uploaded to the stream")
+    parser.add_argument("--metrics_port", type=int, default=0,
+                        help="Serve Prometheus metrics on this port at /metrics (0 disables the listener)")
+    parser.add_argument("--spool_dir", type=str, default=None,
+                        help="Write full reports to this directory and deliver them in batches from a background "
+                             "sender, so reports survive API outages and scans never wait for the POST")
+    parser.add_argument("--batch_endpoint", type=str, default=None,
+                        help="Endpoint taking batches of spooled reports (defaults to <api_endpoint>batch/)")
+    parser.add_argument("--batch_size", type=int, default=20,
+                        help="Spooled reports sent per request at most (the server accepts up to 100)")
+    parser.add_argument("--spool_max_age", type=float, default=86400,
+                        help="Drop spooled reports not delivered within this many seconds")
     
-    return parser.parse_args()
+    args = parser.parse_args()
+    if args.delta and args.stream:
+        parser.error("--delta and --stream cannot be combined")
+    if args.delta and args.spool_dir:
+        parser.error("--delta and --spool_dir cannot be combined")
+    if not 1 <= args.batch_size <= 100:
+        parser.error("--batch_size must be between 1 and 100")
+    return args
 
-def is_device_online(ip_address, timeout):
-    """Check if the device at the specified IP responds with the expected JSON structure."""
+class ScannerMetrics:
+    """Probe, sweep and report statistics of the scanner, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.probes = {}  # probe result -> count
+        self.reports = {}  # (kind, HTTP status or "error") -> count
+        self.report_latency = {}  # kind -> [bucket counts..., +Inf count, sum]
+        self.sweeps = 0
+        self.last_sweep = (0.0, 0.0, 0)  # duration, probes per second, devices found
+        self.spooled = 0  # Reports waiting in the spool
+
+    def probe(self, result):
+        with self.lock:
+            self.probes[result] = self.probes.get(result, 0) + 1
+
+    def probe_count(self):
+        with self.lock:
+            return sum(self.probes.values())
+
+    def sweep(self, seconds, probes, devices):
+        with self.lock:
+            self.sweeps += 1
+            self.last_sweep = (seconds, probes / seconds if seconds else 0.0, devices)
+
+    def spool(self, depth):
+        with self.lock:
+            self.spooled = depth
+
+    def report(self, kind, seconds, result):
+        with self.lock:
+            self.reports[(kind, result)] = self.reports.get((kind, result), 0) + 1
+            series = self.report_latency.setdefault(kind, [0] * (len(REPORT_LATENCY_BUCKETS) + 2))
+            series[bisect_left(REPORT_LATENCY_BUCKETS, seconds)] += 1
+            series[-1] += seconds
+
+    def render(self):
+        with self.lock:
+            duration, rate, devices = self.last_sweep
+            lines = [
+                "# HELP scanner_probes_total /status probes by result.",
+                "# TYPE scanner_probes_total counter",
+                *(f'scanner_probes_total{{result="{result}"}} {count}' for result, count in sorted(self.probes.items())),
+                "# HELP scanner_sweeps_total Scan intervals completed.",
+                "# TYPE scanner_sweeps_total counter",
+                f"scanner_sweeps_total {self.sweeps}",
+                "# HELP scanner_sweep_duration_seconds Duration of the last sweep.",
+                "# TYPE scanner_sweep_duration_seconds gauge",
+                f"scanner_sweep_duration_seconds {duration}",
+                "# HELP scanner_sweep_probes_per_second Probe rate of the last sweep.",
+                "# TYPE scanner_sweep_probes_per_second gauge",
+                f"scanner_sweep_probes_per_second {rate}",
+                "# HELP scanner_sweep_devices Devices found by the last sweep.",
+                "# TYPE scanner_sweep_devices gauge",
+                f"scanner_sweep_devices {devices}",
+                "# HELP scanner_spooled_reports Scan reports waiting in the spool.",
+                "# TYPE scanner_spooled_reports gauge",
+                f"scanner_spooled_reports {self.spooled}",
+                "# HELP scanner_reports_total Scan report POSTs by kind and HTTP status.",
+                "# TYPE scanner_reports_total counter",
+                *(f'scanner_reports_total{{kind="{kind}",result="{result}"}} {count}'
+                  for (kind, result), count in sorted(self.reports.items())),
+                "# HELP scanner_report_duration_seconds Latency of scan report POSTs.",
+                "# TYPE scanner_report_duration_seconds histogram",
+            ]
+            for kind, series in sorted(self.report_latency.items()):
+                cumulative = 0
+                for bound, count in zip((*REPORT_LATENCY_BUCKETS, "+Inf"), series):
+                    cumulative += count
+                    lines.append(f'scanner_report_duration_seconds_bucket{{kind="{kind}",le="{bound}"}} {cumulative}')
+                lines.append(f'scanner_report_duration_seconds_sum{{kind="{kind}"}} {series[-1]}')
+                lines.append(f'scanner_report_duration_seconds_count{{kind="{kind}"}} {cumulative}')
+        return "\n".join(lines) + "\n"
+
+metrics = ScannerMetrics()
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Keep scrapes out of the scan log
+
+def start_metrics_server(port):
+    """Serve the scanner metrics at http://<host>:<port>/metrics from a daemon thread."""
+    server = ThreadingHTTPServer(("", port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
+
+def is_valid_status(data):
+    """Check for required keys in a /status JSON response to confirm device validity."""
+    return isinstance(data, dict) and all(key in data for key in ["ssid", "ip", "mac"])
+
+def probe_device(ip_address, timeout):
+    """
+    Probe /status at the specified IP and return (JSON data or None, result, RTT in ms).
+
+    The result is "found", or why the probe failed: "timeout", "refused", "error" or "not_device".
+    """
+    start = time.monotonic()
+    data, result = None, "not_device"
     try:
         response = requests.get(f"http://{ip_address}/status", timeout=timeout)
         if response.status_code == 200:
-            data = response.json()
-            # Check for required keys in JSON response to confirm device validity
-            if all(key in data for key in ["ssid", "ip", "mac"]):
-                return data  # Return the JSON data if it matches expected structure
+            body = response.json()
+            if is_valid_status(body):
+                data, result = body, "found"
+    except requests.Timeout:
+        result = "timeout"
+    except requests.ConnectionError:
+        result = "refused"
     except (requests.RequestException, json.JSONDecodeError):
-        pass
-    return None
+        result = "error"
+    metrics.probe(result)
+    return data, result, (time.monotonic() - start) * 1000
+
+def is_device_online(ip_address, timeout):
+    """Check if the device at the specified IP responds with the expected JSON structure."""
+    return probe_device(ip_address, timeout)[0]
 
-def check_device(ip, timeout):
-    """Check if a single IP address is a valid device and return device info if online."""
+def device_record(device_data):
+    """Build the scan report entry for a device from its /status JSON."""
+    return {
+        "ssid": device_data["ssid"],
+        "ip_address": device_data["ip"],
+        "mac_address": device_data["mac"],
+        "version": device_data.get("version", ""),
+        "location": device_data.get("location", ""),
+    }
+
+def check_device(ip, timeout, telemetry=None):
+    """
+    Check if a single IP address is a valid device and return device info if online.
+
+    With a `telemetry` dict, also store (MAC address or None, result, RTT in ms) under the IP.
+    """
     ip_address = str(ip)
-    device_data = is_device_online(ip_address, timeout)
-    if device_data:
-        return {
-            "ssid": device_data["ssid"],
-            "ip_address": device_data["ip"],
-            "mac_address": device_data["mac"],
-            "version": device_data.get("version", ""),
-            "location": device_data.get("location", ""),
-        }
-    return None
+    device_data, result, rtt_ms = probe_device(ip_address, timeout)
+    record = device_record(device_data) if device_data else None
+    if telemetry is not None:
+        telemetry[ip_address] = (record and record["mac_address"], result, rtt_ms)
+    return record
 
 def scan_network(network_cidr, timeout, workers):
     """Scan the network for devices responding with valid JSON structure."""
+    return scan_hosts(ip_network(network_cidr).hosts(), timeout, workers)
+
+def scan_hosts(hosts, timeout, workers, telemetry=None, on_device=None):
+    """
+    Probe the given addresses for devices responding with valid JSON structure.
+
+    `on_device` is called with each device as soon as its probe completes.
+    """
     devices = []
     with ThreadPoolExecutor(max_workers=workers) as executor:
-        futures = {executor.submit(check_device, ip, timeout): ip for ip in ip_network(network_cidr).hosts()}
+        futures = {executor.submit(check_device, ip, timeout, telemetry): ip for ip in hosts}
         
         for future in as_completed(futures):
             result = future.result()
             if result:
                 devices.append(result)
+                if on_device:
+                    on_device(result)
 
     return devices
 
-def send_scan_report(devices, api_endpoint):
+async def read_http_response(reader):
+    """Read one HTTP/1.1 response and return (status code, body bytes)."""
+    head = await reader.readuntil(b"\r\n\r\n")
+    status_line, *header_lines = head.decode("latin-1").split("\r\n")
+    status_code = int(status_line.split()[1])
+    headers = {}
+    for line in header_lines:
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        body = b""
+        while True:
+            size = int((await reader.readuntil(b"\r\n")).split(b";")[0], 16)
+            if size == 0:
+                break
+            if len(body) + size > MAX_STATUS_BYTES:
+                raise ValueError("Response too large")
+            body += await reader.readexactly(size)
+            await reader.readexactly(2)  # CRLF after each chunk
+    elif "content-length" in headers:
+        length = int(headers["content-length"])
+        if length > MAX_STATUS_BYTES:
+            raise ValueError("Response too large")
+        body = await reader.readexactly(length)
+    else:
+        # Delimited by the end of the connection (the request asks for Connection: close)
+        body = b""
+        while chunk := await reader.read(MAX_STATUS_BYTES + 1 - len(body)):
+            body += chunk
+            if len(body) > MAX_STATUS_BYTES:
+                raise ValueError("Response too large")
+    return status_code, body
+
+async def request_status(ip_address, timeout):
+    """GET /status over a new connection, each of connecting and reading the response within `timeout`."""
+    writer = None
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(ip_address, STATUS_PORT), timeout)
+        writer.write(f"GET /status HTTP/1.1\r\nHost: {ip_address}\r\nAccept: */*\r\n"
+                     f"Connection: close\r\n\r\n".encode())
+        return await asyncio.wait_for(read_http_response(reader), timeout)
+    finally:
+        if writer is not None:
+            writer.close()
+
+async def probe_device_async(ip_address, timeout, budget=None):
+    """
+    asyncio counterpart of probe_device, using one short-lived connection per probe.
+
+    `budget` (seconds) bounds the whole probe, connection and response together.
+    """
+    start = time.monotonic()
+    data, result = None, "not_device"
+    try:
+        status_code, body = await asyncio.wait_for(request_status(ip_address, timeout), budget)
+        if status_code == 200:
+            body = json.loads(body.decode("utf-8-sig"))
+            if is_valid_status(body):
+                data, result = body, "found"
+    except asyncio.TimeoutError:
+        result = "timeout"
+    except OSError:
+        result = "refused"
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError, IndexError, UnicodeDecodeError):
+        result = "error"
+    metrics.probe(result)
+    return data, result, (time.monotonic() - start) * 1000
+
+async def is_device_online_async(ip_address, timeout):
+    """asyncio counterpart of is_device_online."""
+    return (await probe_device_async(ip_address, timeout))[0]
+
+async def check_device_async(ip, timeout, telemetry=None, budget=None):
+    """asyncio counterpart of check_device."""
+    ip_address = str(ip)
+    device_data, result, rtt_ms = await probe_device_async(ip_address, timeout, budget)
+    record = device_record(device_data) if device_data else None
+    if telemetry is not None:
+        telemetry[ip_address] = (record and record["mac_address"], result, rtt_ms)
+    return record
+
+async def scan_network_async(network_cidr, timeout, concurrency, deadline=0):
+    """
+    Scan the network with at most `concurrency` probes in flight.
+
+    Hosts are pulled lazily from the network by a fixed set of probe tasks, so memory does
+    not grow with the size of the network. With a `deadline` (seconds), no probe runs
+    past that point and the devices found so far are returned.
+    """
+    network = ip_network(network_cidr)
+    return await scan_hosts_async(network.hosts(), timeout, min(concurrency, network.num_addresses), deadline)
+
+async def scan_hosts_async(hosts, timeout, concurrency, deadline=0, telemetry=None, on_device=None):
+    """Probe an iterable of addresses with the asyncio engine; see scan_network_async."""
+    hosts = iter(hosts)
+    devices = []
+    loop = asyncio.get_running_loop()
+    end = loop.time() + deadline if deadline else None
+
+    async def probe_worker():
+        for ip in hosts:
+            remaining = None
+            if end is not None:
+                remaining = end - loop.time()
+                if remaining <= 0:
+                    return
+            # The whole probe, not each of its steps, ends by the deadline
+            result = await check_device_async(ip, timeout, telemetry, remaining)
+            if result:
+                devices.append(result)
+                if on_device:
+                    on_device(result)
+
+    await asyncio.gather(*(probe_worker() for _ in range(max(1, concurrency))))
+    return devices
+
+def probe_hosts(hosts, args, telemetry=None, on_device=None):
+    """Probe an iterable of addresses with the probe engine selected on the command line."""
+    if args.engine == "asyncio":
+        return asyncio.run(scan_hosts_async(hosts, args.timeout, args.concurrency, args.scan_deadline,
+                                            telemetry, on_device))
+    return scan_hosts(hosts, args.timeout, args.workers, telemetry, on_device)
+
+def probe_report(telemetry, known):
+    """
+    Build the `probes` of a scan report from check_device telemetry: the RTT of every device
+    that answered, and why the probe failed for known devices (`known` maps MAC to IP) that did not.
+    """
+    known_macs = {address: mac_address for mac_address, address in known.items()}
+    probes = []
+    for address, (mac_address, result, rtt_ms) in telemetry.items():
+        if result == "found":
+            probes.append({"mac_address": mac_address, "rtt_ms": round(rtt_ms, 3)})
+        elif address in known_macs:
+            probes.append({"mac_address": known_macs[address], "error": result})
+    return probes
+
+def read_arp_table(path=ARP_TABLE):
+    """Return the IP addresses with a complete entry in the kernel neighbour table."""
+    neighbours = set()
+    try:
+        with open(path) as f:
+            next(f, None)  # Header line
+            for line in f:
+                fields = line.split()
+                if len(fields) >= 4 and int(fields[2], 16) & ARP_FLAG_COMPLETE and fields[3] != "00:00:00:00:00:00":
+                    neighbours.add(fields[0])
+    except (OSError, ValueError) as e:
+        print(f"Failed to read neighbour table {path}: {e}")
+    return neighbours
+
+async def tcp_alive_async(hosts, port, timeout, concurrency, failures=None):
+    """
+    Return the hosts accepting a TCP connection on `port` within `timeout` seconds.
+
+    With a `failures` dict, also store why the others failed ("timeout" or "refused") under their IP.
+    """
+    hosts = iter(hosts)
+    alive = []
+
+    async def connect_worker():
+        for ip in hosts:
+            try:
+                _, writer = await asyncio.wait_for(asyncio.open_connection(str(ip), port), timeout)
+            except (OSError, asyncio.TimeoutError) as e:
+                if failures is not None:
+                    failures[str(ip)] = "timeout" if isinstance(e, asyncio.TimeoutError) else "refused"
+                continue
+            writer.close()
+            alive.append(ip)
+
+    await asyncio.gather(*(connect_worker() for _ in range(max(1, concurrency))))
+    return alive
+
+class PrefilterPipeline:
+    """
+    Cheap stages that drop empty addresses before the HTTP /status probe.
+
+    Statistics of every run are accumulated until report() is called, so the effect of
+    each stage on a whole scan interval can be printed at once.
+    """
+
+    def __init__(self, stages, timeout, concurrency, port=80):
+        self.stages = stages
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.port = port
+        self.stats = {}
+
+    def record(self, stage, seen, dropped, seconds):
+        totals = self.stats.setdefault(stage, [0, 0, 0.0])
+        totals[0] += seen
+        totals[1] += dropped
+        totals[2] += seconds
+
+    def run(self, hosts, watched=(), failures=None):
+        """
+        Return the list of hosts that survive every stage.
+
+        Hosts are read PREFILTER_CHUNK at a time and go through every stage before the next
+        chunk is read, so only the survivors and one chunk are held in memory at once.
+
+        The hosts of `watched` (IP strings) that a stage drops are stored in `failures` as
+        IP -> probe result: "timeout" when missing from the neighbour table, or the reason
+        the TCP connection failed.
+        """
+        failures = {} if failures is None else failures
+        neighbours = None
+        if "arp" in self.stages:
+            start = time.monotonic()
+            neighbours = read_arp_table()
+            self.record("arp", 0, 0, time.monotonic() - start)
+        survivors = []
+        hosts = iter(hosts)
+        while chunk := list(islice(hosts, PREFILTER_CHUNK)):
+            survivors.extend(self.run_chunk(chunk, neighbours, watched, failures))
+        return survivors
+
+    def run_chunk(self, candidates, neighbours, watched, failures):
+        survivors = []
+        if neighbours is not None:
+            start = time.monotonic()
+            rest = []
+            for ip in candidates:
+                (survivors if str(ip) in neighbours else rest).append(ip)
+            # Alone, the neighbour table is the whole filter; with tcp it only lets hosts skip the TCP check
+            dropped = 0 if "tcp" in self.stages else len(rest)
+            self.record("arp", len(candidates), dropped, time.monotonic() - start)
+            if "tcp" not in self.stages:
+                failures.update((str(ip), "timeout") for ip in rest if str(ip) in watched)
+            candidates = rest if "tcp" in self.stages else []
+        if "tcp" in self.stages:
+            start = time.monotonic()
+            reasons = {}
+            alive = asyncio.run(tcp_alive_async(candidates, self.port, self.timeout, self.concurrency, reasons))
+            self.record("tcp", len(candidates), len(candidates) - len(alive), time.monotonic() - start)
+            failures.update((address, result) for address, result in reasons.items() if address in watched)
+            candidates = alive
+        survivors.extend(candidates)
+        return survivors
+
+    def probe(self, hosts, probe, telemetry=None, watched=()):
+        """
+        Run `probe` on the hosts surviving the pipeline and record the HTTP stage too.
+
+        Known devices (`watched`, their IPs) dropped by a stage never reach the probe, so
+        their failure is stored in `telemetry` as check_device would have, to keep failure
+        samples in the latency telemetry during an outage.
+        """
+        if self.stages:
+            failures = {}
+            hosts = self.run(hosts, watched, failures)
+            if telemetry is not None:
+                for address, result in failures.items():
+                    telemetry[address] = (None, result, 0.0)
+        seen = 0
+
+        def counted(hosts):
+            nonlocal seen
+            for ip in hosts:
+                seen += 1
+                yield ip
+
+        start = time.monotonic()
+        devices = probe(counted(hosts))
+        self.record("http", seen, seen - len(devices), time.monotonic() - start)
+        return devices
+
+    def report(self):
+        """Return one line per stage with the hosts it saw and dropped, and reset the counters."""
+        lines = [f"{stage}: {seen} hosts, {dropped} dropped, {seconds:.2f}s"
+                 for stage, (seen, dropped, seconds) in self.stats.items()]
+        self.stats = {}
+        return lines
+
+class ScanScheduler:
+    """
+    Decide which addresses to probe each scan interval.
+
+    Known devices are probed every interval on their last IP, and the discovery sweep of
+    the whole CIDR is split into `discovery_intervals` interleaved slices, one per interval.
+    When a known device no longer answers on its IP (or another MAC does), the rest of the
+    sweep runs immediately to find where it went. A device that stays missing after that
+    is only looked for by the regular slices, so an outage does not cost a full sweep every
+    interval, and is forgotten once a whole cycle of slices missed it too. A device whose
+    IP answers with another MAC is replaced by that one.
+    """
+
+    def __init__(self, network_cidr, discovery_intervals=1, known=None):
+        self.network = ip_network(network_cidr)
+        self.discovery_intervals = max(1, discovery_intervals)
+        self.next_slice = 0
+        self.known = {}  # MAC address -> last IP address
+        self.addresses = {}  # IP address -> MAC address of the known device there
+        self.absent = {}  # Known MAC address -> consecutive intervals it was not found
+        for mac_address, address in (known or {}).items():
+            self.remember(mac_address, address)
+
+    def remember(self, mac_address, address):
+        try:
+            if ip_address(address) not in self.network:
+                return
+        except ValueError:
+            return
+        previous = self.known.get(mac_address)
+        if previous is not None and self.addresses.get(previous) == mac_address:
+            del self.addresses[previous]
+        replaced = self.addresses.get(address)
+        if replaced is not None and replaced != mac_address:
+            self.forget(replaced)
+        self.known[mac_address] = address
+        self.addresses[address] = mac_address
+        self.absent.pop(mac_address, None)
+
+    def forget(self, mac_address):
+        address = self.known.pop(mac_address, None)
+        if self.addresses.get(address) == mac_address:
+            del self.addresses[address]
+        self.absent.pop(mac_address, None)
+
+    def discovery_hosts(self, skip, full):
+        """Yield the addresses of this interval's discovery slice (or the whole CIDR), lazily."""
+        if full or self.discovery_intervals == 1:
+            hosts = self.network.hosts()
+            self.next_slice = 0
+        else:
+            hosts = islice(self.network.hosts(), self.next_slice, None, self.discovery_intervals)
+            self.next_slice = (self.next_slice + 1) % self.discovery_intervals
+        return (ip for ip in hosts if str(ip) not in skip)
+
+    def run_interval(self, probe):
+        """Run one interval's probes with `probe(hosts)` and return the devices found."""
+        known_ips = set(self.known.values())
+        found = {}
+        for device in probe(sorted(known_ips)):
+            found[device["mac_address"]] = device
+
+        missing = [mac_address for mac_address in self.known if mac_address not in found]
+        rediscover = any(mac_address not in self.absent for mac_address in missing)
+        for device in probe(self.discovery_hosts(known_ips, full=rediscover)):
+            found[device["mac_address"]] = device
+
+        absent = {mac_address: self.absent.get(mac_address, 0) + 1
+                  for mac_address in missing if mac_address not in found}
+        for mac_address, device in found.items():
+            self.remember(mac_address, device["ip_address"])
+        for mac_address, intervals in absent.items():
+            # Missed by the re-discovery sweep, then by every slice of a whole cycle
+            if intervals > self.discovery_intervals:
+                self.forget(mac_address)
+            elif mac_address in self.known:
+                self.absent[mac_address] = intervals
+        return list(found.values())
+
+    def save(self, state_file):
+        """Write the known devices to `state_file` atomically."""
+        tmp_file = f"{state_file}.tmp"
+        with open(tmp_file, "w") as f:
+            json.dump({"devices": self.known}, f)
+        os.replace(tmp_file, state_file)
+
+def load_known_devices(state_file=None, statuses_endpoint=None, timeout=5):
+    """Load known devices as {mac: ip} from the state file and/or the device statuses API."""
+    known = {}
+    if state_file and os.path.exists(state_file):
+        try:
+            with open(state_file) as f:
+                known.update(json.load(f).get("devices", {}))
+        except (OSError, ValueError) as e:
+            print(f"Failed to read state file {state_file}: {e}")
+    if statuses_endpoint:
+        try:
+            response = requests.get(statuses_endpoint, timeout=timeout)
+            response.raise_for_status()
+            known.update({device["mac_address"]: device["ip_address"]
+                          for device in response.json() if device.get("is_up")})
+        except (requests.RequestException, ValueError, KeyError, TypeError) as e:
+            print(f"Failed to load known devices from {statuses_endpoint}: {e}")
+    return known
+
+def send_scan_report(devices, api_endpoint, scope=None, probes=None):
     """Send scan report to the backend API."""
     data = {"devices": devices}
+    if scope:
+        data["scope"] = scope
+    if probes:
+        data["probes"] = probes
+    start = time.monotonic()
     try:
-        response = requests.post(api_endpoint, json=data)
+        response = requests.post(api_endpoint, json=data, timeout=30)
+        metrics.report("full", time.monotonic() - start, str(response.status_code))
         response.raise_for_status()
         print("Scan report sent successfully.")
     except requests.RequestException as e:
+        if not isinstance(e, requests.HTTPError):
+            metrics.report("full", time.monotonic() - start, "error")
         print(f"Failed to send scan report: {e}")
 
+def state_digest(state):
+    """SHA-256 over the sorted "mac|ip|location|version" lines of a device state, as computed by api.delta."""
+    lines = sorted(f"{mac}|{device['ip_address']}|{device.get('location', '')}|{device.get('version', '')}"
+                   for mac, device in state.items())
+    return hashlib.sha256("\n".join(lines).encode()).hexdigest()
+
+def device_fields(device):
+    return device["ip_address"], device.get("location", ""), device.get("version", "")
+
+class DeltaReporter:
+    """
+    Client side of the delta scan protocol.
+
+    Keeps the state last acknowledged by the server and sends only the devices added,
+    changed or removed since then, with a sequence number and a digest of the new state.
+    Starts with (and falls back to, when the server answers 409) a full report.
+    """
+
+    def __init__(self, endpoint, scope=None):
+        self.endpoint = endpoint
+        self.scope = scope
+        self.acked = None  # MAC address -> device record acknowledged by the server
+        self.seq = 0
+        self.session = requests.Session()
+
+    def post(self, payload):
+        if self.scope:
+            payload["scope"] = self.scope
+        kind = "full" if payload.get("full") else "delta"
+        start = time.monotonic()
+        try:
+            response = self.session.post(self.endpoint, json=payload, timeout=30)
+        except requests.RequestException:
+            metrics.report(kind, time.monotonic() - start, "error")
+            raise
+        metrics.report(kind, time.monotonic() - start, str(response.status_code))
+        return response
+
+    def send_full(self, state, probes=None):
+        seq = self.seq + 1
+        response = self.post({"full": True, "seq": seq, "digest": state_digest(state), "devices": list(state.values()),
+                              "probes": probes or []})
+        response.raise_for_status()
+        self.seq, self.acked = seq, state
+        print(f"Full scan report {seq} sent successfully.")
+
+    def report(self, devices, probes=None):
+        """Report one scan and its probe telemetry, as a delta when possible."""
+        state = {device["mac_address"]: device for device in devices}
+        try:
+            if self.acked is None:
+                return self.send_full(state, probes)
+            seq = self.seq + 1
+            response = self.post({
+                "seq": seq,
+                "digest": state_digest(state),
+                "added": [device for mac, device in state.items() if mac not in self.acked],
+                "changed": [device for mac, device in state.items()
+                            if mac in self.acked and device_fields(device) != device_fields(self.acked[mac])],
+                "removed": [mac for mac in self.acked if mac not in state],
+                "probes": probes or [],
+            })
+            if response.status_code == 409:
+                print(f"Server asked for a resync: {response.json().get('reason')}")
+                return self.send_full(state, probes)
+            response.raise_for_status()
+            self.seq, self.acked = seq, state
+            print(f"Delta scan report {seq} sent successfully.")
+        except (requests.RequestException, ValueError) as e:
+            # The next report is computed against the last acknowledged state again
+            print(f"Failed to send scan report: {e}")
+
+class StreamReporter:
+    """
+    Client of the scan stream endpoints: devices are uploaded while the sweep runs.
+
+    found() queues a device; a sender thread uploads whatever queued up within
+    `flush_interval` seconds as one NDJSON chunk, over one keep-alive connection.
+    finish() uploads the probes and the "complete" marker, which makes the server mark
+    the devices the scan did not see as down. If opening the stream or any upload fails,
+    the stream is abandoned (nothing gets marked down by it) and finish() sends a
+    regular full report instead, through `spool` if given.
+    """
+
+    def __init__(self, endpoint, api_endpoint, scope=None, flush_interval=0.5, batch_size=500, spool=None):
+        self.endpoint = endpoint
+        self.api_endpoint = api_endpoint
+        self.spool = spool
+        self.scope = scope
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.session = requests.Session()
+        self.queue = queue.Queue()
+        self.sender = None
+        self.stream_url = None
+        self.failed = False
+
+    def start(self):
+        """Open a stream for the next scan and start the sender thread."""
+        self.failed = False
+        try:
+            response = self.session.post(self.endpoint, json={"scope": self.scope} if self.scope else {}, timeout=30)
+            response.raise_for_status()
+            self.stream_url = f"{self.endpoint.rstrip('/')}/{response.json()['stream_id']}/"
+        except (requests.RequestException, ValueError, KeyError) as e:
+            print(f"Failed to open a scan stream: {e}")
+            self.failed = True
+        self.sender = threading.Thread(target=self.send_loop, name="scan-stream", daemon=True)
+        self.sender.start()
+
+    def found(self, device):
+        self.queue.put(device)
+
+    def upload(self, lines):
+        if self.failed:
+            return
+        body = "".join(json.dumps(line) + "\n" for line in lines)
+        start = time.monotonic()
+        try:
+            response = self.session.post(self.stream_url, data=body.encode(),
+                                         headers={"Content-Type": "application/x-ndjson"}, timeout=30)
+            metrics.report("stream", time.monotonic() - start, str(response.status_code))
+            response.raise_for_status()
+        except requests.RequestException as e:
+            if not isinstance(e, requests.HTTPError):
+                metrics.report("stream", time.monotonic() - start, "error")
+            print(f"Failed to upload to the scan stream, falling back to a full report: {e}")
+            self.failed = True
+
+    def send_loop(self):
+        finished = False
+        while not finished:
+            lines = [self.queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while lines[-1] is not None and len(lines) < self.batch_size:
+                try:
+                    lines.append(self.queue.get(timeout=max(0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            if lines[-1] is None:
+                lines.pop()
+                finished = True
+            if lines:
+                self.upload(lines)
+
+    def finish(self, devices, probes=None):
+        """Flush the queued devices and complete the stream, or send `devices` as a full report."""
+        self.queue.put(None)
+        self.sender.join()
+        self.upload([{"type": "probe", **probe} for probe in probes or []] + [{"type": "complete"}])
+        if self.failed and self.spool:
+            self.spool.add(devices, self.scope, probes)
+        elif self.failed:
+            send_scan_report(devices, self.api_endpoint, self.scope, probes)
+        else:
+            print(f"Scan stream completed with {len(devices)} devices.")
+
+class ReportSpool:
+    """
+    On-disk queue of full scan reports, delivered in order by a background sender.
+
+    add() writes a report to its own file, with an idempotency key and the time of its
+    scan, and returns at once. The sender posts up to `batch_size` of the oldest reports
+    to the batch endpoint over one keep-alive session and deletes them once the server
+    answered for them; while the API is down it retries with exponential backoff. A
+    report the server already applied is answered as a duplicate, so a batch whose
+    answer was lost is simply sent again. Spooled reports survive a restart; those older
+    than `max_age` seconds are dropped unsent.
+    """
+
+    def __init__(self, directory, endpoint, batch_size=20, max_age=86400, timeout=30):
+        self.directory = directory
+        self.endpoint = endpoint
+        self.batch_size = batch_size
+        self.max_age = max_age
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.wakeup = threading.Event()
+        self.sender = None
+        os.makedirs(directory, exist_ok=True)
+        for name in os.listdir(directory):
+            if name.endswith(".tmp"):
+                os.remove(os.path.join(directory, name))  # Left by a crash while writing
+
+    def pending(self):
+        """File names of the spooled reports, oldest first."""
+        return sorted(name for name in os.listdir(self.directory) if name.endswith(".json"))
+
+    def add(self, devices, scope=None, probes=None):
+        key = uuid.uuid4().hex
+        report = {"key": key, "scanned_at": datetime.now(timezone.utc).isoformat(), "devices": devices}
+        if scope:
+            report["scope"] = scope
+        if probes:
+            report["probes"] = probes
+        # Names start with the spool time, so they sort in scan order
+        name = f"{time.time_ns():020d}-{key}.json"
+        tmp_file = os.path.join(self.directory, f"{name}.tmp")
+        with open(tmp_file, "w") as f:
+            json.dump(report, f)
+        os.replace(tmp_file, os.path.join(self.directory, name))
+        metrics.spool(len(self.pending()))
+        self.wakeup.set()
+
+    def start(self):
+        """Start the sender thread, which first delivers the reports left from a previous run."""
+        self.wakeup.set()
+        self.sender = threading.Thread(target=self.send_loop, name="report-spool", daemon=True)
+        self.sender.start()
+
+    def send_loop(self):
+        backoff = 0
+        while True:
+            if backoff:
+                time.sleep(backoff)
+            else:
+                self.wakeup.wait()
+            self.wakeup.clear()
+            try:
+                while self.send_batch():
+                    pass
+                backoff = 0
+            except (requests.RequestException, ValueError, KeyError, TypeError) as e:
+                backoff = min(max(backoff * 2, 1), SPOOL_MAX_BACKOFF)
+                print(f"Failed to send spooled scan reports, retrying in {backoff}s: {e}")
+
+    def send_batch(self):
+        """Send the oldest spooled reports in one request; returns False once the spool is empty."""
+        names = {}
+        reports = []
+        for name in self.pending():
+            if len(reports) == self.batch_size:
+                break
+            path = os.path.join(self.directory, name)
+            try:
+                if time.time() - int(name.split("-")[0]) / 1e9 > self.max_age:
+                    raise ValueError("not delivered in time")
+                with open(path) as f:
+                    report = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Dropping spooled scan report {name}: {e}")
+                os.remove(path)
+                continue
+            names[report["key"]] = path
+            reports.append(report)
+        metrics.spool(len(self.pending()))
+        if not reports:
+            return False
+
+        start = time.monotonic()
+        try:
+            response = self.session.post(self.endpoint, json={"reports": reports}, timeout=self.timeout)
+        except requests.RequestException:
+            metrics.report("batch", time.monotonic() - start, "error")
+            raise
+        metrics.report("batch", time.monotonic() - start, str(response.status_code))
+        response.raise_for_status()
+        results = response.json()["results"]
+        for result in results:
+            if result["status"] == "rejected":
+                print(f"Server rejected scan report {result['key']}: {result.get('error')}")
+            os.remove(names.pop(result["key"]))
+        metrics.spool(len(self.pending()))
+        print(f"Sent {len(results)} spooled scan reports.")
+        return True
+
 def main():
     """Main loop to continuously scan the network."""
     args = parse_arguments()
@@ -80,14 +944,63 @@ def main():
           f"Scan Interval: {args.scan_interval} seconds\n"
           f"Network CIDR: {args.network_cidr}\n"
           f"Timeout: {args.timeout} seconds\n"
-          f"Workers: {args.workers}")
+          f"Engine: {args.engine}\n"
+          f"Workers: {args.workers}\n"
+          f"Concurrency: {args.concurrency}\n"
+          f"Scan Deadline: {args.scan_deadline or 'none'}\n"
+          f"Discovery Intervals: {args.discovery_intervals}\n"
+          f"Pre-filters: {', '.join(args.prefilter) or 'none'}\n"
+          f"Agent ID: {args.agent_id or 'none (unscoped reports)'}\n"
+          f"Delta Reports: {'on' if args.delta else 'off'}\n"
+          f"Streamed Reports: {'on' if args.stream else 'off'}\n"
+          f"Report Spool: {args.spool_dir or 'off'}\n"
+          f"Metrics Port: {args.metrics_port or 'off'}")
 
+    scheduler = ScanScheduler(args.network_cidr, args.discovery_intervals,
+                              load_known_devices(args.state_file, args.statuses_endpoint))
+    scope = {"agent_id": args.agent_id, "cidrs": [args.network_cidr]} if args.agent_id else None
+    spool = None
+    if args.spool_dir:
+        spool = ReportSpool(args.spool_dir, args.batch_endpoint or f"{args.api_endpoint.rstrip('/')}/batch/",
+                            args.batch_size, args.spool_max_age)
+        spool.start()
+    reporter = None
+    if args.delta:
+        reporter = DeltaReporter(args.delta_endpoint or f"{args.api_endpoint.rstrip('/')}/delta/", scope)
+    streamer = None
+    if args.stream:
+        streamer = StreamReporter(args.stream_endpoint or f"{args.api_endpoint.rstrip('/')}/streams/",
+                                  args.api_endpoint, scope, args.stream_flush_interval, spool=spool)
+    pipeline = PrefilterPipeline(args.prefilter, args.prefilter_timeout, args.concurrency)
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port)
     while True:
         print("Starting network scan...")
-        devices = scan_network(args.network_cidr, args.timeout, args.workers)
+        start = time.monotonic()
+        probe_count = metrics.probe_count()
+        telemetry = {}
+        if streamer:
+            streamer.start()
+        on_device = streamer.found if streamer else None
+        devices = scheduler.run_interval(
+            lambda hosts: pipeline.probe(hosts, lambda alive: probe_hosts(alive, args, telemetry, on_device),
+                                         telemetry, set(scheduler.known.values())))
+        metrics.sweep(time.monotonic() - start, metrics.probe_count() - probe_count, len(devices))
+        probes = probe_report(telemetry, scheduler.known)
+        if args.state_file:
+            scheduler.save(args.state_file)
+        for line in pipeline.report():
+            print(line)
         print(f"Found {len(devices)} devices.")
         print(f"Devices: {[device['ip_address'] for device in devices]}")
-        send_scan_report(devices, args.api_endpoint)
+        if reporter:
+            reporter.report(devices, probes)
+        elif streamer:
+            streamer.finish(devices, probes)
+        elif spool:
+            spool.add(devices, scope, probes)
+        else:
+            send_scan_report(devices, args.api_endpoint, scope, probes)
         time.sleep(args.scan_interval)
 
 if __name__ == "__main__":
@@ -0,0 +1,378 @@
+import asyncio
+import io
+import json
+import os
+import socket
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import network_scanner  # Imported from this directory: python -m unittest discover -s scripts
+from network_scanner import (PrefilterPipeline, ReportSpool, ScanScheduler, probe_device_async, probe_report,
+                             scan_hosts_async)
+
+STATUS = {"ssid": "cam", "ip": "127.0.0.1", "mac": "aa:00:00:00:00:01"}
+
+
+def fake_tcp_stage(alive, reason="refused"):
+    """Stand-in for tcp_alive_async letting only the IPs in `alive` through."""
+    async def tcp_alive_async(hosts, port, timeout, concurrency, failures=None):
+        hosts = list(hosts)
+        for ip in hosts:
+            if str(ip) not in alive and failures is not None:
+                failures[str(ip)] = reason
+        return [ip for ip in hosts if str(ip) in alive]
+    return tcp_alive_async
+
+
+class PrefilterTelemetryTests(unittest.TestCase):
+    def test_known_devices_dropped_by_the_prefilter_get_failure_samples(self):
+        known = {"aa:00:00:00:00:01": "10.0.0.1", "aa:00:00:00:00:02": "10.0.0.2"}
+        telemetry = {}
+
+        def probe(hosts):
+            hosts = list(hosts)
+            for ip in hosts:
+                telemetry[str(ip)] = ("aa:00:00:00:00:01", "found", 4.0)
+            return [{"mac_address": "aa:00:00:00:00:01", "ip_address": str(ip)} for ip in hosts]
+
+        pipeline = PrefilterPipeline(["arp"], 0.1, 10)
+        with mock.patch.object(network_scanner, "read_arp_table", return_value={"10.0.0.1"}):
+            pipeline.probe(["10.0.0.1", "10.0.0.2", "10.0.0.3"], probe, telemetry, set(known.values()))
+        # Unknown hosts the prefilter dropped are not telemetry
+        self.assertEqual(sorted(telemetry), ["10.0.0.1", "10.0.0.2"])
+        self.assertEqual(sorted(probe_report(telemetry, known), key=lambda probe: probe["mac_address"]), [
+            {"mac_address": "aa:00:00:00:00:01", "rtt_ms": 4.0},
+            {"mac_address": "aa:00:00:00:00:02", "error": "timeout"},
+        ])
+
+    def test_tcp_stage_failures_keep_their_reason(self):
+        telemetry = {}
+        pipeline = PrefilterPipeline(["tcp"], 0.1, 10)
+        with mock.patch.object(network_scanner, "tcp_alive_async", fake_tcp_stage(set())):
+            pipeline.probe(["10.0.0.2"], lambda hosts: list(hosts), telemetry, {"10.0.0.2"})
+        self.assertEqual(telemetry, {"10.0.0.2": (None, "refused", 0.0)})
+
+
+class PrefilterPipelineTests(unittest.TestCase):
+    hosts = [f"10.0.0.{i}" for i in range(1, 7)]
+
+    def run_pipeline(self, stages, neighbours=(), alive=(), hosts=None):
+        """Run the pipeline with stubbed arp/tcp stages; returns (survivors, failures, hosts the tcp stage saw)."""
+        tcp_hosts = []
+        tcp_stage = fake_tcp_stage(set(alive))
+
+        async def tcp_alive_async(hosts, *args):
+            tcp_hosts.extend(hosts)
+            return await tcp_stage(hosts, *args)
+
+        failures = {}
+        pipeline = PrefilterPipeline(stages, 0.1, 10)
+        with mock.patch.object(network_scanner, "read_arp_table", return_value=set(neighbours)), \
+                mock.patch.object(network_scanner, "tcp_alive_async", tcp_alive_async):
+            survivors = pipeline.run(iter(hosts or self.hosts), set(self.hosts), failures)
+        return survivors, failures, tcp_hosts
+
+    def test_arp_alone_drops_hosts_missing_from_the_neighbour_table(self):
+        survivors, failures, tcp_hosts = self.run_pipeline(["arp"], neighbours={"10.0.0.2", "10.0.0.5"})
+        self.assertEqual(survivors, ["10.0.0.2", "10.0.0.5"])
+        self.assertEqual(set(failures), {"10.0.0.1", "10.0.0.3", "10.0.0.4", "10.0.0.6"})
+        self.assertEqual(tcp_hosts, [])
+
+    def test_tcp_alone_keeps_hosts_accepting_a_connection(self):
+        survivors, failures, _ = self.run_pipeline(["tcp"], alive={"10.0.0.3"})
+        self.assertEqual(survivors, ["10.0.0.3"])
+        self.assertEqual(failures, {ip: "refused" for ip in self.hosts if ip != "10.0.0.3"})
+
+    def test_neighbours_skip_the_tcp_check_and_the_others_fall_through_to_it(self):
+        survivors, failures, tcp_hosts = self.run_pipeline(["arp", "tcp"], neighbours={"10.0.0.1"},
+                                                           alive={"10.0.0.4"})
+        self.assertEqual(tcp_hosts, ["10.0.0.2", "10.0.0.3", "10.0.0.4", "10.0.0.5", "10.0.0.6"])
+        self.assertEqual(sorted(survivors), ["10.0.0.1", "10.0.0.4"])
+        self.assertEqual(set(failures), {"10.0.0.2", "10.0.0.3", "10.0.0.5", "10.0.0.6"})
+
+    def test_hosts_are_filtered_in_bounded_chunks(self):
+        read = []
+
+        def hosts():
+            for ip in self.hosts:
+                read.append(ip)
+                yield ip
+
+        seen = []
+        tcp_stage = fake_tcp_stage({"10.0.0.6"})
+
+        async def tcp_alive_async(hosts, *args):
+            seen.append((list(hosts), len(read)))
+            return await tcp_stage(hosts, *args)
+
+        pipeline = PrefilterPipeline(["tcp"], 0.1, 10)
+        with mock.patch.object(network_scanner, "PREFILTER_CHUNK", 4), \
+                mock.patch.object(network_scanner, "tcp_alive_async", tcp_alive_async):
+            self.assertEqual(pipeline.run(hosts()), ["10.0.0.6"])
+        # The second chunk is only read once the first went through the tcp stage
+        self.assertEqual(seen, [(self.hosts[:4], 4), (self.hosts[4:], 6)])
+        self.assertTrue(pipeline.report()[0].startswith("tcp: 6 hosts, 5 dropped, "))
+
+
+async def serve_status(response):
+    """Start a local server answering every connection with the raw `response` bytes (None to never answer)."""
+    async def handle(reader, writer):
+        await reader.readuntil(b"\r\n\r\n")
+        if response is None:
+            try:
+                await reader.read()  # Until the prober gives up
+            except asyncio.CancelledError:
+                pass  # Still waiting when the test's event loop closes
+        else:
+            writer.write(response)
+            await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    return server, server.sockets[0].getsockname()[1]
+
+
+def run_probe(response, **kwargs):
+    """Probe a local server answering `response` with the asyncio engine; returns (data, result)."""
+    async def probe():
+        server, port = await serve_status(response)
+        async with server:
+            with mock.patch.object(network_scanner, "STATUS_PORT", port):
+                data, result, _ = await probe_device_async("127.0.0.1", kwargs.pop("timeout", 2), **kwargs)
+        return data, result
+    return asyncio.run(probe())
+
+
+class AsyncioEngineTests(unittest.TestCase):
+    body = json.dumps(STATUS).encode()
+
+    def test_content_length_body(self):
+        response = b"HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n%s" % (len(self.body), self.body)
+        self.assertEqual(run_probe(response), (STATUS, "found"))
+
+    def test_chunked_body(self):
+        chunks = b"".join(b"%x\r\n%s\r\n" % (len(part), part) for part in (self.body[:10], self.body[10:]))
+        response = b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n" + chunks + b"0\r\n\r\n"
+        self.assertEqual(run_probe(response), (STATUS, "found"))
+
+    def test_close_delimited_body(self):
+        self.assertEqual(run_probe(b"HTTP/1.1 200 OK\r\nConnection: close\r\n\r\n" + self.body), (STATUS, "found"))
+
+    def test_other_devices_and_errors(self):
+        self.assertEqual(run_probe(b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\n\r\n"), (None, "not_device"))
+        self.assertEqual(run_probe(b"HTTP/1.1 200 OK\r\nContent-Length: 100\r\n\r\n{}"), (None, "error"))
+
+    def test_refused_connection(self):
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        with mock.patch.object(network_scanner, "STATUS_PORT", port):
+            self.assertEqual(asyncio.run(probe_device_async("127.0.0.1", 1))[1], "refused")
+
+    def test_silent_device_times_out(self):
+        self.assertEqual(run_probe(None, timeout=0.2), (None, "timeout"))
+
+    def test_no_probe_runs_past_the_deadline(self):
+        telemetry = {}
+        open_connection = asyncio.open_connection
+
+        async def slow_open_connection(*args):
+            await asyncio.sleep(0.3)
+            return await open_connection(*args)
+
+        async def sweep():
+            server, port = await serve_status(None)
+            async with server:
+                with mock.patch.object(network_scanner, "STATUS_PORT", port), \
+                        mock.patch("asyncio.open_connection", slow_open_connection):
+                    start = time.monotonic()
+                    devices = await scan_hosts_async(["127.0.0.1"] * 4, 5, 2, deadline=0.4, telemetry=telemetry)
+                    return devices, time.monotonic() - start
+
+        devices, elapsed = asyncio.run(sweep())
+        self.assertEqual(devices, [])
+        # Connecting and reading each within the time left would end at 0.7s
+        self.assertLess(elapsed, 0.6)
+        self.assertEqual(telemetry["127.0.0.1"][1], "timeout")
+
+
+class FakeNetwork:
+    """Probe stand-in answering for the devices in `devices` (IP -> MAC), recording the hosts of every call."""
+
+    def __init__(self, devices):
+        self.devices = devices
+        self.calls = []
+
+    def probe(self, hosts):
+        hosts = [str(ip) for ip in hosts]
+        self.calls.append(hosts)
+        return [{"mac_address": self.devices[ip], "ip_address": ip} for ip in hosts if ip in self.devices]
+
+    def interval(self, scheduler):
+        """Run one interval; returns (known-device probe hosts, discovery probe hosts, MACs found)."""
+        self.calls = []
+        found = scheduler.run_interval(self.probe)
+        return self.calls[0], self.calls[1], sorted(device["mac_address"] for device in found)
+
+
+class ScanSchedulerTests(unittest.TestCase):
+    cidr = "10.0.0.0/28"  # Hosts 10.0.0.1 to 10.0.0.14
+
+    def test_known_devices_every_interval_and_discovery_in_slices(self):
+        network = FakeNetwork({"10.0.0.1": "a", "10.0.0.5": "b"})
+        scheduler = ScanScheduler(self.cidr, 3, {"a": "10.0.0.1"})
+        swept = []
+        for _ in range(3):
+            known, discovery, found = network.interval(scheduler)
+            swept += discovery
+            self.assertIn("10.0.0.1", known)
+            self.assertLessEqual(len(discovery), 5)
+        # The three slices cover the CIDR once, without the known addresses
+        self.assertEqual(len(swept), len(set(swept)))
+        self.assertEqual(set(swept) | {"10.0.0.1"}, {f"10.0.0.{i}" for i in range(1, 15)})
+        self.assertEqual(scheduler.known, {"a": "10.0.0.1", "b": "10.0.0.5"})
+        known, _, found = network.interval(scheduler)
+        self.assertEqual((known, found), (["10.0.0.1", "10.0.0.5"], ["a", "b"]))
+
+    def test_moved_device_is_rediscovered_at_once(self):
+        network = FakeNetwork({"10.0.0.9": "a"})
+        scheduler = ScanScheduler(self.cidr, 3, {"a": "10.0.0.1"})
+        _, discovery, found = network.interval(scheduler)
+        self.assertEqual(len(discovery), 13)  # Every host but the known one
+        self.assertEqual((found, scheduler.known), (["a"], {"a": "10.0.0.9"}))
+        known, discovery, _ = network.interval(scheduler)
+        self.assertEqual(known, ["10.0.0.9"])
+        self.assertLessEqual(len(discovery), 5)
+
+    def test_missing_device_is_forgotten_after_a_whole_cycle(self):
+        network = FakeNetwork({})
+        scheduler = ScanScheduler(self.cidr, 3, {"a": "10.0.0.1"})
+        sweeps = []
+        for _ in range(4):
+            self.assertEqual(scheduler.known, {"a": "10.0.0.1"})
+            sweeps.append(len(network.interval(scheduler)[1]))
+        # One full re-discovery sweep, then slices only
+        self.assertEqual(sweeps[0], 13)
+        self.assertTrue(all(sweep <= 5 for sweep in sweeps[1:]))
+        self.assertEqual(scheduler.known, {})
+        self.assertEqual(network.interval(scheduler)[0], [])
+
+    def test_device_answering_on_a_known_ip_replaces_the_old_one(self):
+        network = FakeNetwork({"10.0.0.1": "c"})
+        scheduler = ScanScheduler(self.cidr, 3, {"a": "10.0.0.1", "b": "10.0.0.2"})
+        network.interval(scheduler)
+        self.assertEqual(scheduler.known, {"b": "10.0.0.2", "c": "10.0.0.1"})
+        telemetry = {"10.0.0.1": ("c", "found", 1.0), "10.0.0.2": (None, "timeout", 1000.0)}
+        self.assertEqual(probe_report(telemetry, scheduler.known),
+                         [{"mac_address": "c", "rtt_ms": 1.0}, {"mac_address": "b", "error": "timeout"}])
+
+    def test_seeded_devices_sharing_an_ip_keep_the_last_one(self):
+        scheduler = ScanScheduler(self.cidr, 1, {"a": "10.0.0.1", "b": "10.0.0.1", "c": "192.168.0.1"})
+        self.assertEqual(scheduler.known, {"b": "10.0.0.1"})
+
+
+class FakeBatchEndpoint:
+    """Session stand-in for the batch endpoint, answering each POST with the next of `answers`."""
+
+    def __init__(self, *answers):
+        self.answers = list(answers)
+        self.batches = []
+
+    def post(self, url, json, timeout):
+        self.batches.append(json["reports"])
+        answer = self.answers.pop(0) if self.answers else "applied"
+        if isinstance(answer, Exception):
+            raise answer
+        response = mock.Mock(status_code=200)
+        statuses = answer if isinstance(answer, list) else [answer] * len(json["reports"])
+        response.json.return_value = {"results": [{"key": report["key"], "status": status}
+                                                  for report, status in zip(json["reports"], statuses)]}
+        return response
+
+
+class ReportSpoolTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        stdout = mock.patch("sys.stdout", new_callable=io.StringIO)
+        self.output = stdout.start()
+        self.addCleanup(stdout.stop)
+
+    def spool(self, *answers, **kwargs):
+        spool = ReportSpool(self.directory.name, "http://api/batch/", **kwargs)
+        spool.session = FakeBatchEndpoint(*answers)
+        return spool
+
+    def test_oldest_reports_are_sent_first_in_batches(self):
+        spool = self.spool(batch_size=2)
+        for i in range(5):
+            spool.add([{"mac_address": f"aa:00:00:00:00:0{i}"}])
+        while spool.send_batch():
+            pass
+        batches = [[report["devices"][0]["mac_address"][-1] for report in batch] for batch in spool.session.batches]
+        self.assertEqual(batches, [["0", "1"], ["2", "3"], ["4"]])
+        self.assertEqual(spool.pending(), [])
+
+    def test_applied_duplicate_and_rejected_reports_are_removed_and_the_others_resent(self):
+        spool = self.spool(["applied", "duplicate", "rejected"])
+        for i in range(4):
+            spool.add([], probes=[{"mac_address": str(i), "rtt_ms": 1.0}])
+        first = spool.pending()
+        self.assertTrue(spool.send_batch())
+        # The server answered for the first three only
+        self.assertEqual(spool.pending(), first[3:])
+        self.assertIn(f"Server rejected scan report {spool.session.batches[0][2]['key']}", self.output.getvalue())
+        self.assertTrue(spool.send_batch())
+        self.assertEqual(spool.session.batches[1], spool.session.batches[0][3:])
+        self.assertFalse(spool.send_batch())
+
+    def test_failed_batches_are_kept_and_retried_with_backoff(self):
+        error = network_scanner.requests.ConnectionError("API down")
+        spool = self.spool(*[error] * 7)
+        spool.add([])
+        sleeps = []
+        with mock.patch.object(network_scanner.time, "sleep", sleeps.append), \
+                mock.patch.object(spool.wakeup, "wait", side_effect=[True, StopIteration]):
+            spool.wakeup.set()
+            with self.assertRaises(StopIteration):
+                spool.send_loop()
+        self.assertEqual(sleeps, [1, 2, 4, 8, 16, 32, 60])
+        self.assertEqual(len(spool.session.batches), 8)
+        # Delivered on the last attempt, after which the sender waits for new reports again
+        self.assertEqual(spool.pending(), [])
+        self.assertEqual(spool.session.batches[0], spool.session.batches[-1])
+
+    def test_reports_older_than_max_age_are_dropped_unsent(self):
+        spool = self.spool(max_age=60)
+        spool.add([{"mac_address": "old"}])
+        spool.add([{"mac_address": "new"}])
+        old = spool.pending()[0]
+        stamp = int(old.split("-")[0]) - 120 * 10**9
+        os.rename(os.path.join(self.directory.name, old),
+                  os.path.join(self.directory.name, f"{stamp:020d}-{old.split('-', 1)[1]}"))
+        self.assertTrue(spool.send_batch())
+        self.assertEqual([report["devices"] for report in spool.session.batches[0]], [[{"mac_address": "new"}]])
+        self.assertEqual(spool.pending(), [])
+
+    def test_spooled_reports_survive_a_restart(self):
+        before = self.spool(network_scanner.requests.ConnectionError("API down"))
+        before.add([{"mac_address": "first"}], scope={"agent_id": "a", "cidrs": ["10.0.0.0/24"]})
+        before.add([{"mac_address": "second"}])
+        with self.assertRaises(network_scanner.requests.ConnectionError):
+            before.send_batch()
+        # A crash while writing leaves a partial file behind
+        with open(os.path.join(self.directory.name, f"{before.pending()[-1]}.tmp"), "w") as f:
+            f.write('{"key": ')
+
+        after = self.spool()
+        self.assertEqual(sorted(os.listdir(self.directory.name)), before.pending())
+        self.assertTrue(after.send_batch())
+        self.assertEqual(after.session.batches, before.session.batches)
+        self.assertEqual(after.session.batches[0][0]["scope"], {"agent_id": "a", "cidrs": ["10.0.0.0/24"]})
+        self.assertEqual(after.pending(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()